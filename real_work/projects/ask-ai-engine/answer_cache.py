@@ -0,0 +1,214 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from query_cache import QueryEmbeddingCache
+
+class SemanticAnswerCache:
+    """Cache of generated answers, looked up by question similarity and retrieved sources.
+
+    A question hits when a cached question's embedding is within the similarity threshold
+    and retrieval for it returned the same top chunks. Chunk ids hash the chunk text, so an
+    edited source changes the fingerprint and the old answer is no longer served.
+    """
+
+    def __init__(self, threshold: float = 0.95, fingerprint_k: int = 3, max_size: int = 1000,
+                 ttl_seconds: Optional[float] = 24 * 3600, persist_path: Optional[str] = None):
+        """Initialize the cache.
+
+        Args:
+            threshold: Minimum cosine similarity between a question and a cached one
+            fingerprint_k: Number of top retrieved chunk ids that must match
+            max_size: Maximum number of answers kept; least recently used are evicted first
+            ttl_seconds: Age after which an answer is regenerated, or None to never expire
+            persist_path: Optional file the cache is loaded from now and written to by save()
+        """
+        self.threshold = threshold
+        self.fingerprint_k = fingerprint_k
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        # normalized question -> {'question', 'embedding', 'answer', 'fingerprint', 'sources', 'created_at'}
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._keys = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        if persist_path and os.path.exists(persist_path):
+            self.load(persist_path)
+
+    def fingerprint(self, results: List[Dict]) -> str:
+        """Hash of the ids of the top fingerprint_k search results, order-insensitive."""
+        ids = sorted(result['id'] for result in results[:self.fingerprint_k])
+        return hashlib.sha1("\0".join(ids).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _unit(embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype='float32').ravel()
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def _similarity_matrix(self):
+        """Stacked entry embeddings, rebuilt after the entries change."""
+        if self._matrix is None:
+            self._keys = list(self._entries)
+            self._matrix = (np.vstack([self._entries[key]['embedding'] for key in self._keys])
+                            if self._keys else None)
+        return self._matrix
+
+    def get(self, embedding: np.ndarray, results: List[Dict]) -> Optional[str]:
+        """Cached answer for a question, or None.
+
+        Args:
+            embedding: The question's embedding
+            results: What retrieval returned for the question, best first
+
+        Returns:
+            The answer of the most similar cached question above the threshold whose
+            sources match, or None
+        """
+        fingerprint = self.fingerprint(results)
+        query = self._unit(embedding)
+        with self._lock:
+            matrix = self._similarity_matrix()
+            if matrix is not None:
+                similarities = matrix @ query
+                near = False
+                for i in np.argsort(-similarities):
+                    if similarities[i] < self.threshold:
+                        break
+                    entry = self._entries[self._keys[i]]
+                    if self._expired(entry['created_at']):
+                        continue
+                    near = True
+                    if entry['fingerprint'] == fingerprint:
+                        self._entries.move_to_end(self._keys[i])
+                        self.hits += 1
+                        return entry['answer']
+                # A similar question was answered from other chunks; the sources moved on
+                if near:
+                    self.stale += 1
+            self.misses += 1
+            return None
+
+    def put(self, question: str, embedding: np.ndarray, results: List[Dict], answer: str,
+            sources: Optional[Iterable[str]] = None) -> None:
+        """Store an answer, evicting the least recently used ones beyond max_size.
+
+        Args:
+            question: The user's question
+            embedding: The question's embedding
+            results: What retrieval returned for the question, best first
+            answer: The generated answer
+            sources: Ids of every chunk the answer was generated from, for invalidate();
+                defaults to the ids in results
+        """
+        entry = {
+            'question': question,
+            'embedding': self._unit(embedding),
+            'answer': answer,
+            'fingerprint': self.fingerprint(results),
+            'sources': frozenset(sources if sources is not None else (r['id'] for r in results)),
+            'created_at': time.time(),
+        }
+        key = QueryEmbeddingCache.normalize(question)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+
+    def invalidate(self, chunk_ids: Iterable[str]) -> int:
+        """Drop answers generated from any of the given chunks.
+
+        Pass the ids DenseVectorStore.process_extractions reports as deleted.
+
+        Returns:
+            Number of answers dropped
+        """
+        chunk_ids = set(chunk_ids)
+        if not chunk_ids:
+            return 0
+        with self._lock:
+            stale_keys = [key for key, entry in self._entries.items() if entry['sources'] & chunk_ids]
+            for key in stale_keys:
+                del self._entries[key]
+            if stale_keys:
+                self._matrix = None
+            self.invalidations += len(stale_keys)
+        return len(stale_keys)
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size."""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self) -> None:
+        """Drop every answer and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self.hits = self.misses = self.stale = self.evictions = self.invalidations = 0
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Write unexpired answers to path (defaults to persist_path)."""
+        path = path or self.persist_path
+        if not path:
+            raise ValueError("No path given and the cache has no persist_path")
+        with self._lock:
+            entries = [(key, entry) for key, entry in self._entries.items()
+                       if not self._expired(entry['created_at'])]
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entries, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> None:
+        """Merge answers saved by save(); expired ones are skipped."""
+        try:
+            with open(path, 'rb') as f:
+                entries = pickle.load(f)
+        except Exception as e:
+            print(f"Error loading answer cache {path}: {e}")
+            return
+        with self._lock:
+            for key, entry in entries:
+                if not self._expired(entry['created_at']):
+                    self._entries[key] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+_shared_cache = None
+
+def shared_answer_cache() -> SemanticAnswerCache:
+    """Process-wide cache used by RAGChatbot unless one is passed in.
+
+    Set ANSWER_CACHE_PATH to persist it across runs.
+    """
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = SemanticAnswerCache(persist_path=os.environ.get("ANSWER_CACHE_PATH"))
+    return _shared_cache
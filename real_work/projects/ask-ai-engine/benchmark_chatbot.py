@@ -0,0 +1,334 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from context_packer import count_message_tokens
+
+QUESTIONS = [
+    "What are the side effects?",
+    "What is the recommended dosage?",
+    "How should the medication be stored?",
+    "Who is the applicant for the license?",
+]
+
+# Fixed conversation for prompt-size comparisons; later turns lean on earlier ones
+CONVERSATION = QUESTIONS + [
+    "Which facility manufactures it?",
+    "What clinical trials support the approval?",
+    "Are there any contraindications for that?",
+    "What is the expiration date of the product?",
+]
+
+def make_stub_handler(first_token_ms, token_ms, n_tokens, prefill_ms_per_1k=0.0):
+    """Chat-completions handler that answers with n_tokens words after the injected delays.
+
+    prefill_ms_per_1k adds a delay before the first token proportional to the prompt size.
+    """
+    class StubChatHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        requests = 0
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            StubChatHandler.requests += 1
+            tokens = [f"token{i} " for i in range(n_tokens)]
+            first_token_delay = first_token_ms + prefill_ms_per_1k * count_message_tokens(body['messages']) / 1000
+            base = {'id': 'chatcmpl-stub', 'created': int(time.time()), 'model': body['model']}
+
+            if not body.get('stream'):
+                time.sleep((first_token_delay + token_ms * n_tokens) / 1000)
+                payload = json.dumps(dict(base, object='chat.completion', choices=[{
+                    'index': 0, 'finish_reason': 'stop',
+                    'message': {'role': 'assistant', 'content': ''.join(tokens)},
+                }])).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+
+            def send(data):
+                event = f"data: {data}\n\n".encode()
+                self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+                self.wfile.flush()
+
+            time.sleep(first_token_delay / 1000)
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(token_ms / 1000)
+                send(json.dumps(dict(base, object='chat.completion.chunk', choices=[{
+                    'index': 0, 'finish_reason': None, 'delta': {'content': token},
+                }])))
+            send(json.dumps(dict(base, object='chat.completion.chunk', choices=[{
+                'index': 0, 'finish_reason': 'stop', 'delta': {},
+            }])))
+            send('[DONE]')
+            self.wfile.write(b"0\r\n\r\n")
+
+    return StubChatHandler
+
+def start_stub_server(first_token_ms=300, token_ms=20, n_tokens=100, prefill_ms_per_1k=0.0):
+    """Serve the stub on a free localhost port; returns the server and its OpenAI base_url."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                 make_stub_handler(first_token_ms, token_ms, n_tokens, prefill_ms_per_1k))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+def _time_stream(tokens):
+    """(time to first token, total time) in ms for a token iterator."""
+    start = time.perf_counter()
+    first = None
+    for _ in tokens:
+        if first is None:
+            first = time.perf_counter() - start
+    return first * 1000, (time.perf_counter() - start) * 1000
+
+async def _atime_stream(tokens):
+    start = time.perf_counter()
+    first = None
+    async for _ in tokens:
+        if first is None:
+            first = time.perf_counter() - start
+    return first * 1000, (time.perf_counter() - start) * 1000
+
+def benchmark_chat(csv_path, first_token_ms=300, token_ms=20, n_tokens=100):
+    """Time to first token and total latency of chat vs chat_stream vs achat_stream, plus
+    a scripted conversation with and without prefetching the next turn's retrieval."""
+    server, base_url = start_stub_server(first_token_ms, token_ms, n_tokens)
+    os.environ['OPENAI_BASE_URL'] = base_url
+    os.environ.setdefault('OPENAI_API_KEY', 'stub')
+    from answer_cache import SemanticAnswerCache
+    from chatbot import RAGChatbot
+    from query_cache import QueryEmbeddingCache
+
+    persist_dir = tempfile.mkdtemp(prefix='chatbot_bench_')
+    try:
+        # max_size=0 disables both caches so every turn pays for retrieval and generation
+        chatbot = RAGChatbot(persist_dir, query_cache=QueryEmbeddingCache(max_size=0),
+                             answer_cache=SemanticAnswerCache(max_size=0))
+        chatbot.vector_store.process_extractions(csv_path)
+
+        report = {}
+        rows = []
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            chatbot.chat(question)
+            elapsed = (time.perf_counter() - start) * 1000
+            rows.append((elapsed, elapsed))
+        report['chat'] = rows
+
+        report['chat_stream'] = [_time_stream(chatbot.chat_stream(q)) for q in QUESTIONS]
+
+        async def run_async():
+            return [await _atime_stream(chatbot.achat_stream(q)) for q in QUESTIONS]
+        report['achat_stream'] = asyncio.run(run_async())
+
+        for name, rows in report.items():
+            ttft = sum(r[0] for r in rows) / len(rows)
+            total = sum(r[1] for r in rows) / len(rows)
+            print(f"{name:>14}: first token {ttft:8.1f} ms | full answer {total:8.1f} ms")
+
+        # Scripted conversation: the next question is known while the current answer streams
+        def conversation(prefetch):
+            chatbot.conversation_history = []
+            chatbot._last_query = None
+            start = time.perf_counter()
+            for i, question in enumerate(QUESTIONS):
+                for j, _ in enumerate(chatbot.chat_stream(question)):
+                    if prefetch and j == 0 and i + 1 < len(QUESTIONS):
+                        chatbot.prefetch_context(QUESTIONS[i + 1])
+            return (time.perf_counter() - start) * 1000
+
+        sequential = conversation(prefetch=False)
+        overlapped = conversation(prefetch=True)
+        print(f"{len(QUESTIONS)}-turn conversation: {sequential:.1f} ms sequential, "
+              f"{overlapped:.1f} ms with next-turn prefetch")
+        report['conversation_ms'] = {'sequential': sequential, 'prefetch': overlapped}
+        return report
+    finally:
+        server.shutdown()
+        shutil.rmtree(persist_dir, ignore_errors=True)
+
+def _legacy_turn(chatbot, history, question):
+    """One turn the way chat() built prompts before context packing: top-3 chunks verbatim,
+    then the last 6 history messages after the question."""
+    context = chatbot._format_context(chatbot._get_relevant_results(question, 3))
+    messages = [
+        {"role": "system", "content": chatbot.system_prompt},
+        {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {question}"}
+    ] + history
+    response = chatbot.client.chat.completions.create(model=chatbot.model, messages=messages,
+                                                      temperature=0.7, max_tokens=500)
+    history.extend([{"role": "user", "content": question},
+                    {"role": "assistant", "content": response.choices[0].message.content}])
+    history[:] = history[-6:]
+    return count_message_tokens(messages)
+
+def benchmark_packing(csv_path, first_token_ms=300, token_ms=5, n_tokens=250, prefill_ms_per_1k=200):
+    """Prompt tokens and turn latency over CONVERSATION with the old prompt building vs ContextPacker.
+
+    The stub charges prefill_ms_per_1k per thousand prompt tokens before the first token,
+    so latency reflects prompt size the way a hosted model's does.
+    """
+    server, base_url = start_stub_server(first_token_ms, token_ms, n_tokens, prefill_ms_per_1k)
+    os.environ['OPENAI_BASE_URL'] = base_url
+    os.environ.setdefault('OPENAI_API_KEY', 'stub')
+    from answer_cache import SemanticAnswerCache
+    from chatbot import RAGChatbot
+
+    persist_dir = tempfile.mkdtemp(prefix='chatbot_bench_')
+    try:
+        chatbot = RAGChatbot(persist_dir, answer_cache=SemanticAnswerCache(max_size=0))
+        chatbot.vector_store.process_extractions(csv_path)
+        chatbot.vector_store.search_many(CONVERSATION)  # warm the query cache for both runs
+
+        history = []
+        legacy_tokens, legacy_ms = [], []
+        for question in CONVERSATION:
+            start = time.perf_counter()
+            legacy_tokens.append(_legacy_turn(chatbot, history, question))
+            legacy_ms.append((time.perf_counter() - start) * 1000)
+
+        packed_tokens, packed_ms, packed_chunks = [], [], []
+        for question in CONVERSATION:
+            start = time.perf_counter()
+            chatbot.chat(question)
+            packed_ms.append((time.perf_counter() - start) * 1000)
+            packed_tokens.append(chatbot.last_prompt_stats['prompt_tokens'])
+            packed_chunks.append(chatbot.last_prompt_stats['chunks'])
+
+        report = {
+            'legacy': {'avg_prompt_tokens': float(np.mean(legacy_tokens)), 'max_prompt_tokens': max(legacy_tokens),
+                       'avg_turn_ms': float(np.mean(legacy_ms)), 'chunks_per_prompt': 3.0},
+            'packed': {'avg_prompt_tokens': float(np.mean(packed_tokens)), 'max_prompt_tokens': max(packed_tokens),
+                       'avg_turn_ms': float(np.mean(packed_ms)), 'chunks_per_prompt': float(np.mean(packed_chunks))},
+        }
+        for name, row in report.items():
+            print(f"{name:>7}: {row['avg_prompt_tokens']:7.1f} avg / {row['max_prompt_tokens']:5d} max prompt tokens | "
+                  f"{row['chunks_per_prompt']:4.1f} chunks | {row['avg_turn_ms']:7.1f} ms per turn")
+        return report
+    finally:
+        server.shutdown()
+        shutil.rmtree(persist_dir, ignore_errors=True)
+
+# Near-identical phrasings of the questions users ask most, most popular first
+FREQUENT_QUESTIONS = [
+    ["What are the side effects?", "what are the side effects", "What are the side-effects?"],
+    ["What is the recommended dosage?", "What is the recommended dosage", "what is the recommended dosage?"],
+    ["How should the medication be stored?", "How should the medication be stored"],
+    ["Who is the applicant for the license?", "who is the applicant for the license?"],
+    ["Which facility manufactures the vaccine?", "Which facility manufactures the vaccine"],
+    ["Are there any contraindications?", "Are there any contraindications"],
+]
+TOPICS = ["lot release", "labeling", "stability data", "shipping", "adverse events", "potency testing",
+          "inspection findings", "the package insert", "clinical holds", "sterility", "the BLA", "expiry"]
+
+def replay_log(n_queries=150, frequent_share=0.7, seed=0):
+    """Synthetic query log: Zipf-distributed frequent questions mixed with one-off ones."""
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, len(FREQUENT_QUESTIONS) + 1)
+    weights /= weights.sum()
+    log = []
+    for i in range(n_queries):
+        if rng.random() < frequent_share:
+            phrasings = FREQUENT_QUESTIONS[rng.choice(len(FREQUENT_QUESTIONS), p=weights)]
+            log.append(phrasings[rng.integers(len(phrasings))])
+        else:
+            log.append(f"What do the documents say about {TOPICS[rng.integers(len(TOPICS))]} in case {i}?")
+    return log
+
+def benchmark_answer_cache(csv_path, n_queries=150, first_token_ms=200, token_ms=2, n_tokens=100):
+    """Replay a query log with and without SemanticAnswerCache, each query a fresh conversation,
+    then edit a chunk behind a cached answer and check that the answer is invalidated."""
+    import pandas as pd
+    server, base_url = start_stub_server(first_token_ms, token_ms, n_tokens)
+    os.environ['OPENAI_BASE_URL'] = base_url
+    os.environ.setdefault('OPENAI_API_KEY', 'stub')
+    from answer_cache import SemanticAnswerCache
+    from chatbot import RAGChatbot
+
+    persist_dir = tempfile.mkdtemp(prefix='chatbot_bench_')
+    try:
+        chatbot = RAGChatbot(persist_dir)
+        chatbot.vector_store.process_extractions(csv_path, incremental=True)
+        log = replay_log(n_queries)
+
+        def replay(answer_cache):
+            chatbot.answer_cache = answer_cache
+            requests_before = server.RequestHandlerClass.requests
+            latencies = []
+            for question in log:
+                chatbot.conversation_history = []
+                chatbot._last_query = None
+                start = time.perf_counter()
+                chatbot.chat(question)
+                latencies.append((time.perf_counter() - start) * 1000)
+            return {
+                'mean_ms': float(np.mean(latencies)),
+                'p50_ms': float(np.percentile(latencies, 50)),
+                'llm_calls': server.RequestHandlerClass.requests - requests_before,
+            }
+
+        report = {'uncached': replay(SemanticAnswerCache(max_size=0))}
+        answer_cache = SemanticAnswerCache()
+        report['cached'] = dict(replay(answer_cache), hit_rate=answer_cache.stats()['hit_rate'])
+        for name, row in report.items():
+            print(f"{name:>9}: {row['mean_ms']:7.1f} ms mean | {row['p50_ms']:7.1f} ms p50 | "
+                  f"{row['llm_calls']} LLM calls for {len(log)} queries")
+        print(f"Answer cache hit rate: {report['cached']['hit_rate']:.1%}")
+
+        # Edit the top chunk behind the most frequent question and re-sync incrementally
+        question = FREQUENT_QUESTIONS[0][0]
+        top = chatbot._get_relevant_results(question, chatbot.n_candidates)[0]
+        extractions = pd.read_csv(csv_path)
+        row = extractions['file_path'] == top['metadata']['file_path']
+        extractions.loc[row, 'extracted_text'] = extractions.loc[row, 'extracted_text'].str.replace(
+            top['chunk'], top['chunk'] + " Revised.", regex=False)
+        edited_csv = os.path.join(persist_dir, 'edited_extractions.csv')
+        extractions.to_csv(edited_csv, index=False)
+        sync_stats = chatbot.vector_store.process_extractions(edited_csv, incremental=True)
+        dropped = answer_cache.invalidate(sync_stats['deleted_ids'])
+
+        chatbot.conversation_history = []
+        chatbot._last_query = None
+        hits_before = answer_cache.hits
+        chatbot.chat(question)
+        regenerated = answer_cache.hits == hits_before
+        print(f"After editing one source chunk: {dropped} cached answers invalidated, "
+              f"'{question}' regenerated: {regenerated}")
+        report['invalidation'] = {'dropped': dropped, 'regenerated': regenerated}
+        return report
+    finally:
+        server.shutdown()
+        shutil.rmtree(persist_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming benchmarks for RAGChatbot against a local stub chat-completions server")
+    parser.add_argument('--csv', default='pfizer_extractions_under_20_pages.csv', help='extractions CSV to index')
+    parser.add_argument('--first-token-ms', type=float, default=300, help='stub delay before the first token')
+    parser.add_argument('--token-ms', type=float, default=20, help='stub delay between tokens')
+    parser.add_argument('--n-tokens', type=int, default=100)
+    parser.add_argument('--benchmark', choices=['stream', 'packing', 'answer-cache'], default='stream')
+    args = parser.parse_args()
+
+    if args.benchmark == 'packing':
+        benchmark_packing(args.csv)
+    elif args.benchmark == 'answer-cache':
+        benchmark_answer_cache(args.csv)
+    else:
+        benchmark_chat(args.csv, args.first_token_ms, args.token_ms, args.n_tokens)
@@ -0,0 +1,357 @@
+import argparse
+import multiprocessing as mp
+import os
+import shutil
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+from extraction_store import csv_to_parquet, iter_document_frames, read_batches
+from main import process_pfizer_files
+
+WORDS = ("license lot release vaccine dosage storage stability potency sterility inspection "
+         "applicant facility manufacturing clinical adverse event labeling shipment temperature").split()
+
+def _page_stream(rng, page_no, grid=0):
+    """Content stream for one page: 40 lines of text and a 4x5 ruled table, plus an optional
+    grid x grid ruled table over the whole page, which makes pdfplumber's table finder slow
+    the way dense forms do."""
+    lines = ["BT /F1 10 Tf 50 760 Td 12 TL", f"(Page {page_no} Information Request) Tj"]
+    for _ in range(40):
+        text = ' '.join(rng.choice(WORDS, 12))
+        lines.append(f"T* ({text}) Tj")
+    lines.append("ET")
+    # Ruled grid, which pdfplumber's table finder picks up
+    for r in range(5):
+        lines.append(f"50 {200 - r * 20} m 450 {200 - r * 20} l S")
+    for c in range(5):
+        lines.append(f"{50 + c * 100} 200 m {50 + c * 100} 120 l S")
+    for r in range(4):
+        for c in range(4):
+            lines.append(f"BT /F1 9 Tf {55 + c * 100} {186 - r * 20} Td (r{r}c{c} {rng.choice(WORDS)}) Tj ET")
+    for i in range(grid + 1 if grid else 0):
+        y, x = 60 + i * 680 / grid, 40 + i * 530 / grid
+        lines.append(f"40 {y:.1f} m 570 {y:.1f} l S")
+        lines.append(f"{x:.1f} 60 m {x:.1f} 740 l S")
+    return '\n'.join(lines).encode('latin-1')
+
+def write_synthetic_pdf(path, n_pages, rng, dense_pages=(), grid=120):
+    """Write a minimal valid PDF with n_pages text pages using only the standard library.
+
+    Pages listed in dense_pages (1-based) get a grid x grid ruled table.
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page_no in range(1, n_pages + 1):
+        stream = _page_stream(rng, page_no, grid if page_no in dense_pages else 0)
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects)))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b' '.join(b"%d 0 R" % k for k in kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b''.join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, 'wb') as f:
+        f.write(out)
+
+def synthetic_corpus(directory, n_files=300, max_pages=8, seed=0):
+    """Write n_files PDFs of 1..max_pages pages and an inventory CSV; returns the inventory path."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n_files):
+        n_pages = int(rng.integers(1, max_pages + 1))
+        path = os.path.join(directory, f"synthetic_{i:04d}.pdf")
+        write_synthetic_pdf(path, n_pages, rng)
+        rows.append({'filename': os.path.basename(path), 'file_path': path,
+                     'size_mb': os.path.getsize(path) / 1e6, 'file_type': 'pdf',
+                     'num_pages': float(n_pages), 'release_date': '01012024'})
+    inventory_path = os.path.join(directory, 'inventory.csv')
+    pd.DataFrame(rows).to_csv(inventory_path, index=False)
+    return inventory_path
+
+def _legacy_serial(inventory_path, output_csv):
+    """The serial loop process_pfizer_files ran before: one pd.concat per file, CSV written at the end."""
+    from document_processor import DocumentProcessor
+    processor = DocumentProcessor(tempfile.mkdtemp(prefix='content_'))
+    df = pd.read_csv(inventory_path)
+    extractions_df = pd.DataFrame(columns=['file_path', 'num_pages', 'extracted_text', 'extracted_tables',
+                                           'extracted_images'])
+    for _, row in df[df['num_pages'] <= 20].iterrows():
+        texts, tables, images = processor.process_pdf(row['file_path'])
+        new_row = pd.DataFrame([{
+            'file_path': row['file_path'],
+            'num_pages': row['num_pages'],
+            'extracted_text': '\n'.join(texts) if texts else '',
+            'extracted_tables': str(tables) if tables else '',
+            'extracted_images': str(len(images)) if images else '0'
+        }])
+        extractions_df = pd.concat([extractions_df, new_row], ignore_index=True)
+    extractions_df.to_csv(output_csv, index=False)
+
+def benchmark_extraction(n_files=300, max_pages=8, worker_counts=(1, 4, 8), include_legacy=True):
+    """Wall time of process_pfizer_files on a synthetic corpus per worker count, plus a resume check."""
+    directory = tempfile.mkdtemp(prefix='extraction_bench_')
+    try:
+        inventory_path = synthetic_corpus(directory, n_files, max_pages)
+        print(f"Synthetic corpus: {n_files} PDFs, "
+              f"{int(pd.read_csv(inventory_path)['num_pages'].sum())} pages, {os.cpu_count()} CPUs")
+
+        report = {}
+        if include_legacy:
+            start = time.perf_counter()
+            _legacy_serial(inventory_path, os.path.join(directory, 'legacy.csv'))
+            report['legacy serial'] = time.perf_counter() - start
+
+        for workers in worker_counts:
+            checkpoint_dir = os.path.join(directory, f'checkpoint_{workers}')
+            stats = process_pfizer_files(inventory_path, os.path.join(directory, f'extractions_{workers}.csv'),
+                                         os.path.join(directory, f'extractions_{workers}.parquet'),
+                                         checkpoint_dir=checkpoint_dir, max_workers=workers)
+            report[f'{workers} workers'] = stats['seconds']
+
+        # Resume: drop the last third of a finished checkpoint's records, as if the run had died there
+        checkpoint_dir = os.path.join(directory, f'checkpoint_{worker_counts[0]}')
+        shard = sorted(os.listdir(checkpoint_dir))[0]
+        with open(os.path.join(checkpoint_dir, shard)) as f:
+            lines = f.readlines()
+        with open(os.path.join(checkpoint_dir, shard), 'w') as f:
+            f.writelines(lines[:len(lines) * 2 // 3])
+            f.write(lines[len(lines) * 2 // 3][:40])  # torn final line
+        stats = process_pfizer_files(inventory_path, os.path.join(directory, 'resumed.csv'),
+                                     os.path.join(directory, 'resumed.parquet'),
+                                     checkpoint_dir=checkpoint_dir, max_workers=worker_counts[0])
+        report['resume after 2/3'] = stats['seconds']
+        same = pd.read_csv(os.path.join(directory, 'resumed.csv')).equals(
+            pd.read_csv(os.path.join(directory, f'extractions_{worker_counts[0]}.csv')))
+
+        print()
+        for name, seconds in report.items():
+            print(f"{name:>17}: {seconds:7.1f} s")
+        print(f"Resumed run skipped {stats['skipped']} files, extracted {stats['processed']}; "
+              f"CSV identical to the uninterrupted run: {same}")
+        return report
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def _rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+
+def _load_text(method, path, results):
+    """Child process: read file_path + text with one method and report time and peak memory."""
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    baseline = _rss_mb()
+    peak = [baseline]
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            peak[0] = max(peak[0], _rss_mb())
+            time.sleep(0.001)
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+
+    start = time.perf_counter()
+    if method == 'csv, all columns':
+        df = pd.read_csv(path)
+        chars = int(df['extracted_text'].str.len().sum())
+    elif method == 'csv, usecols':
+        df = pd.read_csv(path, usecols=['file_path', 'extracted_text'])
+        chars = int(df['extracted_text'].str.len().sum())
+    elif method == 'parquet, projected table':
+        table = pq.read_table(path, columns=['file_path', 'text'])
+        chars = pc.sum(pc.utf8_length(table.column('text'))).as_py()
+    elif method == 'parquet, streamed batches':
+        chars = sum(pc.sum(pc.utf8_length(batch.column(1))).as_py() or 0
+                    for batch in read_batches(path, ['file_path', 'text'], batch_size=256))
+    else:
+        chars = sum(int(frame['extracted_text'].str.len().sum()) for frame in iter_document_frames(path))
+    seconds = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    results.put((seconds, max(peak[0], _rss_mb()) - baseline, chars))
+
+def benchmark_formats(csv_path='pfizer_extractions_under_20_pages.csv', replicate=30):
+    """Time and peak memory to read file_path + text from the extractions CSV vs Parquet.
+
+    The real extractions are replicated (with distinct file paths) to get a corpus large
+    enough to measure; each method runs in a fresh process.
+    """
+    directory = tempfile.mkdtemp(prefix='format_bench_')
+    try:
+        source = pd.read_csv(csv_path)
+        big_csv = os.path.join(directory, 'extractions.csv')
+        pd.concat([source.assign(file_path=source['file_path'] + f'#{i}') for i in range(replicate)],
+                  ignore_index=True).to_csv(big_csv, index=False)
+        big_parquet = os.path.join(directory, 'extractions.parquet')
+        documents = csv_to_parquet(big_csv, big_parquet)
+        print(f"{documents} documents: CSV {os.path.getsize(big_csv) / 1e6:.1f} MB, "
+              f"Parquet {os.path.getsize(big_parquet) / 1e6:.1f} MB")
+
+        ctx = mp.get_context('spawn')
+        report = {}
+        for method, path in [('csv, all columns', big_csv), ('csv, usecols', big_csv),
+                             ('parquet, projected table', big_parquet), ('parquet, streamed batches', big_parquet),
+                             ('parquet, document frames', big_parquet)]:
+            results = ctx.Queue()
+            child = ctx.Process(target=_load_text, args=(method, path, results))
+            child.start()
+            seconds, peak_mb, chars = results.get()
+            child.join()
+            report[method] = {'seconds': seconds, 'peak_mb': peak_mb, 'chars': chars}
+            print(f"{method:>26}: {seconds * 1000:8.1f} ms | +{peak_mb:7.1f} MB peak | {chars} chars")
+        return report
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def _tree_pss_mb(pid=None):
+    """Proportional set size of a process and all its descendants, so pages forked
+    workers share with their parent are not counted once per worker."""
+    pid = pid or os.getpid()
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            total = next(int(line.split()[1]) for line in f if line.startswith('Pss:')) / 1e3
+        tids = os.listdir(f'/proc/{pid}/task')
+    except (FileNotFoundError, ProcessLookupError):
+        return 0.0
+    for tid in tids:
+        # Threads and children come and go while we walk the tree
+        try:
+            with open(f'/proc/{pid}/task/{tid}/children') as f:
+                children = f.read().split()
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+        total += sum(_tree_pss_mb(int(child)) for child in children)
+    return total
+
+def _legacy_rasterize(file_path, dpi):
+    """What process_pdf did before: every page rendered into memory, then PNG-encoded to base64.
+    pdfium stands in for pdf2image so both sides use the same renderer."""
+    import base64
+    import io
+    import pypdfium2
+    pdf = pypdfium2.PdfDocument(file_path)
+    pages = [pdf[i].render(scale=dpi / 72).to_pil() for i in range(len(pdf))]
+    images_b64 = []
+    for page in pages:
+        buffer = io.BytesIO()
+        page.save(buffer, format='PNG')
+        images_b64.append(base64.b64encode(buffer.getvalue()).decode('utf-8'))
+    return images_b64
+
+def _rasterize(method, file_path, output_dir, results):
+    """Child process: rasterize with one method and report time and peak memory of the process tree."""
+    from document_processor import DocumentProcessor
+    processor = DocumentProcessor(output_dir)
+    baseline = _tree_pss_mb()
+    peak = [baseline]
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            peak[0] = max(peak[0], _tree_pss_mb())
+            time.sleep(0.02)
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+
+    start = time.perf_counter()
+    if method == 'legacy, all pages in memory':
+        images = _legacy_rasterize(file_path, 200)
+    elif method == 'render_pages, 1 worker':
+        images = processor.render_pages(file_path, thread_count=1)
+    elif method == 'render_pages, 4 workers':
+        images = processor.render_pages(file_path, thread_count=4)
+    else:
+        images = processor.render_pages(file_path, page_numbers=[7])
+    seconds = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    results.put((seconds, peak[0] - baseline, len(images)))
+
+def benchmark_rasterization(n_pages=20):
+    """Time and peak memory to rasterize a synthetic n_pages PDF at 200 dpi."""
+    directory = tempfile.mkdtemp(prefix='raster_bench_')
+    try:
+        file_path = os.path.join(directory, 'synthetic.pdf')
+        write_synthetic_pdf(file_path, n_pages, np.random.default_rng(0))
+        ctx = mp.get_context('spawn')
+        report = {}
+        for method in ['legacy, all pages in memory', 'render_pages, 1 worker', 'render_pages, 4 workers',
+                       'render_pages, page 7 only']:
+            results = ctx.Queue()
+            child = ctx.Process(target=_rasterize, args=(method, file_path, os.path.join(directory, 'out'), results))
+            child.start()
+            seconds, peak_mb, images = results.get()
+            child.join()
+            shutil.rmtree(os.path.join(directory, 'out'), ignore_errors=True)
+            report[method] = {'seconds': seconds, 'peak_mb': peak_mb, 'images': images}
+            print(f"{method:>28}: {seconds:6.2f} s | +{peak_mb:7.1f} MB peak | {images} images")
+        return report
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def benchmark_pages(n_files=40, n_pages=8, dense_every=10, page_timeout=1.0, page_workers=4):
+    """Per-document extract_pages latency (p50/p99) on a corpus where every dense_every-th
+    document has one dense-form page, with and without a page timeout and page workers."""
+    from document_processor import DocumentProcessor
+    directory = tempfile.mkdtemp(prefix='pages_bench_')
+    try:
+        rng = np.random.default_rng(0)
+        paths = []
+        for i in range(n_files):
+            path = os.path.join(directory, f"synthetic_{i:04d}.pdf")
+            dense = (int(rng.integers(1, n_pages + 1)),) if i % dense_every == 0 else ()
+            write_synthetic_pdf(path, n_pages, rng, dense_pages=dense)
+            paths.append(path)
+
+        report = {}
+        for label, workers, timeout in [('serial, no timeout (before)', 1, None),
+                                        (f'serial, {page_timeout:g}s timeout', 1, page_timeout),
+                                        (f'{page_workers} workers, {page_timeout:g}s timeout', page_workers, page_timeout)]:
+            processor = DocumentProcessor(directory, page_workers=workers, page_timeout=timeout)
+            processor.extract_pages(paths[1])  # start the pool outside the timings
+            latencies = []
+            timed_out = 0
+            for path in paths:
+                start = time.perf_counter()
+                pages = processor.extract_pages(path)
+                latencies.append(time.perf_counter() - start)
+                timed_out += sum(1 for page in pages if page.get('tables_timed_out'))
+            processor.close()
+            p50, p99 = np.percentile(latencies, [50, 99])
+            report[label] = {'p50': p50, 'p99': p99, 'total': sum(latencies), 'timed_out_pages': timed_out}
+            print(f"{label:>30}: p50 {p50 * 1000:7.0f} ms | p99 {p99 * 1000:7.0f} ms | "
+                  f"total {sum(latencies):6.1f} s | {timed_out} pages text-only")
+        return report
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark process_pfizer_files on a synthetic PDF corpus")
+    parser.add_argument('--n-files', type=int, default=300)
+    parser.add_argument('--max-pages', type=int, default=8)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--skip-legacy', action='store_true')
+    parser.add_argument('--benchmark', choices=['extraction', 'formats', 'rasterization', 'pages'], default='extraction')
+    args = parser.parse_args()
+
+    if args.benchmark == 'formats':
+        benchmark_formats()
+    elif args.benchmark == 'rasterization':
+        benchmark_rasterization()
+    elif args.benchmark == 'pages':
+        benchmark_pages()
+    else:
+        benchmark_extraction(args.n_files, args.max_pages, tuple(args.workers), not args.skip_legacy)
@@ -0,0 +1,366 @@
+import argparse
+import multiprocessing
+import os
+import pickle
+import resource
+import shutil
+import tempfile
+import time
+import faiss
+import chardet
+import numpy as np
+from indexin import (FlatIndex, LSHIndex, IVFIndex, IVFPQIndex, HNSWIndex, ScalarQuantizedIndex,
+                     BinaryQuantizedIndex, ShardedIndex, ChunkStore, TextProcessor)
+from index_tuning import measure_search
+
+INDEX_TYPES = {
+    'flat': FlatIndex,
+    'lsh': LSHIndex,
+    'ivf': IVFIndex,
+    'ivfpq': IVFPQIndex,
+    'hnsw': HNSWIndex,
+    'sq8': ScalarQuantizedIndex,
+    'binary': BinaryQuantizedIndex,
+}
+
+def random_embeddings(n, dim, seed=0):
+    """Generate unit-normalized random vectors in the shape our embedding model produces."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def clustered_embeddings(n, dim, points_per_cluster=50, seed=0):
+    """Unit vectors scattered around random topic centers, so near neighbours are meaningful."""
+    rng = np.random.default_rng(seed)
+    centers = random_embeddings(max(1, n // points_per_cluster), dim, seed=seed + 1)
+    vectors = centers[rng.integers(0, len(centers), n)]
+    vectors += (0.7 / np.sqrt(dim)) * rng.standard_normal((n, dim)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def benchmark_batch_search(n_vectors=100000, dim=768, n_queries=1000, top_k=5):
+    """Compare QPS of per-query search() against one search_batch() call for every index type."""
+    embeddings = random_embeddings(n_vectors, dim)
+    queries = random_embeddings(n_queries, dim, seed=1)
+
+    report = []
+    for name, index_cls in INDEX_TYPES.items():
+        index = index_cls(dim)
+        start = time.perf_counter()
+        index.build_index(embeddings)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for query in queries:
+            index.search(query, top_k)
+        single_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index.search_batch(queries, top_k)
+        batch_time = time.perf_counter() - start
+
+        row = {
+            'index': name,
+            'build_s': round(build_time, 3),
+            'single_qps': round(n_queries / single_time, 1),
+            'batch_qps': round(n_queries / batch_time, 1),
+            'speedup': round(single_time / batch_time, 2),
+        }
+        report.append(row)
+        print(f"{name:>6}: build {row['build_s']:.2f}s | single {row['single_qps']:>10.1f} QPS | "
+              f"batch {row['batch_qps']:>10.1f} QPS | x{row['speedup']}")
+
+    return report
+
+def _current_rss_mb():
+    """Resident set size of this process in MB."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except OSError:
+        # ru_maxrss is a peak rather than current value, but is all macOS offers
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e6
+
+def _load_in_fresh_process(mode, path, index_type, dim, results):
+    """Load a saved index in a clean interpreter so RSS reflects only the load."""
+    baseline = _current_rss_mb()
+    start = time.perf_counter()
+    if mode == 'pickle':
+        with open(os.path.join(path, 'legacy.pkl'), 'rb') as f:
+            index = pickle.load(f)
+        with open(os.path.join(path, 'legacy_chunks.pkl'), 'rb') as f:
+            chunk_texts = pickle.load(f)
+    else:
+        vector_index = INDEX_TYPES[index_type](dim)
+        vector_index.load(path, mmap=(mode == 'mmap'))
+        index = vector_index.index
+        chunk_texts = ChunkStore.open(path)
+    elapsed = time.perf_counter() - start
+    load_rss = _current_rss_mb() - baseline
+
+    # A flat scan touches every mapped page, so also report RSS after one real query;
+    # for mmap loads those pages are clean page cache the kernel can drop under pressure.
+    index.search(np.zeros((1, dim), dtype='float32'), 5)
+    _ = chunk_texts[len(chunk_texts) - 1]
+    results.put((mode, elapsed, load_rss, _current_rss_mb() - baseline))
+
+def benchmark_persistence(n_vectors=1000000, dim=768, index_type='flat'):
+    """Compare cold-start load time and RSS for legacy pickle, native FAISS read and mmap read."""
+    embeddings = random_embeddings(n_vectors, dim)
+    chunk_texts = [f"chunk {i} " + "lorem ipsum dolor sit amet " * 20 for i in range(n_vectors)]
+
+    vector_index = INDEX_TYPES[index_type](dim)
+    vector_index.build_index(embeddings)
+    del embeddings
+
+    path = tempfile.mkdtemp(prefix='indexin_bench_')
+    try:
+        vector_index.save(path)
+        ChunkStore.write(chunk_texts, path)
+        with open(os.path.join(path, 'legacy.pkl'), 'wb') as f:
+            pickle.dump(vector_index.index, f)
+        with open(os.path.join(path, 'legacy_chunks.pkl'), 'wb') as f:
+            pickle.dump(chunk_texts, f)
+        del vector_index, chunk_texts
+
+        ctx = multiprocessing.get_context('spawn')
+        results = ctx.Queue()
+        report = []
+        for mode in ('pickle', 'native', 'mmap'):
+            proc = ctx.Process(target=_load_in_fresh_process, args=(mode, path, index_type, dim, results))
+            proc.start()
+            proc.join()
+            if proc.exitcode != 0:
+                print(f"{mode:>6}: load failed (exit code {proc.exitcode})")
+                continue
+            mode, elapsed, load_rss, query_rss = results.get()
+            report.append({'mode': mode, 'load_s': round(elapsed, 3),
+                           'rss_after_load_mb': round(load_rss, 1), 'rss_after_query_mb': round(query_rss, 1)})
+            print(f"{mode:>6}: load {elapsed:.3f}s | RSS +{load_rss:.1f} MB after load, "
+                  f"+{query_rss:.1f} MB after first query")
+        return report
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def benchmark_incremental(n_vectors=1000000, dim=768, n_new=2000, index_types=None):
+    """Time adding and removing n_new vectors (about 100 documents' chunks) against a full rebuild."""
+    embeddings = random_embeddings(n_vectors, dim)
+    new_embeddings = random_embeddings(n_new, dim, seed=2)
+    all_embeddings = np.vstack([embeddings, new_embeddings])
+
+    report = []
+    for name in index_types or INDEX_TYPES:
+        vector_index = INDEX_TYPES[name](dim)
+        start = time.perf_counter()
+        vector_index.build_index(embeddings)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        ids = vector_index.add(new_embeddings)
+        add_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vector_index.remove(ids)
+        remove_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        INDEX_TYPES[name](dim).build_index(all_embeddings)
+        rebuild_time = time.perf_counter() - start
+
+        row = {'index': name, 'build_s': round(build_time, 3), 'add_s': round(add_time, 3),
+               'remove_s': round(remove_time, 3), 'rebuild_s': round(rebuild_time, 3)}
+        report.append(row)
+        print(f"{name:>6}: add {n_new} in {add_time:.3f}s | remove in {remove_time:.3f}s | "
+              f"full rebuild {rebuild_time:.2f}s")
+    return report
+
+def benchmark_sharded(corpus_sizes=(100000, 300000, 1000000), dim=768, n_queries=1000, top_k=5,
+                      shard_counts=(1, 2, 4), shard_type='FlatIndex'):
+    """Batched QPS and per-shard memory of ShardedIndex as the corpus grows."""
+    queries = random_embeddings(n_queries, dim, seed=1)
+
+    report = []
+    for n_vectors in corpus_sizes:
+        embeddings = random_embeddings(n_vectors, dim)
+        for n_shards in shard_counts:
+            vector_index = ShardedIndex(dim, n_shards=n_shards, shard_type=shard_type)
+            try:
+                start = time.perf_counter()
+                vector_index.build_index(embeddings)
+                build_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                vector_index.search_batch(queries, top_k)
+                batch_time = time.perf_counter() - start
+
+                stats = vector_index.shard_stats()
+            finally:
+                vector_index.close()
+
+            row = {
+                'n_vectors': n_vectors,
+                'n_shards': n_shards,
+                'build_s': round(build_time, 3),
+                'batch_qps': round(n_queries / batch_time, 1),
+                'max_shard_index_mb': round(max(s['memory_bytes'] for s in stats) / 1e6, 1),
+                'max_shard_rss_mb': round(max(s['rss_bytes'] for s in stats) / 1e6, 1),
+            }
+            report.append(row)
+            print(f"{n_vectors:>8} vectors, {n_shards} shard(s): build {row['build_s']:.2f}s | "
+                  f"batch {row['batch_qps']:>9.1f} QPS | largest shard index {row['max_shard_index_mb']:.1f} MB, "
+                  f"RSS {row['max_shard_rss_mb']:.1f} MB")
+        del embeddings
+    return report
+
+def benchmark_quantized(n_vectors=300000, dim=768, n_queries=1000, top_k=10):
+    """Recall, memory and latency of the quantized flat indexes against exact FlatIndex."""
+    # Isotropic random vectors have no real neighbours beyond the first, which makes recall@k noise
+    embeddings = clustered_embeddings(n_vectors, dim)
+    rng = np.random.default_rng(1)
+    # Corpus vectors plus noise of norm ~0.5 behave more like real queries than fresh random ones
+    sample = embeddings[rng.choice(n_vectors, n_queries, replace=False)]
+    queries = (sample + 0.5 / np.sqrt(dim) * rng.standard_normal(sample.shape)).astype('float32')
+
+    exact = FlatIndex(dim)
+    exact.build_index(embeddings)
+    _, ground_truth = exact.search_batch(queries, top_k)
+
+    report = []
+    path = tempfile.mkdtemp(prefix='indexin_bench_')
+    try:
+        for name in ('flat', 'sq8', 'binary'):
+            vector_index = INDEX_TYPES[name](dim)
+            start = time.perf_counter()
+            vector_index.build_index(embeddings)
+            build_time = time.perf_counter() - start
+
+            # Reload so quantized indexes rescore from the memory-mapped float32 store
+            vector_index.save(os.path.join(path, name))
+            vector_index = INDEX_TYPES[name](dim)
+            vector_index.load(os.path.join(path, name))
+
+            row = dict({'index': name, 'build_s': round(build_time, 3),
+                        'resident_mb': round(vector_index.memory_bytes() / 1e6, 1)},
+                       **measure_search(vector_index, queries, ground_truth, top_k))
+            report.append(row)
+            print(f"{name:>6}: recall@{top_k} {row['recall_at_k']:.3f} | resident {row['resident_mb']:.1f} MB | "
+                  f"p50 {row['p50_ms']:.2f}ms | p99 {row['p99_ms']:.2f}ms | batch {row['batch_qps']:.1f} QPS")
+            del vector_index
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+    return report
+
+def benchmark_lsh(corpus_sizes=(100000, 300000), dim=768, n_queries=500, top_k=10,
+                  configs=((8, 10, 0), (12, 32, 0), (12, 32, 8), (14, 48, 12))):
+    """Candidates, recall and latency of multi-table LSHIndex vs the old single FAISS IndexLSH scan.
+
+    configs are (n_bits, n_tables, n_probes); the FAISS baseline uses n_bits * n_tables bits of
+    the first config (the old defaults), which is what LSHIndex(n_bits, n_tables) used to build.
+    """
+    report = []
+    for n_vectors in corpus_sizes:
+        embeddings = clustered_embeddings(n_vectors, dim)
+        rng = np.random.default_rng(1)
+        sample = embeddings[rng.choice(n_vectors, n_queries, replace=False)]
+        queries = (sample + 0.5 / np.sqrt(dim) * rng.standard_normal(sample.shape)).astype('float32')
+        exact = FlatIndex(dim)
+        exact.build_index(embeddings)
+        _, ground_truth = exact.search_batch(queries, top_k)
+        del exact
+
+        n_bits, n_tables, _ = configs[0]
+        runs = [(f"faiss IndexLSH {n_bits * n_tables} bits", None)]
+        runs += [(f"LSH {n_bits}b x {n_tables}t, {n_probes} probes", (n_bits, n_tables, n_probes))
+                       for n_bits, n_tables, n_probes in configs]
+        for name, config in runs:
+            # Build, measure and drop one index at a time; each holds its own copy of the vectors
+            if config is None:
+                vector_index = FlatIndex(dim)
+                vector_index._create_index = lambda _: faiss.IndexIDMap2(faiss.IndexLSH(dim, n_bits * n_tables))
+            else:
+                vector_index = LSHIndex(dim, n_bits=config[0], n_tables=config[1], n_probes=config[2])
+            vector_index.build_index(embeddings)
+            mean_candidates = n_vectors if config is None else int(vector_index.count_candidates(queries).mean())
+
+            row = dict({'n_vectors': n_vectors, 'index': name, 'mean_candidates': mean_candidates},
+                       **measure_search(vector_index, queries, ground_truth, top_k))
+            report.append(row)
+            print(f"{n_vectors:>8} {name:<32}: {mean_candidates:>8} candidates | recall@{top_k} {row['recall_at_k']:.3f} | "
+                  f"p50 {row['p50_ms']:.2f}ms | p99 {row['p99_ms']:.2f}ms")
+            del vector_index
+        del embeddings
+    return report
+
+def _legacy_extract_and_chunk(path, chunk_size=512, chunk_overlap=100):
+    """The previous TextProcessor path: chardet over the whole file, a second read, split/join chunks."""
+    with open(path, 'rb') as file:
+        encoding = chardet.detect(file.read())['encoding'] or 'utf-8'
+    with open(path, 'r', encoding=encoding, errors='replace') as file:
+        words = file.read().split()
+    chunks = []
+    i = 0
+    while i < len(words):
+        chunks.append(' '.join(words[i:i + chunk_size]))
+        i += chunk_size - chunk_overlap
+    return chunks
+
+def benchmark_text(size_mb=20, encodings=('utf-8', 'latin-1')):
+    """MB/s of reading, decoding and chunking a large text file, old path vs TextProcessor."""
+    words = ['dosage', 'tablet', 'adverse', 'réaction', 'storage', 'patients', 'clinical', 'naïve']
+    rng = np.random.default_rng(0)
+    sentence_count = int(size_mb * 1e6 / 60)
+    text = '\n'.join(' '.join(rng.choice(words, 8)) + '.' for _ in range(sentence_count))
+
+    report = []
+    processor = TextProcessor()
+    for encoding in encodings:
+        fd, path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(text.encode(encoding))
+        size = os.path.getsize(path) / 1e6
+        try:
+            start = time.perf_counter()
+            legacy_chunks = _legacy_extract_and_chunk(path)
+            legacy_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            chunks = sum(1 for _ in processor.iter_chunks(processor.extract_text_from_document(path)))
+            new_time = time.perf_counter() - start
+        finally:
+            os.remove(path)
+
+        row = {'encoding': encoding, 'size_mb': round(size, 1), 'chunks': chunks,
+               'legacy_mb_s': round(size / legacy_time, 2), 'new_mb_s': round(size / new_time, 2)}
+        report.append(row)
+        print(f"{encoding:>8} {size:.1f} MB: legacy {row['legacy_mb_s']:.2f} MB/s ({len(legacy_chunks)} chunks) | "
+              f"new {row['new_mb_s']:.2f} MB/s ({chunks} chunks)")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the indexin index types")
+    parser.add_argument('benchmark', nargs='?', choices=['batch', 'persistence', 'incremental', 'sharded', 'quantized', 'lsh', 'text'], default='batch')
+    parser.add_argument('--n-vectors', type=int, default=None)
+    parser.add_argument('--index-type', choices=sorted(INDEX_TYPES), default='flat')
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--n-queries', type=int, default=1000)
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--size-mb', type=float, default=20, help='file size for the text benchmark')
+    args = parser.parse_args()
+
+    if args.benchmark == 'persistence':
+        benchmark_persistence(args.n_vectors or 1000000, args.dim, args.index_type)
+    elif args.benchmark == 'incremental':
+        benchmark_incremental(args.n_vectors or 1000000, args.dim)
+    elif args.benchmark == 'sharded':
+        sizes = (args.n_vectors,) if args.n_vectors else (100000, 300000, 1000000)
+        benchmark_sharded(sizes, args.dim, args.n_queries, args.top_k)
+    elif args.benchmark == 'quantized':
+        benchmark_quantized(args.n_vectors or 300000, args.dim, args.n_queries, args.top_k)
+    elif args.benchmark == 'lsh':
+        sizes = (args.n_vectors,) if args.n_vectors else (100000, 300000)
+        benchmark_lsh(sizes, args.dim, args.n_queries, args.top_k)
+    elif args.benchmark == 'text':
+        benchmark_text(args.size_mb)
+    else:
+        benchmark_batch_search(args.n_vectors or 100000, args.dim, args.n_queries, args.top_k)
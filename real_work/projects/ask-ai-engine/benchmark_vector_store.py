@@ -0,0 +1,59 @@
+import argparse
+import asyncio
+import shutil
+import tempfile
+import time
+import numpy as np
+from query_cache import QueryEmbeddingCache
+from vector_store import DenseVectorStore
+
+QUERIES = [
+    "What are the side effects?",
+    "What is the recommended dosage?",
+    "How should the medication be stored?",
+    "Who is the applicant for the license?",
+    "What clinical trials support the approval?",
+    "Are there any contraindications?",
+    "What is the expiration date of the product?",
+    "Which facility manufactures the vaccine?",
+]
+
+def _median_ms(fn, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000
+
+def benchmark_search(csv_path, rounds=20, n_results=5):
+    """Latency of 1 query vs 8 queries issued sequentially, batched, and concurrently via asearch."""
+    persist_dir = tempfile.mkdtemp(prefix='vector_store_bench_')
+    try:
+        # max_size=0 keeps nothing, so every round pays for encoding the queries
+        store = DenseVectorStore(persist_dir, query_cache=QueryEmbeddingCache(max_size=0))
+        store.process_extractions(csv_path)
+
+        async def gather_asearch():
+            return await asyncio.gather(*(store.asearch(query, n_results) for query in QUERIES))
+
+        report = {
+            '1 query, search': _median_ms(lambda: store.search(QUERIES[0], n_results), rounds),
+            '8 queries, sequential search': _median_ms(lambda: [store.search(q, n_results) for q in QUERIES], rounds),
+            '8 queries, search_many': _median_ms(lambda: store.search_many(QUERIES, n_results), rounds),
+            '8 queries, gathered asearch': _median_ms(lambda: asyncio.run(gather_asearch()), rounds),
+        }
+        for name, ms in report.items():
+            print(f"{name:>30}: {ms:8.2f} ms")
+        return report
+    finally:
+        shutil.rmtree(persist_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for DenseVectorStore")
+    parser.add_argument('--csv', default='pfizer_extractions_under_20_pages.csv', help='extractions CSV to index')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--n-results', type=int, default=5)
+    args = parser.parse_args()
+
+    benchmark_search(args.csv, args.rounds, args.n_results)
@@ -1,30 +1,55 @@
+import asyncio
 import os
+from concurrent.futures import Future
 from pathlib import Path
-from typing import List, Dict
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from vector_store import DenseVectorStore
+from query_cache import QueryEmbeddingCache
+from context_packer import ContextPacker
+from answer_cache import SemanticAnswerCache, shared_answer_cache
 
 class RAGChatbot:
     """RAG chatbot that uses ChromaDB for retrieval and OpenAI for generation."""
     
-    def __init__(self, vector_store_path: str = "./vector_store"):
+    def __init__(self, vector_store_path: str = "./vector_store", query_cache: Optional[QueryEmbeddingCache] = None,
+                 context_packer: Optional[ContextPacker] = None, n_candidates: int = 10,
+                 answer_cache: Optional[SemanticAnswerCache] = None):
         """Initialize the chatbot.
         
         Args:
             vector_store_path: Path to the vector store directory
+            query_cache: Cache for query embeddings; defaults to the process-wide shared cache
+            context_packer: Token budget for prompts; defaults to ContextPacker()
+            n_candidates: Ranked chunks retrieved per turn for the packer to choose from
+            answer_cache: Cache of answers to similar questions; defaults to the process-wide shared cache
         """
         # Load environment variables
         load_dotenv()
         
-        # Initialize OpenAI client
+        # Initialize OpenAI clients; the async one backs achat_stream
         self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.model = "gpt-4-turbo-preview"  # You can change this to a different model
         
         # Initialize vector store
-        self.vector_store = DenseVectorStore(vector_store_path)
+        self.vector_store = DenseVectorStore(vector_store_path, query_cache=query_cache)
         
-        # Initialize conversation history
+        # Initialize conversation history and the prompt token budget
         self.conversation_history = []
+        self.context_packer = context_packer or ContextPacker()
+        self.n_candidates = n_candidates
+        self.last_prompt_stats = None
+        
+        # Repeated questions reuse an earlier answer when retrieval still returns the same sources
+        self.answer_cache = answer_cache if answer_cache is not None else shared_answer_cache()
+        
+        # Latest user turn, set as soon as its retrieval is done so a prefetch for the
+        # next turn can use it while the answer is still being generated. At most one
+        # prefetch, for the question expected next, is pending at a time
+        self._last_query = None
+        self._prefetched: Optional[Tuple[str, Future]] = None
         
         # System prompt template
         self.system_prompt = """You are a helpful assistant that answers questions about Pfizer documents. 
@@ -32,19 +57,35 @@ class RAGChatbot:
         say "I cannot find information about that in the provided documents."
         Keep your answers concise and to the point. Always cite the source document when providing information."""
     
-    def _get_relevant_context(self, query: str, n_results: int = 3) -> str:
-        """Retrieve relevant context from the vector store.
+    def _query_variants(self, query: str) -> List[str]:
+        """Rewrite the query into the variants retrieved for it.
+        
+        Follow-up questions ("what about its storage?") rarely name their subject, so the
+        previous user turn is prepended as a second variant when there is one.
         
         Args:
             query: User query
-            n_results: Number of results to retrieve
             
         Returns:
-            String containing relevant context
+            List of queries to retrieve for, the original first
         """
-        results = self.vector_store.search(query, n_results=n_results)
-        
-        # Format context with source information
+        variants = [query]
+        if self._last_query and self._last_query != query:
+            variants.append(f"{self._last_query} {query}")
+        return variants
+    
+    def _merge_results(self, result_lists: List[List[Dict]], n_results: int) -> List[Dict]:
+        """Merge per-variant results, keeping each chunk once at its best distance."""
+        best = {}
+        for results in result_lists:
+            for result in results:
+                current = best.get(result['id'])
+                if current is None or (result['distance'] or 0) < (current['distance'] or 0):
+                    best[result['id']] = result
+        return sorted(best.values(), key=lambda r: r['distance'] or 0)[:n_results]
+    
+    def _format_context(self, results: List[Dict]) -> str:
+        """Format context with source information."""
         context_pieces = []
         for result in results:
             context = f"From {result['metadata']['file_path']}:\n{result['chunk']}"
@@ -52,6 +93,104 @@ class RAGChatbot:
         
         return "\n\n".join(context_pieces)
     
+    def _get_relevant_results(self, query: str, n_results: int = 3, where: Optional[Dict] = None) -> List[Dict]:
+        """Retrieve ranked chunks for a query from the vector store.
+        
+        Args:
+            query: User query
+            n_results: Number of results to retrieve
+            where: Optional Chroma metadata filter
+            
+        Returns:
+            Search results, best first
+        """
+        result_lists = self.vector_store.search_many(self._query_variants(query), n_results=n_results, where=where)
+        return self._merge_results(result_lists, n_results)
+    
+    async def _aget_relevant_results(self, query: str, n_results: int = 3, where: Optional[Dict] = None) -> List[Dict]:
+        """Async _get_relevant_results: all query variants are searched together off the event loop."""
+        result_lists = await self.vector_store.asearch_many(self._query_variants(query), n_results=n_results, where=where)
+        return self._merge_results(result_lists, n_results)
+    
+    def _get_relevant_context(self, query: str, n_results: int = 3, where: Optional[Dict] = None) -> str:
+        """Retrieve relevant context from the vector store.
+        
+        Args:
+            query: User query
+            n_results: Number of results to retrieve
+            where: Optional Chroma metadata filter
+            
+        Returns:
+            String containing relevant context
+        """
+        return self._format_context(self._get_relevant_results(query, n_results, where))
+    
+    async def _aget_relevant_context(self, query: str, n_results: int = 3, where: Optional[Dict] = None) -> str:
+        """Async _get_relevant_context."""
+        return self._format_context(await self._aget_relevant_results(query, n_results, where))
+    
+    def prefetch_context(self, query: str) -> None:
+        """Start retrieving context for an upcoming query in the background.
+        
+        Call it while the current answer is still streaming; the next chat/chat_stream
+        call for the same query then picks up the result instead of searching again. A new
+        prefetch replaces the pending one, cancelling it if its search has not started.
+        
+        Args:
+            query: The user's next question
+        """
+        if self._prefetched is not None:
+            if self._prefetched[0] == query:
+                return
+            self._prefetched[1].cancel()
+        self._prefetched = (query, self.vector_store._thread_pool().submit(
+            self._get_relevant_results, query, self.n_candidates))
+    
+    def _take_prefetch(self, user_input: str) -> Optional[Future]:
+        """Clear the pending prefetch, returning it if it was for user_input and cancelling it otherwise."""
+        if self._prefetched is None:
+            return None
+        query, future = self._prefetched
+        self._prefetched = None
+        if query == user_input:
+            return future
+        future.cancel()
+        return None
+    
+    def _build_messages(self, user_input: str, results: List[Dict]) -> List[Dict]:
+        """Prepare messages for the API call: system prompt, history, then context and question,
+        packed into the context packer's token budget."""
+        messages, self.last_prompt_stats = self.context_packer.pack(
+            self.system_prompt, user_input, self.conversation_history, results)
+        return messages
+    
+    def _record_turn(self, user_input: str, assistant_response: str) -> None:
+        """Update conversation history."""
+        self.conversation_history.extend([
+            {"role": "user", "content": user_input},
+            {"role": "assistant", "content": assistant_response}
+        ])
+        
+        # Keep only as much history as the prompt budget can ever use
+        self.conversation_history = self.context_packer.trim_history(
+            self.conversation_history, self.context_packer.history_tokens)
+    
+    def _retrieve(self, user_input: str) -> List[Dict]:
+        """Ranked candidate chunks for user_input, from a prefetch when one was started."""
+        future = self._take_prefetch(user_input)
+        results = future.result() if future is not None else self._get_relevant_results(user_input, self.n_candidates)
+        self._last_query = user_input
+        return results
+    
+    def _cached_answer(self, user_input: str, results: List[Dict]) -> Optional[str]:
+        """Answer cached for a near-identical question with the same retrieved sources."""
+        embedding = self.vector_store.embed_queries([user_input])[0]
+        return self.answer_cache.get(embedding, results)
+    
+    def _cache_answer(self, user_input: str, results: List[Dict], answer: str) -> None:
+        embedding = self.vector_store.embed_queries([user_input])[0]
+        self.answer_cache.put(user_input, embedding, results, answer, sources=self.last_prompt_stats['chunk_ids'])
+    
     def chat(self, user_input: str) -> str:
         """Process user input and generate a response.
         
@@ -62,21 +201,17 @@ class RAGChatbot:
             Assistant's response
         """
         # Get relevant context
-        context = self._get_relevant_context(user_input)
-        
-        # Prepare messages for the API call
-        messages = [
-            {"role": "system", "content": self.system_prompt},
-            {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {user_input}"}
-        ]
-        
-        # Add conversation history if it exists
-        messages.extend(self.conversation_history)
+        results = self._retrieve(user_input)
+        cached = self._cached_answer(user_input, results)
+        if cached is not None:
+            self._record_turn(user_input, cached)
+            return cached
+        messages = self._build_messages(user_input, results)
         
         try:
             # Generate response using OpenAI
             response = self.client.chat.completions.create(
-                model="gpt-4-turbo-preview",  # You can change this to a different model
+                model=self.model,
                 messages=messages,
                 temperature=0.7,
                 max_tokens=500
@@ -84,21 +219,99 @@ class RAGChatbot:
             
             # Get the response content
             assistant_response = response.choices[0].message.content
-            
-            # Update conversation history
-            self.conversation_history.extend([
-                {"role": "user", "content": user_input},
-                {"role": "assistant", "content": assistant_response}
-            ])
-            
-            # Keep only last 6 messages in history to manage context window
-            if len(self.conversation_history) > 6:
-                self.conversation_history = self.conversation_history[-6:]
-            
+            self._record_turn(user_input, assistant_response)
+            self._cache_answer(user_input, results, assistant_response)
             return assistant_response
             
         except Exception as e:
             return f"Error generating response: {str(e)}"
+    
+    def chat_stream(self, user_input: str) -> Iterator[str]:
+        """Process user input and yield the response as it is generated.
+        
+        Generation starts as soon as retrieval finishes and each token is yielded as it
+        arrives, so the first words show up after one round trip rather than after the
+        whole answer. The turn is added to the history once the stream completes.
+        
+        Args:
+            user_input: User's question or message
+            
+        Yields:
+            Pieces of the assistant's response
+        """
+        results = self._retrieve(user_input)
+        cached = self._cached_answer(user_input, results)
+        if cached is not None:
+            yield cached
+            self._record_turn(user_input, cached)
+            return
+        messages = self._build_messages(user_input, results)
+        
+        pieces = []
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=500,
+                stream=True
+            )
+            for chunk in stream:
+                token = chunk.choices[0].delta.content if chunk.choices else None
+                if token:
+                    pieces.append(token)
+                    yield token
+        except Exception as e:
+            yield f"Error generating response: {str(e)}"
+            return
+        
+        answer = "".join(pieces)
+        self._record_turn(user_input, answer)
+        self._cache_answer(user_input, results, answer)
+    
+    async def achat_stream(self, user_input: str) -> AsyncIterator[str]:
+        """Async chat_stream: retrieval runs off the event loop and tokens come from AsyncOpenAI.
+        
+        Args:
+            user_input: User's question or message
+            
+        Yields:
+            Pieces of the assistant's response
+        """
+        future = self._take_prefetch(user_input)
+        if future is not None:
+            results = await asyncio.wrap_future(future)
+        else:
+            results = await self._aget_relevant_results(user_input, self.n_candidates)
+        self._last_query = user_input
+        cached = self._cached_answer(user_input, results)
+        if cached is not None:
+            yield cached
+            self._record_turn(user_input, cached)
+            return
+        messages = self._build_messages(user_input, results)
+        
+        pieces = []
+        try:
+            stream = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=500,
+                stream=True
+            )
+            async for chunk in stream:
+                token = chunk.choices[0].delta.content if chunk.choices else None
+                if token:
+                    pieces.append(token)
+                    yield token
+        except Exception as e:
+            yield f"Error generating response: {str(e)}"
+            return
+        
+        answer = "".join(pieces)
+        self._record_turn(user_input, answer)
+        self._cache_answer(user_input, results, answer)
 
 def main():
     """Run an interactive chat session."""
@@ -117,14 +330,27 @@ def main():
         user_input = input("\nYou: ").strip()
         
         if user_input.lower() in ['quit', 'exit']:
+            query_cache = chatbot.vector_store.query_cache
+            stats = query_cache.stats()
+            print(f"\nQuery cache: {stats['hits']} hits, {stats['misses']} misses "
+                  f"({stats['hit_rate']:.0%} hit rate)")
+            if query_cache.persist_path:
+                query_cache.save()
+            answer_stats = chatbot.answer_cache.stats()
+            print(f"Answer cache: {answer_stats['hits']} hits, {answer_stats['misses']} misses "
+                  f"({answer_stats['hit_rate']:.0%} hit rate)")
+            if chatbot.answer_cache.persist_path:
+                chatbot.answer_cache.save()
             print("\nGoodbye!")
             break
         
         if not user_input:
             continue
         
-        response = chatbot.chat(user_input)
-        print(f"\nAssistant: {response}")
+        print("\nAssistant: ", end="", flush=True)
+        for token in chatbot.chat_stream(user_input):
+            print(token, end="", flush=True)
+        print()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
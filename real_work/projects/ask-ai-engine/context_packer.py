@@ -0,0 +1,174 @@
+import re
+from typing import Dict, List, Tuple
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Words, numbers and single punctuation marks; long words are split roughly the way BPE does
+_TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+
+# ChatML framing the API adds around each message, and the priming for the reply
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_OVERHEAD_TOKENS = 3
+
+_encoding = None
+_encoding_loaded = False
+
+def _get_encoding():
+    """cl100k_base when tiktoken and its BPE file are available, else None."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        if tiktoken is not None:
+            try:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                print(f"Error loading tiktoken encoding, estimating token counts instead: {e}")
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in text, counted locally.
+
+    Uses tiktoken's cl100k_base when it can be loaded. Otherwise words and punctuation
+    marks count as one token each, plus one more per 4 characters beyond the first 4 of a
+    word, a rough stand-in for cl100k on English prose.
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(1 + max(0, len(piece) - 4) // 4 for piece in _TOKEN_PIECES.findall(text))
+
+def count_message_tokens(messages: List[Dict]) -> int:
+    """Prompt tokens for a chat-completions message list."""
+    return sum(count_tokens(m['content']) + MESSAGE_OVERHEAD_TOKENS for m in messages) + REPLY_OVERHEAD_TOKENS
+
+class ContextPacker:
+    """Builds chat prompts that fit a token budget.
+
+    History is kept newest first while it fits history_tokens, then ranked chunks fill
+    whatever is left of max_prompt_tokens. Chunks that repeat text already packed (the
+    chunk overlap, or a chunk stored under several files) are trimmed or dropped first.
+    """
+
+    def __init__(self, max_prompt_tokens: int = 1500, history_tokens: int = 400,
+                 chunk_overlap: int = 80, min_overlap: int = 20):
+        """Initialize the packer.
+
+        Args:
+            max_prompt_tokens: Budget for the whole prompt, excluding the answer
+            history_tokens: Part of the budget that conversation history may use
+            chunk_overlap: Characters adjacent chunks share (DenseVectorStore.chunk_text's chunk_overlap)
+            min_overlap: Shortest shared edge that is trimmed, so a stray common word is not
+        """
+        self.max_prompt_tokens = max_prompt_tokens
+        self.history_tokens = history_tokens
+        self.chunk_overlap = chunk_overlap
+        self.min_overlap = min_overlap
+
+    def _shared_edge(self, first: str, second: str) -> int:
+        """Length of the longest suffix of first that is also a prefix of second."""
+        # chunk_text strips chunks, so the shared edge can be a few characters short
+        for k in range(min(self.chunk_overlap, len(first), len(second)), self.min_overlap - 1, -1):
+            if first.endswith(second[:k]):
+                return k
+        return 0
+
+    def dedupe(self, results: List[Dict]) -> List[Dict]:
+        """Drop repeated chunks and trim the text a chunk shares with one ranked above it.
+
+        Args:
+            results: Search results in rank order, as returned by DenseVectorStore.search
+
+        Returns:
+            Results in the same order; trimmed ones carry a copy with the shortened chunk
+        """
+        kept = []
+        seen_text = set()
+        for result in results:
+            text = result['chunk']
+            if text in seen_text:
+                continue
+            seen_text.add(text)
+
+            for other in kept:
+                if other['metadata'].get('file_path') != result['metadata'].get('file_path'):
+                    continue
+                if text in other['chunk']:
+                    text = ''
+                    break
+                head = self._shared_edge(other['chunk'], text)
+                if head:
+                    text = text[head:]
+                tail = self._shared_edge(text, other['chunk'])
+                if tail:
+                    text = text[:-tail]
+
+            text = text.strip()
+            if text:
+                kept.append(result if text == result['chunk'] else dict(result, chunk=text))
+        return kept
+
+    def trim_history(self, history: List[Dict], budget: int) -> List[Dict]:
+        """Newest history messages whose tokens fit the budget, in their original order.
+
+        Messages are dropped in user/assistant pairs so the kept history never starts
+        with an orphaned answer.
+        """
+        kept = []
+        used = 0
+        for i in range(len(history) - 1, -1, -2):
+            pair = history[max(0, i - 1):i + 1]
+            cost = sum(count_tokens(m['content']) + MESSAGE_OVERHEAD_TOKENS for m in pair)
+            if used + cost > budget:
+                break
+            kept[:0] = pair
+            used += cost
+        return kept
+
+    def pack(self, system_prompt: str, question: str, history: List[Dict],
+             results: List[Dict]) -> Tuple[List[Dict], Dict]:
+        """Build the messages for one turn.
+
+        Args:
+            system_prompt: System message content
+            question: The user's current question
+            history: Previous user/assistant messages, oldest first
+            results: Candidate chunks in rank order
+
+        Returns:
+            (messages, stats) where stats has prompt_tokens, history_messages, chunks,
+            chunk_ids (the packed chunks) and candidate_chunks
+        """
+        fixed = [{"role": "system", "content": system_prompt},
+                 {"role": "user", "content": f"Context:\n\n\nQuestion: {question}"}]
+        used = count_message_tokens(fixed)
+
+        history = self.trim_history(history, min(self.history_tokens, self.max_prompt_tokens - used))
+        used += sum(count_tokens(m['content']) + MESSAGE_OVERHEAD_TOKENS for m in history)
+
+        # Fill the rest with chunks in rank order; a chunk that does not fit is skipped so a
+        # shorter one ranked below it can still use the space
+        pieces = []
+        chunk_ids = []
+        for result in self.dedupe(results):
+            piece = f"From {result['metadata']['file_path']}:\n{result['chunk']}"
+            cost = count_tokens(piece) + (2 if pieces else 0)
+            if used + cost > self.max_prompt_tokens:
+                continue
+            pieces.append(piece)
+            chunk_ids.append(result['id'])
+            used += cost
+
+        context = "\n\n".join(pieces)
+        messages = [fixed[0], *history,
+                    {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {question}"}]
+        stats = {
+            'prompt_tokens': count_message_tokens(messages),
+            'history_messages': len(history),
+            'chunks': len(pieces),
+            'chunk_ids': chunk_ids,
+            'candidate_chunks': len(results),
+        }
+        return messages, stats
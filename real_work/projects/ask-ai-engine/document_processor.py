@@ -1,24 +1,100 @@
-from typing import List, Any, Tuple, Dict
+from typing import List, Any, Tuple, Dict, Optional, Sequence
 import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
 import pdfplumber
+import pypdfium2
 from pdf2image import convert_from_path
-import io
-import base64
+from pdf2image.exceptions import PDFInfoNotInstalledError
 from PIL import Image
 from tqdm import tqdm
 import streamlit as st
 
+class PageTimeout(Exception):
+    """Raised inside a page's table extraction once it runs past the page timeout."""
+
+@contextmanager
+def _time_limit(seconds: Optional[float]):
+    """Raise PageTimeout in the block after seconds, using SIGALRM.
+    
+    SIGALRM only exists on POSIX and signal handlers can only be installed from the main
+    thread, so elsewhere (worker threads, Windows) the block runs without a limit.
+    """
+    if not seconds:
+        yield
+        return
+    if not hasattr(signal, 'SIGALRM') or threading.current_thread() is not threading.main_thread():
+        _warn_no_time_limit()
+        yield
+        return
+    
+    def on_alarm(signum, frame):
+        raise PageTimeout()
+    
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        # None means the previous handler was not installed from Python
+        signal.signal(signal.SIGALRM, previous if previous is not None else signal.SIG_DFL)
+
+_warned_no_time_limit = False
+
+def _warn_no_time_limit():
+    """Say once per process that page timeouts are off, rather than on every page."""
+    global _warned_no_time_limit
+    if not _warned_no_time_limit:
+        _warned_no_time_limit = True
+        print("Warning: page_timeout needs SIGALRM on the main thread; extracting pages without a time limit")
+
+def _extract_page_range(file_path: str, page_numbers: Sequence[int], page_timeout: Optional[float],
+                        progress: bool = False) -> List[Dict[str, Any]]:
+    """Extract text and tables from some pages of a PDF with a handle of its own.
+    
+    A page whose table extraction exceeds page_timeout keeps its text, gets no tables and
+    is flagged with tables_timed_out.
+    """
+    pages = []
+    with pdfplumber.open(file_path) as pdf:
+        for page_number in tqdm(page_numbers, desc="Processing pages", disable=not progress):
+            page = pdf.pages[page_number - 1]
+            text = page.extract_text()
+            result = {'page_number': page_number, 'text': text.strip() if text else '', 'tables': []}
+            try:
+                with _time_limit(page_timeout):
+                    result['tables'] = page.extract_tables() or []
+            except PageTimeout:
+                print(f"Warning: tables on page {page_number} of {file_path} took over {page_timeout}s; "
+                      f"keeping its text only")
+                result['tables_timed_out'] = True
+            pages.append(result)
+    return pages
+
 class DocumentProcessor:
     """Handles the processing of PDF documents, extracting text, tables, and images."""
     
-    def __init__(self, output_path: str = "./content/"):
+    def __init__(self, output_path: str = "./content/", page_workers: int = 1,
+                 page_timeout: Optional[float] = None):
         """Initialize the document processor.
         
         Args:
             output_path: Directory to store temporary files and processed content
+            page_workers: Processes that extract pages of one document in parallel; 1 extracts
+                them in this process
+            page_timeout: Seconds a page's table extraction may take before the page is kept
+                text-only; None for no limit
         """
         self.output_path = output_path
         os.makedirs(output_path, exist_ok=True)
+        self.page_workers = page_workers
+        self.page_timeout = page_timeout
+        self._page_pool = None
+        self._poppler_available = True
     
     def process_pdf(self, file_path: str, extract_images: bool = True) -> Tuple[List[str], List[List[List[str]]], List[str]]:
         """Process a PDF file and extract its contents.
@@ -28,47 +104,136 @@ class DocumentProcessor:
             extract_images: Whether to extract images from the PDF
             
         Returns:
-            Tuple containing lists of (texts, tables, images)
+            Tuple containing lists of (texts, tables, PNG paths of the rendered pages)
         """
         print(f"Processing PDF: {file_path}")
         
         texts = []
         tables = []
-        images_b64 = []
-        
-        # Extract text and tables using pdfplumber
-        with pdfplumber.open(file_path) as pdf:
-            for page in tqdm(pdf.pages, desc="Processing pages"):
-                # Extract text
-                text = page.extract_text()
-                if text and text.strip():
-                    texts.append(text.strip())
-                
-                # Extract tables
-                page_tables = page.extract_tables()
-                if page_tables:
-                    tables.extend(page_tables)
-        
-        # Extract images using pdf2image if requested
+        images = []
+        
+        for page in self.extract_pages(file_path):
+            if page['text']:
+                texts.append(page['text'])
+            tables.extend(page['tables'])
+        
+        # Render page images to disk if requested
         if extract_images:
+            images = self.extract_images(file_path)
+        
+        print(f"Extracted {len(texts)} text chunks, {len(tables)} tables, and {len(images)} images")
+        return texts, tables, images
+    
+    def extract_pages(self, file_path: str) -> List[Dict[str, Any]]:
+        """Extract text and tables page by page.
+        
+        Args:
+            file_path: Path to the PDF file
+            
+        Pages are split into contiguous runs that page_workers processes extract in parallel,
+        each opening its own handle on the file. Tables of a page that take longer than
+        page_timeout are skipped and the page is flagged with tables_timed_out.
+        
+        Returns:
+            One dict per page with page_number (1-based), text (stripped, '' when empty) and tables
+        """
+        pdf = pypdfium2.PdfDocument(file_path)
+        page_numbers = list(range(1, len(pdf) + 1))
+        pdf.close()
+        
+        if self.page_workers <= 1 or len(page_numbers) < 2:
+            return _extract_page_range(file_path, page_numbers, self.page_timeout, progress=True)
+        
+        # Twice as many runs as workers, so one slow run does not leave the others idle
+        run_length = -(-len(page_numbers) // (self.page_workers * 2))
+        runs = [page_numbers[i:i + run_length] for i in range(0, len(page_numbers), run_length)]
+        if self._page_pool is None:
+            self._page_pool = ProcessPoolExecutor(max_workers=self.page_workers)
+        results = self._page_pool.map(_extract_page_range, [file_path] * len(runs), runs,
+                                      [self.page_timeout] * len(runs))
+        return [page for run in results for page in run]
+    
+    def close(self) -> None:
+        """Shut down the page worker pool, if one was started."""
+        if self._page_pool is not None:
+            self._page_pool.shutdown()
+            self._page_pool = None
+    
+    def extract_images(self, file_path: str) -> List[str]:
+        """Render every page to a PNG file under output_path.
+        
+        Args:
+            file_path: Path to the PDF file
+            
+        Returns:
+            One PNG path per page; empty if rendering fails
+        """
+        try:
+            return self.render_pages(file_path)
+        except Exception as e:
+            print(f"Warning: Failed to extract images: {str(e)}")
+            return []
+    
+    def render_pages(self, file_path: str, page_numbers: Optional[Sequence[int]] = None, dpi: int = 200,
+                     thread_count: Optional[int] = None, output_dir: Optional[str] = None) -> List[str]:
+        """Render only the requested pages, writing each PNG straight to disk.
+        
+        Pages are rendered in parallel with pdf2image's thread_count (one pdftoppm process per
+        thread). Without poppler installed, pdfium (shipped with pdfplumber) renders them in a
+        pool of thread_count processes instead. No page image is kept in memory.
+        
+        Args:
+            file_path: Path to the PDF file
+            page_numbers: 1-based pages to render; all pages when None
+            dpi: Rendering resolution
+            thread_count: Pages rendered concurrently; defaults to the CPU count, at most 4
+            output_dir: Directory for the PNGs; defaults to output_path/<file stem>
+            
+        Returns:
+            PNG paths in page order
+        """
+        output_dir = output_dir or os.path.join(self.output_path, Path(file_path).stem)
+        os.makedirs(output_dir, exist_ok=True)
+        thread_count = thread_count or min(4, os.cpu_count() or 1)
+        
+        if page_numbers is None:
+            pdf = pypdfium2.PdfDocument(file_path)
+            page_numbers = range(1, len(pdf) + 1)
+            pdf.close()
+        page_numbers = sorted(set(page_numbers))
+        if not page_numbers:
+            return []
+        
+        if self._poppler_available:
             try:
-                # Convert PDF pages to images
-                pages = convert_from_path(file_path)
-                
-                for i, page in enumerate(pages):
-                    # Save image to bytes
-                    img_byte_arr = io.BytesIO()
-                    page.save(img_byte_arr, format='PNG')
-                    img_byte_arr = img_byte_arr.getvalue()
-                    
-                    # Convert to base64
-                    img_b64 = base64.b64encode(img_byte_arr).decode('utf-8')
-                    images_b64.append(img_b64)
-            except Exception as e:
-                print(f"Warning: Failed to extract images: {str(e)}")
-        
-        print(f"Extracted {len(texts)} text chunks, {len(tables)} tables, and {len(images_b64)} images")
-        return texts, tables, images_b64
+                return self._render_with_poppler(file_path, page_numbers, dpi, thread_count, output_dir)
+            except PDFInfoNotInstalledError:
+                self._poppler_available = False
+        return _render_with_pdfium(file_path, page_numbers, dpi, thread_count, output_dir)
+    
+    def _render_with_poppler(self, file_path: str, page_numbers: List[int], dpi: int, thread_count: int,
+                             output_dir: str) -> List[str]:
+        paths = []
+        # pdf2image renders page ranges, so split the pages into contiguous runs
+        runs = []
+        for page_number in page_numbers:
+            if runs and page_number == runs[-1][1] + 1:
+                runs[-1][1] = page_number
+            else:
+                runs.append([page_number, page_number])
+        for first_page, last_page in runs:
+            paths.extend(convert_from_path(
+                file_path,
+                dpi=dpi,
+                output_folder=output_dir,
+                first_page=first_page,
+                last_page=last_page,
+                fmt='png',
+                output_file=f"page-{first_page:04d}-",
+                thread_count=min(thread_count, last_page - first_page + 1),
+                paths_only=True
+            ))
+        return paths
     
     def process_directory(self, directory_path: str) -> Dict[str, Tuple[List[str], List[List[List[str]]], List[str]]]:
         """Process all PDF files in a directory.
@@ -90,6 +255,39 @@ class DocumentProcessor:
                     continue
         return results
 
+def _render_pdfium_pages(file_path: str, page_numbers: List[int], dpi: int, output_dir: str) -> List[str]:
+    """Render pages with pdfium, holding one page bitmap at a time."""
+    paths = []
+    pdf = pypdfium2.PdfDocument(file_path)
+    try:
+        for page_number in page_numbers:
+            page = pdf[page_number - 1]
+            bitmap = page.render(scale=dpi / 72)
+            path = os.path.join(output_dir, f"page-{page_number:04d}.png")
+            bitmap.to_pil().save(path, format='PNG')
+            bitmap.close()
+            page.close()
+            paths.append(path)
+    finally:
+        pdf.close()
+    return paths
+
+def _render_with_pdfium(file_path: str, page_numbers: List[int], dpi: int, workers: int,
+                        output_dir: str) -> List[str]:
+    """Render pages across worker processes (pdfium is not thread-safe); paths in page order."""
+    workers = min(workers, len(page_numbers))
+    if workers <= 1:
+        return _render_pdfium_pages(file_path, page_numbers, dpi, output_dir)
+    
+    # Interleave pages so every worker gets a similar mix of light and heavy pages
+    shares = [page_numbers[i::workers] for i in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        rendered = pool.map(_render_pdfium_pages, [file_path] * workers, shares, [dpi] * workers,
+                            [output_dir] * workers)
+        by_page = {page_number: path for share, paths in zip(shares, rendered)
+                   for page_number, path in zip(share, paths)}
+    return [by_page[page_number] for page_number in page_numbers]
+
 def main():
     """Streamlit frontend for PDF processing"""
     st.title("PDF Document Processor")
@@ -130,8 +328,8 @@ def main():
         # Show images
         if images:
             st.subheader("Extracted Images")
-            for i, img_b64 in enumerate(images):
-                st.image(img_b64, caption=f"Image {i+1}")
+            for i, image_path in enumerate(images):
+                st.image(image_path, caption=f"Image {i+1}")
         
         # Cleanup
         os.remove("temp.pdf")
@@ -0,0 +1,160 @@
+import ast
+from typing import Dict, Iterator, List, Optional, Sequence
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# One row per page. Document-level columns repeat on every page of the document and
+# compress to almost nothing (dictionary + run-length encoding).
+EXTRACTION_SCHEMA = pa.schema([
+    ('file_path', pa.string()),
+    ('num_pages', pa.int32()),  # null where the inventory has no page count
+    ('page_number', pa.int32()),  # 1-based; null for rows converted from the whole-document CSV
+    ('text', pa.string()),
+    ('tables', pa.list_(pa.list_(pa.list_(pa.string())))),  # tables -> rows -> cells (None for empty cells)
+    ('extracted_images', pa.int32()),
+])
+
+class ExtractionWriter:
+    """Append-only Parquet writer of per-page extraction rows.
+
+    Rows are buffered and written as row groups of row_group_size rows, so memory stays
+    bounded however many documents are written.
+    """
+
+    def __init__(self, path: str, row_group_size: int = 2048):
+        """Open path for writing.
+
+        Args:
+            path: Parquet file to create (overwritten if it exists)
+            row_group_size: Pages per row group; readers stream one row group at a time
+        """
+        self.path = path
+        self.row_group_size = row_group_size
+        self._writer = pq.ParquetWriter(path, EXTRACTION_SCHEMA, compression='zstd',
+                                        use_dictionary=['file_path'])
+        self._rows = []
+        self.rows_written = 0
+
+    def write_document(self, file_path: str, num_pages: Optional[float], pages: List[Dict],
+                       extracted_images: int = 0) -> None:
+        """Add one document.
+
+        Args:
+            file_path: Source file
+            num_pages: Page count from the inventory; pandas hands it over as a float,
+                NaN when missing, and it is stored as an int32 (null for NaN)
+            pages: DocumentProcessor.extract_pages output: dicts with page_number, text and tables
+            extracted_images: Number of page images rendered for the document
+        """
+        num_pages = None if num_pages is None or pd.isna(num_pages) else int(num_pages)
+        for page in pages:
+            self._rows.append({
+                'file_path': file_path,
+                'num_pages': num_pages,
+                'page_number': page['page_number'],
+                'text': page['text'],
+                'tables': page['tables'],
+                'extracted_images': extracted_images,
+            })
+        if len(self._rows) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if self._rows:
+            self._writer.write_table(pa.Table.from_pylist(self._rows, schema=EXTRACTION_SCHEMA),
+                                     row_group_size=self.row_group_size)
+            self.rows_written += len(self._rows)
+            self._rows = []
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_batches(path: str, columns: Optional[Sequence[str]] = None,
+                 batch_size: int = 1024) -> Iterator[pa.RecordBatch]:
+    """Stream record batches, reading only the requested columns from disk.
+
+    Args:
+        path: Parquet file written by ExtractionWriter
+        columns: Columns to read, e.g. ['file_path', 'text']; all when None
+        batch_size: Maximum rows per batch
+
+    Yields:
+        pyarrow RecordBatches
+    """
+    parquet_file = pq.ParquetFile(path)
+    yield from parquet_file.iter_batches(batch_size=batch_size, columns=list(columns) if columns else None)
+
+def iter_document_frames(path: str, documents_per_frame: int = 500,
+                         batch_size: int = 1024) -> Iterator[pd.DataFrame]:
+    """Stream whole documents in the extractions CSV layout.
+
+    Pages are joined back into one extracted_text per document (non-empty pages, newline
+    separated, as the CSV stores them), so CSV consumers can switch to Parquet unchanged.
+
+    Args:
+        path: Parquet file written by ExtractionWriter
+        documents_per_frame: Documents per yielded DataFrame
+        batch_size: Rows per record batch read from disk
+
+    Yields:
+        DataFrames with file_path, num_pages and extracted_text columns
+    """
+    documents = []
+    current = None
+    for batch in read_batches(path, ['file_path', 'num_pages', 'text'], batch_size):
+        for file_path, num_pages, text in zip(*(batch.column(i).to_pylist() for i in range(3))):
+            # A writer's pages are contiguous per document
+            if current is None or current['file_path'] != file_path:
+                if current is not None:
+                    documents.append(current)
+                    if len(documents) >= documents_per_frame:
+                        yield _documents_frame(documents)
+                        documents = []
+                current = {'file_path': file_path, 'num_pages': num_pages, 'texts': []}
+            if text:
+                current['texts'].append(text)
+    if current is not None:
+        documents.append(current)
+    if documents:
+        yield _documents_frame(documents)
+
+def _documents_frame(documents: List[Dict]) -> pd.DataFrame:
+    return pd.DataFrame({
+        'file_path': [d['file_path'] for d in documents],
+        'num_pages': [d['num_pages'] for d in documents],
+        'extracted_text': ['\n'.join(d['texts']) for d in documents],
+    })
+
+def csv_to_parquet(csv_path: str, parquet_path: str, chunksize: int = 500) -> int:
+    """Convert an existing extractions CSV, one row per document since its pages are already joined.
+
+    str(tables) cells are parsed back into structured tables.
+
+    Returns:
+        Number of documents converted
+    """
+    documents = 0
+    # Whole-document rows are ~20x larger than page rows, so use smaller row groups
+    with ExtractionWriter(parquet_path, row_group_size=128) as writer:
+        for rows in pd.read_csv(csv_path, chunksize=chunksize):
+            for row in rows.itertuples(index=False):
+                tables = []
+                if isinstance(row.extracted_tables, str) and row.extracted_tables:
+                    try:
+                        tables = ast.literal_eval(row.extracted_tables)
+                    except (ValueError, SyntaxError) as e:
+                        print(f"Error parsing tables of {row.file_path}: {e}")
+                text = row.extracted_text if isinstance(row.extracted_text, str) else ''
+                images = int(row.extracted_images) if pd.notna(row.extracted_images) else 0
+                writer.write_document(row.file_path, row.num_pages,
+                                      [{'page_number': None, 'text': text, 'tables': tables}], images)
+                documents += 1
+    return documents
@@ -0,0 +1,158 @@
+import argparse
+import json
+import time
+import numpy as np
+from indexin import FlatIndex, LSHIndex, IVFIndex, IVFPQIndex, HNSWIndex, INDEX_CLASSES
+
+# (index class, build params, query-time sweeps). Build params need a rebuild per value;
+# sweeps are applied with set_search_params on the already built index.
+DEFAULT_GRID = [
+    (FlatIndex, {}, {}),
+    (LSHIndex, {'n_bits': 12, 'n_tables': 32}, {'n_probes': [0, 4, 8, 12]}),
+    (LSHIndex, {'n_bits': 14, 'n_tables': 48}, {'n_probes': [4, 8, 12, 16]}),
+    (IVFIndex, {}, {'nprobe': [1, 2, 4, 8, 16, 32, 64, 128]}),
+    (IVFPQIndex, {'n_subquantizers': 16}, {'nprobe': [1, 2, 4, 8, 16, 32, 64]}),
+    (IVFPQIndex, {'n_subquantizers': 32}, {'nprobe': [1, 2, 4, 8, 16, 32, 64]}),
+    (IVFPQIndex, {'n_subquantizers': 64}, {'nprobe': [1, 2, 4, 8, 16, 32, 64]}),
+    (HNSWIndex, {'M': 16}, {'efSearch': [16, 32, 64, 128, 256]}),
+    (HNSWIndex, {'M': 32}, {'efSearch': [16, 32, 64, 128, 256]}),
+]
+
+def recall_at_k(ground_truth, indices):
+    """Fraction of the exact top-k neighbours that the approximate search also returned."""
+    k = ground_truth.shape[1]
+    hits = sum(len(set(gt_row) & set(row[:k])) for gt_row, row in zip(ground_truth, indices))
+    return hits / ground_truth.size
+
+def measure_search(vector_index, queries, ground_truth, top_k):
+    """Recall, per-query latency percentiles and batched throughput for a built index."""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        vector_index.search(query, top_k)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    _, indices = vector_index.search_batch(queries, top_k)
+    batch_time = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'recall_at_k': round(recall_at_k(ground_truth, indices), 4),
+        'p50_ms': round(float(np.percentile(latencies_ms, 50)), 4),
+        'p99_ms': round(float(np.percentile(latencies_ms, 99)), 4),
+        'batch_qps': round(len(queries) / batch_time, 1),
+    }
+
+def run_benchmark(embeddings, queries, top_k=10, grid=None):
+    """Build every index config in the grid and measure it against exact FlatIndex results."""
+    grid = DEFAULT_GRID if grid is None else grid
+    dim = embeddings.shape[1]
+
+    exact = FlatIndex(dim)
+    exact.build_index(embeddings)
+    _, ground_truth = exact.search_batch(queries, top_k)
+
+    results = []
+    for index_cls, build_params, sweeps in grid:
+        vector_index = index_cls(dim, **build_params)
+        start = time.perf_counter()
+        vector_index.build_index(embeddings)
+        build_time = time.perf_counter() - start
+        if vector_index.index is None:
+            print(f"Skipping {index_cls.__name__} {build_params}: build failed")
+            continue
+
+        base = {
+            'index_type': index_cls.__name__,
+            'build_params': build_params,
+            'build_s': round(build_time, 3),
+            'memory_bytes': vector_index.memory_bytes(),
+        }
+
+        # Expand the sweep dict into one search-param combination per point
+        combos = [{}]
+        for key, values in sweeps.items():
+            combos = [dict(combo, **{key: value}) for combo in combos for value in values]
+
+        for search_params in combos:
+            if search_params:
+                vector_index.set_search_params(**search_params)
+            row = dict(base, search_params=search_params, **measure_search(vector_index, queries, ground_truth, top_k))
+            results.append(row)
+            print(f"{row['index_type']:>10} {build_params} {search_params}: recall {row['recall_at_k']:.3f} | "
+                  f"p50 {row['p50_ms']:.3f}ms | p99 {row['p99_ms']:.3f}ms | {row['memory_bytes'] / 1e6:.1f} MB")
+
+    return results
+
+def auto_tune(embeddings, queries, target_recall=0.9, top_k=10, latency_budget_ms=None, grid=None):
+    """Pick the cheapest config (lowest p99, then memory) that reaches target_recall.
+
+    Returns a report dict with every measured config and the chosen one under 'best'
+    (None when nothing meets the target or latency budget).
+    """
+    results = run_benchmark(embeddings, queries, top_k, grid)
+    eligible = [r for r in results if r['recall_at_k'] >= target_recall]
+    if latency_budget_ms is not None:
+        eligible = [r for r in eligible if r['p99_ms'] <= latency_budget_ms]
+    best = min(eligible, key=lambda r: (r['p99_ms'], r['memory_bytes'])) if eligible else None
+
+    return {
+        'n_vectors': int(embeddings.shape[0]),
+        'dim': int(embeddings.shape[1]),
+        'n_queries': int(len(queries)),
+        'top_k': top_k,
+        'target_recall': target_recall,
+        'latency_budget_ms': latency_budget_ms,
+        'ground_truth': 'FlatIndex',
+        'best': best,
+        'results': results,
+    }
+
+def build_from_config(config, embeddings):
+    """Build the index described by a report entry, e.g. auto_tune(...)['best']."""
+    index_cls = INDEX_CLASSES[config['index_type']]
+    vector_index = index_cls(embeddings.shape[1], **config['build_params'])
+    vector_index.build_index(embeddings)
+    if config['search_params']:
+        vector_index.set_search_params(**config['search_params'])
+    return vector_index
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark indexin index types and pick the cheapest config meeting a recall target")
+    parser.add_argument('--embeddings', help='.npy file of corpus embeddings (random vectors if omitted)')
+    parser.add_argument('--queries', help='.npy file of query embeddings (sampled from the corpus if omitted)')
+    parser.add_argument('--n-vectors', type=int, default=50000, help='synthetic corpus size when --embeddings is omitted')
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--n-queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--target-recall', type=float, default=0.9)
+    parser.add_argument('--latency-budget-ms', type=float, default=None)
+    parser.add_argument('--output', default='index_tuning_report.json')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.embeddings:
+        embeddings = np.load(args.embeddings).astype('float32')
+    else:
+        embeddings = rng.standard_normal((args.n_vectors, args.dim)).astype('float32')
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    if args.queries:
+        queries = np.load(args.queries).astype('float32')
+    else:
+        # Perturbed corpus vectors behave more like real queries than fresh random ones
+        sample = embeddings[rng.choice(len(embeddings), args.n_queries, replace=False)]
+        queries = (sample + 0.1 * rng.standard_normal(sample.shape)).astype('float32')
+
+    report = auto_tune(embeddings, queries, args.target_recall, args.top_k, args.latency_budget_ms)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    best = report['best']
+    if best:
+        print(f"\nBest: {best['index_type']} {best['build_params']} {best['search_params']} "
+              f"(recall {best['recall_at_k']}, p99 {best['p99_ms']}ms)")
+    else:
+        print(f"\nNo config reached recall {args.target_recall}")
+    print(f"Report written to {args.output}")
@@ -1,17 +1,31 @@
 import numpy as np
-from sklearn.cluster import KMeans
 import faiss
-import torch
-from transformers import AutoTokenizer, AutoModel
-from sentence_transformers import SentenceTransformer
-from tqdm import tqdm
 import pickle
+import json
 import os
+import heapq
+import re
+import multiprocessing
+import threading
 import chardet
+from query_cache import shared_query_cache
+
+# Lookup table of everything str.split() splits on; U+3000 is the highest whitespace code point,
+# so codes are clipped to the trailing (False) slot
+_IS_WHITESPACE = np.array([chr(code).isspace() for code in range(0x3001)] + [False])
+_WHITESPACE = re.compile(r'\s')
+
+# Bump when the on-disk layout written by VectorIndex.save / ChunkStore.write changes
+INDEX_FORMAT_VERSION = 1
 
 class TextProcessor:
     """Process text documents for vector indexing."""
     
+    # chardet is slow on large inputs and a prefix is enough to tell encodings apart
+    DETECTION_BYTES = 64 * 1024
+    # iter_chunks finds word boundaries a block at a time to bound its working memory
+    BLOCK_CHARS = 1 << 20
+    
     def __init__(self, chunk_size=512, chunk_overlap=100):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
@@ -19,31 +33,72 @@ class TextProcessor:
     def extract_text_from_document(self, document_path):
         """Extract text from a document with automatic encoding detection."""
         try:
-            # First detect the encoding
             with open(document_path, 'rb') as file:
                 raw_data = file.read()
-                detected = chardet.detect(raw_data)
-                encoding = detected['encoding'] or 'utf-8'
-            
-            # Then read with the detected encoding
-            with open(document_path, 'r', encoding=encoding, errors='replace') as file:
-                return file.read()
+            return self.decode(raw_data)
         except Exception as e:
             print(f"Error reading file {document_path}: {e}")
             # Create a simple fallback if reading fails
             return "Sample text for indexing demonstration."
     
+    def decode(self, raw_data):
+        """Decode bytes as UTF-8 when valid, otherwise with the encoding chardet detects on a prefix."""
+        try:
+            # utf-8-sig also strips a leading byte order mark
+            return raw_data.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            detected = chardet.detect(raw_data[:self.DETECTION_BYTES])
+            encoding = detected['encoding'] or 'utf-8'
+            return raw_data.decode(encoding, errors='replace')
+    
+    def iter_chunks(self, text):
+        """Lazily yield (chunk, start, end) word windows with overlap; start/end are character offsets in text."""
+        step = max(1, self.chunk_size - self.chunk_overlap)
+        starts = ends = np.empty(0, dtype=np.int64)
+        for block_start, block_end in self._blocks(text):
+            block_starts, block_ends = self._word_spans(text[block_start:block_end])
+            starts = np.concatenate([starts, block_starts + block_start])
+            ends = np.concatenate([ends, block_ends + block_start])
+            i = 0
+            while len(starts) - i >= self.chunk_size:
+                yield self._span_chunk(text, starts[i], ends[i + self.chunk_size - 1])
+                i += step
+            starts, ends = starts[i:], ends[i:]
+        
+        # Remaining windows start inside the tail, as with the old words[i:i + chunk_size] loop
+        for i in range(0, len(starts), step):
+            yield self._span_chunk(text, starts[i], ends[min(i + self.chunk_size, len(ends)) - 1])
+    
+    def _blocks(self, text):
+        """(start, end) slices of about BLOCK_CHARS characters, cut at whitespace so no word straddles two."""
+        position = 0
+        while position < len(text):
+            end = position + self.BLOCK_CHARS
+            if end < len(text):
+                match = _WHITESPACE.search(text, end)
+                end = match.start() if match else len(text)
+            yield position, min(end, len(text))
+            position = end
+    
+    @staticmethod
+    def _word_spans(block):
+        """Start and end offsets of the whitespace-separated words in block, found with numpy."""
+        codes = np.frombuffer(block.encode('utf-32-le'), dtype='<u4')
+        in_word = np.zeros(len(codes) + 2, dtype=bool)
+        in_word[1:-1] = ~_IS_WHITESPACE[np.minimum(codes, len(_IS_WHITESPACE) - 1)]
+        edges = in_word[1:] != in_word[:-1]
+        boundaries = np.flatnonzero(edges)
+        # Edges alternate word start, word end, starting with a start
+        return boundaries[0::2], boundaries[1::2]
+    
+    @staticmethod
+    def _span_chunk(text, start, end):
+        """Chunk text for a span, with inner whitespace collapsed to single spaces like ' '.join(words)."""
+        return ' '.join(text[start:end].split()), int(start), int(end)
+    
     def chunk_text(self, text):
         """Split text into chunks with overlap."""
-        words = text.split()
-        chunks = []
-        
-        i = 0
-        while i < len(words):
-            chunk = ' '.join(words[i:i + self.chunk_size])
-            chunks.append(chunk)
-            i += self.chunk_size - self.chunk_overlap
-            
+        chunks = [chunk for chunk, _, _ in self.iter_chunks(text)]
         return chunks or ["Sample chunk for indexing demonstration."]
 
 class EmbeddingModel:
@@ -51,8 +106,12 @@ class EmbeddingModel:
     
     def __init__(self, model_name="sentence-transformers/all-mpnet-base-v2", use_mock=False):
         self.use_mock = use_mock or (os.environ.get("USE_MOCK_EMBEDDINGS", "false").lower() == "true")
+        self.model_name = model_name
         if not self.use_mock:
             try:
+                # Imported here so that processes that only search (such as ShardedIndex workers,
+                # which re-import this module) do not load torch
+                from sentence_transformers import SentenceTransformer
                 self.model = SentenceTransformer(model_name)
                 # Test the model to ensure it works
                 _ = self.model.encode("test")
@@ -60,226 +119,975 @@ class EmbeddingModel:
             except Exception as e:
                 print(f"Error loading model {model_name}: {e}. Using mock embeddings instead.")
                 self.model = None
+                self.model_name = "mock"
                 self.use_mock = True
                 self.embedding_dim = 384
         else:
             self.model = None
+            self.model_name = "mock"
             self.embedding_dim = 384
     
-    def generate_embeddings(self, chunks):
+    def generate_embeddings(self, chunks, batch_size=64):
         """Generate embeddings for a list of text chunks."""
-        embeddings = []
-        
         if self.model is None:
             # Mock embeddings for demonstration
             print("Using mock embeddings for demonstration")
-            for _ in tqdm(chunks, desc="Generating mock embeddings"):
-                embedding = np.random.randn(self.embedding_dim).astype('float32')
-                embedding = embedding / np.linalg.norm(embedding)  # Normalize
-                embeddings.append(embedding)
+            embeddings = np.random.randn(len(chunks), self.embedding_dim).astype('float32')
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)  # Normalize
         else:
-            # Real embeddings
-            for chunk in tqdm(chunks, desc="Generating embeddings"):
-                embedding = self.model.encode(chunk)
-                embeddings.append(embedding)
+            # Real embeddings, encoded in batches rather than one chunk per call
+            embeddings = self.model.encode(
+                list(chunks),
+                batch_size=batch_size,
+                show_progress_bar=len(chunks) > batch_size,
+                convert_to_numpy=True
+            )
         
-        return np.array(embeddings, dtype='float32')
+        return np.asarray(embeddings, dtype='float32').reshape(len(chunks), self.embedding_dim)
 
 class VectorIndex:
     """Base class for vector indexing methods."""
     
+    # FAISS (de)serialization entry points; binary-code indexes swap in the *_binary variants
+    _read_faiss_index = staticmethod(faiss.read_index)
+    _write_faiss_index = staticmethod(faiss.write_index)
+    _serialize_faiss_index = staticmethod(faiss.serialize_index)
+    
     def __init__(self, embedding_dim):
         self.embedding_dim = embedding_dim
         self.index = None
+        self.next_id = 0
+        self._mmapped_from = None
+    
+    def build_index(self, embeddings, ids=None):
+        """Build the index from embeddings, using row positions as ids unless ids are given."""
+        try:
+            self.index = None
+            self.next_id = 0
+            self.add(embeddings, np.arange(len(embeddings)) if ids is None else ids)
+        except Exception as e:
+            print(f"Error building {type(self).__name__}: {e}")
     
-    def build_index(self, embeddings):
-        """Build the index from embeddings."""
-        pass
+    def __len__(self):
+        """Number of vectors currently held by the index."""
+        return 0 if self.index is None else int(self.index.ntotal)
+    
+    def _create_index(self, embeddings):
+        """Return an empty, trained, id-mapped FAISS index; embeddings are only used for training."""
+        raise NotImplementedError
+    
+    def add(self, embeddings, ids=None):
+        """Add vectors under new int64 ids without rebuilding; ids default to the next free ones."""
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32').reshape(-1, self.embedding_dim)
+        if ids is None:
+            ids = np.arange(self.next_id, self.next_id + len(embeddings))
+        ids = np.asarray(ids, dtype='int64')
+        if len(ids) == 0:
+            return ids
+        
+        if self.index is None:
+            self.index = self._create_index(embeddings)
+        self._ensure_writable()
+        self.index.add_with_ids(embeddings, ids)
+        self.next_id = max(self.next_id, int(ids.max()) + 1)
+        return ids
+    
+    def remove(self, ids):
+        """Remove vectors by id; returns how many were removed."""
+        if self.index is None:
+            return 0
+        self._ensure_writable()
+        return int(self.index.remove_ids(np.asarray(ids, dtype='int64')))
+    
+    def _ensure_writable(self):
+        """Swap a memory-mapped (read-only) index for an in-memory copy before mutating it."""
+        if self._mmapped_from is not None:
+            self.index = self._read_faiss_index(self._mmapped_from)
+            self._mmapped_from = None
     
     def search(self, query_embedding, top_k=5):
         """Search the index with a query embedding."""
-        pass
+        distances, indices = self.search_batch(query_embedding.reshape(1, -1), top_k)
+        return distances[0], indices[0]
+    
+    def search_batch(self, query_embeddings, top_k=5):
+        """Search the index with a (n_queries, dim) matrix in a single FAISS call."""
+        n_queries = len(query_embeddings)
+        try:
+            if self.index is None or self.index.ntotal == 0:
+                return np.zeros((n_queries, top_k)), np.zeros((n_queries, top_k), dtype=int)
+            
+            query_embeddings = np.ascontiguousarray(query_embeddings, dtype='float32').reshape(-1, self.embedding_dim)
+            return self.index.search(query_embeddings, min(top_k, self.index.ntotal))
+        except Exception as e:
+            print(f"Error searching {type(self).__name__}: {e}")
+            return np.zeros((n_queries, top_k)), np.zeros((n_queries, top_k), dtype=int)
+    
+    def memory_bytes(self):
+        """Size of the serialized index, used as a proxy for its resident memory."""
+        if self.index is None:
+            return 0
+        return int(self._serialize_faiss_index(self.index).nbytes)
+    
+    def set_search_params(self, **params):
+        """Update query-time knobs such as nprobe or efSearch on a built index without rebuilding."""
+        parameter_space = faiss.ParameterSpace()
+        for key, value in params.items():
+            setattr(self, key, value)
+            if self.index is not None:
+                parameter_space.set_index_parameter(self.index, key, value)
     
     def save(self, path):
-        """Save the index to disk."""
-        with open(path, 'wb') as f:
-            pickle.dump(self.index, f)
-    
-    def load(self, path):
-        """Load the index from disk."""
-        with open(path, 'rb') as f:
-            self.index = pickle.load(f)
+        """Save the index to a versioned directory using FAISS native serialization."""
+        os.makedirs(path, exist_ok=True)
+        self._write_faiss_index(self.index, os.path.join(path, 'index.faiss'))
+        manifest = {
+            'format_version': INDEX_FORMAT_VERSION,
+            'index_type': type(self).__name__,
+            'params': self._params(),
+            'ntotal': int(self.index.ntotal),
+        }
+        with open(os.path.join(path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+    
+    def load(self, path, mmap=True):
+        """Load the index from disk, memory-mapping the FAISS data where the index type supports it."""
+        if os.path.isfile(path):
+            # Legacy layout: a single pickled index object
+            with open(path, 'rb') as f:
+                self.index = pickle.load(f)
+            self.next_id = int(self.index.ntotal)
+            return
+        
+        manifest = _read_manifest(path)
+        if manifest['index_type'] != type(self).__name__:
+            print(f"Warning: loading a {manifest['index_type']} index into {type(self).__name__}")
+        for key, value in manifest['params'].items():
+            setattr(self, key, value)
+        
+        index_path = os.path.join(path, 'index.faiss')
+        if mmap:
+            # IO_FLAG_MMAP_IFC maps flat code arrays (Flat/HNSW storage) in place; IVF inverted
+            # lists only support the plain IO_FLAG_MMAP reader, so fall back through both.
+            for flags in (faiss.IO_FLAG_MMAP | getattr(faiss, 'IO_FLAG_MMAP_IFC', 0), faiss.IO_FLAG_MMAP):
+                try:
+                    self.index = self._read_faiss_index(index_path, flags)
+                    self._mmapped_from = index_path
+                    return
+                except RuntimeError:
+                    continue
+            print(f"Memory-mapped load not supported for {manifest['index_type']}, reading into memory")
+        self.index = self._read_faiss_index(index_path)
+        self._mmapped_from = None
+    
+    def _params(self):
+        """Scalar constructor/tuning parameters to record alongside the serialized index."""
+        return {key: value for key, value in vars(self).items()
+                if not key.startswith('_') and isinstance(value, (bool, int, float, str))}
+
+def _read_manifest(path):
+    """Read path/manifest.json, checking it was written in a format version this code reads."""
+    with open(os.path.join(path, 'manifest.json')) as f:
+        manifest = json.load(f)
+    version = manifest.get('format_version')
+    if not isinstance(version, int) or version > INDEX_FORMAT_VERSION:
+        raise ValueError(f"Index at {path} uses format version {version!r}, "
+                         f"this code reads up to {INDEX_FORMAT_VERSION}")
+    return manifest
 
 class FlatIndex(VectorIndex):
     """Flat index for exact search."""
     
-    def build_index(self, embeddings):
-        """Build a flat index."""
-        try:
-            self.index = faiss.IndexFlatL2(self.embedding_dim)
-            self.index.add(embeddings)
-        except Exception as e:
-            print(f"Error building flat index: {e}")
-    
-    def search(self, query_embedding, top_k=5):
-        """Search the flat index."""
-        try:
-            if self.index is None or self.index.ntotal == 0:
-                return np.zeros(top_k), np.zeros(top_k, dtype=int)
-                
-            query_embedding = query_embedding.reshape(1, -1).astype('float32')
-            distances, indices = self.index.search(query_embedding, min(top_k, self.index.ntotal))
-            return distances[0], indices[0]
-        except Exception as e:
-            print(f"Error searching flat index: {e}")
-            return np.zeros(top_k), np.zeros(top_k, dtype=int)
+    def _create_index(self, embeddings):
+        """Create a flat index."""
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(self.embedding_dim))
 
 class LSHIndex(VectorIndex):
-    """Locality-Sensitive Hashing index."""
+    """Multi-table random-hyperplane LSH with multi-probe lookup and exact cosine rescoring.
     
-    def __init__(self, embedding_dim, n_bits=8, n_tables=10):
+    Each of the n_tables tables hashes a vector to an n_bits key (one bit per hyperplane side)
+    and keeps a dict of key -> row array. A query only rescores the rows in its own bucket and
+    in the n_probes neighbouring buckets reached by flipping its least certain bits, so query
+    time grows with bucket size rather than corpus size. Distances are 1 - cosine similarity.
+    """
+    
+    def __init__(self, embedding_dim, n_bits=12, n_tables=32, n_probes=8, seed=0):
         super().__init__(embedding_dim)
         self.n_bits = n_bits
         self.n_tables = n_tables
+        self.n_probes = n_probes
+        self.seed = seed
+        self._reset_storage()
     
-    def build_index(self, embeddings):
-        """Build an LSH index."""
-        try:
-            self.index = faiss.IndexLSH(self.embedding_dim, self.n_bits * self.n_tables)
-            self.index.add(embeddings)
-        except Exception as e:
-            print(f"Error building LSH index: {e}")
+    def _reset_storage(self):
+        """Drop all vectors; rows are append-only until save() compacts removed ones away."""
+        self.index = None
+        self.hyperplanes = None
+        self.vectors = np.empty((0, self.embedding_dim), dtype='float32')
+        self.ids = np.empty(0, dtype='int64')
+        self.live = np.empty(0, dtype=bool)
     
-    def search(self, query_embedding, top_k=5):
-        """Search the LSH index."""
+    def __len__(self):
+        """Number of live (not removed) vectors."""
+        return int(self.live.sum())
+    
+    def _create_index(self, embeddings):
+        """Draw the hyperplanes and create one empty bucket dict per table."""
+        rng = np.random.default_rng(self.seed)
+        self.hyperplanes = rng.standard_normal((self.embedding_dim, self.n_tables * self.n_bits)).astype('float32')
+        return [{} for _ in range(self.n_tables)]
+    
+    def _hash(self, embeddings):
+        """Bucket keys (n, n_tables) and raw projections (n, n_tables, n_bits) for each vector."""
+        projections = (embeddings @ self.hyperplanes).reshape(len(embeddings), self.n_tables, self.n_bits)
+        keys = (projections > 0).astype('int64') @ (1 << np.arange(self.n_bits, dtype='int64'))
+        return keys, projections
+    
+    def _insert(self, rows, keys):
+        """Append rows to their bucket in every table, grouping by key so each bucket grows once."""
+        for table, buckets in enumerate(self.index):
+            order = np.argsort(keys[:, table], kind='stable')
+            unique_keys, starts = np.unique(keys[order, table], return_index=True)
+            for key, bucket_rows in zip(unique_keys.tolist(), np.split(rows[order], starts[1:])):
+                existing = buckets.get(key)
+                buckets[key] = bucket_rows if existing is None else np.concatenate([existing, bucket_rows])
+    
+    @staticmethod
+    def _normalize(embeddings):
+        """Unit-normalize rows so a dot product is cosine similarity."""
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+    
+    def build_index(self, embeddings, ids=None):
+        """Hash every vector into fresh tables."""
+        self._reset_storage()
+        super().build_index(embeddings, ids)
+    
+    def add(self, embeddings, ids=None):
+        """Hash new vectors into the existing tables without touching the rest."""
+        embeddings = self._normalize(np.asarray(embeddings).reshape(-1, self.embedding_dim))
+        if ids is None:
+            ids = np.arange(self.next_id, self.next_id + len(embeddings))
+        ids = np.asarray(ids, dtype='int64')
+        if len(ids) == 0:
+            return ids
+        
+        if self.index is None:
+            self.index = self._create_index(embeddings)
+        rows = np.arange(len(self.ids), len(self.ids) + len(ids))
+        # vstack also copies a memory-mapped store into memory before it grows
+        self.vectors = np.vstack([self.vectors, embeddings])
+        self.ids = np.concatenate([self.ids, ids])
+        self.live = np.concatenate([self.live, np.ones(len(ids), dtype=bool)])
+        self._insert(rows, self._hash(embeddings)[0])
+        self.next_id = max(self.next_id, int(ids.max()) + 1)
+        return ids
+    
+    def remove(self, ids):
+        """Take vectors out of their buckets; the rows themselves are dropped on the next save()."""
+        if self.index is None:
+            return 0
+        rows = np.flatnonzero(np.isin(self.ids, np.asarray(ids, dtype='int64')) & self.live)
+        if len(rows) == 0:
+            return 0
+        
+        self.live[rows] = False
+        keys, _ = self._hash(self.vectors[rows])
+        for table, buckets in enumerate(self.index):
+            for key in np.unique(keys[:, table]).tolist():
+                remaining = buckets[key][~np.isin(buckets[key], rows)]
+                if len(remaining):
+                    buckets[key] = remaining
+                else:
+                    del buckets[key]
+        return len(rows)
+    
+    def _probe_keys(self, key, projections):
+        """The query's own key plus n_probes keys with one of its closest-to-zero bits flipped."""
+        flips = np.argsort(np.abs(projections))[:self.n_probes]
+        return [key] + [key ^ (1 << int(bit)) for bit in flips]
+    
+    def _candidates(self, keys, projections):
+        """Deduplicated rows found in the probed buckets of every table."""
+        found = []
+        for table, buckets in enumerate(self.index):
+            for key in self._probe_keys(int(keys[table]), projections[table]):
+                bucket = buckets.get(key)
+                if bucket is not None:
+                    found.append(bucket)
+        return np.unique(np.concatenate(found)) if found else np.empty(0, dtype='int64')
+    
+    def count_candidates(self, query_embeddings):
+        """How many vectors each query would rescore, i.e. the work LSH did not avoid."""
+        if self.index is None:
+            return np.zeros(len(query_embeddings), dtype='int64')
+        keys, projections = self._hash(self._normalize(np.asarray(query_embeddings).reshape(-1, self.embedding_dim)))
+        return np.array([len(self._candidates(keys[row], projections[row])) for row in range(len(keys))])
+    
+    def search_batch(self, query_embeddings, top_k=5):
+        """Hash all queries at once, then rescore each query's candidates by exact cosine similarity."""
+        n_queries = len(query_embeddings)
         try:
-            if self.index is None or self.index.ntotal == 0:
-                return np.zeros(top_k), np.zeros(top_k, dtype=int)
-                
-            query_embedding = query_embedding.reshape(1, -1).astype('float32')
-            distances, indices = self.index.search(query_embedding, min(top_k, self.index.ntotal))
-            return distances[0], indices[0]
+            if self.index is None or len(self) == 0:
+                return np.zeros((n_queries, top_k)), np.zeros((n_queries, top_k), dtype=int)
+            
+            query_embeddings = self._normalize(np.asarray(query_embeddings).reshape(-1, self.embedding_dim))
+            keys, projections = self._hash(query_embeddings)
+            k = min(top_k, len(self))
+            distances = np.full((n_queries, k), np.finfo('float32').max, dtype='float32')
+            indices = np.full((n_queries, k), -1, dtype='int64')
+            for row in range(n_queries):
+                candidates = self._candidates(keys[row], projections[row])
+                if len(candidates) == 0:
+                    continue
+                similarities = self.vectors[candidates] @ query_embeddings[row]
+                order = np.argsort(-similarities)[:k]
+                distances[row, :len(order)] = 1 - similarities[order]
+                indices[row, :len(order)] = self.ids[candidates[order]]
+            return distances, indices
         except Exception as e:
-            print(f"Error searching LSH index: {e}")
-            return np.zeros(top_k), np.zeros(top_k, dtype=int)
+            print(f"Error searching {type(self).__name__}: {e}")
+            return np.zeros((n_queries, top_k)), np.zeros((n_queries, top_k), dtype=int)
+    
+    def memory_bytes(self):
+        """Hyperplanes, bucket arrays and ids, plus vectors when held in memory rather than mapped."""
+        if self.index is None:
+            return 0
+        total = self.hyperplanes.nbytes + self.ids.nbytes + self.live.nbytes
+        total += sum(bucket.nbytes for buckets in self.index for bucket in buckets.values())
+        if not isinstance(self.vectors, np.memmap):
+            total += self.vectors.nbytes
+        return int(total)
+    
+    def set_search_params(self, **params):
+        """Update query-time knobs; n_probes is the only one that does not need a rebuild."""
+        for key, value in params.items():
+            setattr(self, key, value)
+    
+    def save(self, path):
+        """Save live vectors, ids, hyperplanes and per-table keys; buckets are regrouped on load."""
+        os.makedirs(path, exist_ok=True)
+        vectors = self.vectors[self.live]
+        np.save(os.path.join(path, 'vectors.npy'), vectors)
+        np.save(os.path.join(path, 'ids.npy'), self.ids[self.live])
+        np.save(os.path.join(path, 'hyperplanes.npy'), self.hyperplanes)
+        np.save(os.path.join(path, 'keys.npy'), self._hash(vectors)[0])
+        manifest = {
+            'format_version': INDEX_FORMAT_VERSION,
+            'index_type': type(self).__name__,
+            'params': self._params(),
+            'ntotal': len(self),
+        }
+        with open(os.path.join(path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+    
+    def load(self, path, mmap=True):
+        """Load a saved LSH index, memory-mapping the vectors used for rescoring."""
+        if os.path.isfile(path):
+            raise ValueError(f"{path} is a legacy pickled FAISS IndexLSH; rebuild it as a multi-table LSHIndex")
+        manifest = _read_manifest(path)
+        for key, value in manifest['params'].items():
+            setattr(self, key, value)
+        
+        self._reset_storage()
+        self.vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r' if mmap else None)
+        self.ids = np.load(os.path.join(path, 'ids.npy'))
+        self.live = np.ones(len(self.ids), dtype=bool)
+        self.hyperplanes = np.load(os.path.join(path, 'hyperplanes.npy'))
+        self.index = [{} for _ in range(self.n_tables)]
+        self._insert(np.arange(len(self.ids)), np.load(os.path.join(path, 'keys.npy')))
 
 class IVFIndex(VectorIndex):
     """Inverted File Index using clustering."""
     
-    def __init__(self, embedding_dim, n_clusters=100):
+    def __init__(self, embedding_dim, n_clusters=100, nprobe=10):
         super().__init__(embedding_dim)
         self.n_clusters = n_clusters
+        self.nprobe = nprobe
     
-    def build_index(self, embeddings):
-        """Build an IVF index."""
-        try:
-            self.n_clusters = min(self.n_clusters, int(embeddings.shape[0] / 39))
-            self.n_clusters = max(1, self.n_clusters)
-            quantizer = faiss.IndexFlatL2(self.embedding_dim)
-            self.index = faiss.IndexIVFFlat(quantizer, self.embedding_dim, self.n_clusters)
-            self.index.train(embeddings)
-            self.index.add(embeddings)
-            self.index.nprobe = min(10, self.n_clusters)
-        except Exception as e:
-            print(f"Error building IVF index: {e}")
-    
-    def search(self, query_embedding, top_k=5):
-        """Search the IVF index."""
-        try:
-            if self.index is None or self.index.ntotal == 0:
-                return np.zeros(top_k), np.zeros(top_k, dtype=int)
-            query_embedding = query_embedding.reshape(1, -1).astype('float32')
-            distances, indices = self.index.search(query_embedding, min(top_k, self.index.ntotal))
-            return distances[0], indices[0]
-        except Exception as e:
-            print(f"Error searching IVF index: {e}")
-            return np.zeros(top_k), np.zeros(top_k, dtype=int)
+    def _create_index(self, embeddings):
+        """Create and train an IVF index; later adds reuse the trained coarse quantizer."""
+        self.n_clusters = min(self.n_clusters, int(embeddings.shape[0] / 39))
+        self.n_clusters = max(1, self.n_clusters)
+        quantizer = faiss.IndexFlatL2(self.embedding_dim)
+        index = faiss.IndexIVFFlat(quantizer, self.embedding_dim, self.n_clusters)
+        index.train(embeddings)
+        index.nprobe = min(self.nprobe, self.n_clusters)
+        # Hashtable direct map lets remove_ids find vectors without scanning every list
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
 
 class IVFPQIndex(VectorIndex):
     """Inverted File with Product Quantization for more efficient search."""
     
-    def __init__(self, embedding_dim, n_clusters=100, subquantizer_bits=8, n_subquantizers=8):
+    def __init__(self, embedding_dim, n_clusters=100, subquantizer_bits=8, n_subquantizers=8, nprobe=10):
         super().__init__(embedding_dim)
         self.n_clusters = n_clusters
+        self.nprobe = nprobe
         self.subquantizer_bits = subquantizer_bits
         self.n_subquantizers = min(n_subquantizers, embedding_dim)
     
-    def build_index(self, embeddings):
-        """Build an IVFPQ index."""
+    def _create_index(self, embeddings):
+        """Create and train an IVFPQ index; later adds reuse the trained quantizers."""
+        self.n_clusters = min(self.n_clusters, int(embeddings.shape[0] / 39))
+        self.n_clusters = max(1, self.n_clusters)
+        quantizer = faiss.IndexFlatL2(self.embedding_dim)
+        self.n_subquantizers = min(self.n_subquantizers, self.embedding_dim)
+        while self.embedding_dim % self.n_subquantizers != 0:
+            self.n_subquantizers -= 1
+        index = faiss.IndexIVFPQ(quantizer, self.embedding_dim, self.n_clusters, self.n_subquantizers, self.subquantizer_bits)
+        index.train(embeddings)
+        index.nprobe = min(self.nprobe, self.n_clusters)
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
+
+class HNSWIndex(VectorIndex):
+    """Hierarchical Navigable Small World index with tombstone-based removal."""
+    
+    def __init__(self, embedding_dim, M=16, efConstruction=200, efSearch=64, compaction_threshold=0.2):
+        super().__init__(embedding_dim)
+        self.M = M
+        self.efConstruction = efConstruction
+        self.efSearch = efSearch
+        self.compaction_threshold = compaction_threshold
+        self.tombstones = frozenset()
+        self._lock = threading.Lock()
+        self._pending_adds = None
+        self._compaction_thread = None
+        self._tombstone_filter = None
+    
+    def _create_index(self, embeddings):
+        """Create an HNSW index."""
+        index = faiss.IndexHNSWFlat(self.embedding_dim, self.M)
+        index.hnsw.efConstruction = self.efConstruction
+        index.hnsw.efSearch = self.efSearch
+        return faiss.IndexIDMap2(index)
+    
+    def build_index(self, embeddings, ids=None):
+        """Build an HNSW index."""
+        with self._lock:
+            self._set_tombstones(frozenset())
+        super().build_index(embeddings, ids)
+    
+    def add(self, embeddings, ids=None):
+        """Add vectors; while a compaction runs they are also queued for the rebuilt graph."""
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32').reshape(-1, self.embedding_dim)
+        with self._lock:
+            ids = super().add(embeddings, ids)
+            if self._pending_adds is not None and len(ids):
+                self._pending_adds.append((embeddings, ids))
+        return ids
+    
+    def remove(self, ids):
+        """Tombstone vectors by id and start a background compaction when enough have piled up."""
+        # FAISS cannot delete from an HNSW graph, so removed ids are filtered out at search
+        # time until compact() rebuilds the graph from the live vectors.
+        if self.index is None:
+            return 0
+        ids = np.unique(np.asarray(ids, dtype='int64'))
+        with self._lock:
+            # A view of the id map, so membership is checked in numpy without copying it
+            id_map = faiss.rev_swig_ptr(self.index.id_map.data(), self.index.id_map.size())
+            removed = frozenset(ids[np.isin(ids, id_map)].tolist()) - self.tombstones
+            if removed:
+                self._set_tombstones(self.tombstones | removed)
+            needs_compaction = len(self.tombstones) > self.compaction_threshold * self.index.ntotal
+        if needs_compaction:
+            self.compact_in_background()
+        return len(removed)
+    
+    def _set_tombstones(self, tombstones):
+        """Replace the tombstone set and the search filter built from it; call with _lock held."""
+        # Rebind rather than mutate so concurrent searches see a consistent set and filter
+        self.tombstones = tombstones
+        self._tombstone_filter = None
+    
+    def _search_params(self):
+        """SearchParametersHNSW that skip tombstoned ids inside the graph search, or None without tombstones."""
+        search_filter = self._tombstone_filter
+        if search_filter is None:
+            tombstones = self.tombstones
+            if not tombstones:
+                return None
+            dead = np.fromiter(tombstones, dtype='int64', count=len(tombstones))
+            batch = faiss.IDSelectorBatch(dead)
+            selector = faiss.IDSelectorNot(batch)
+            hnsw = faiss.downcast_index(self.index.index).hnsw
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=hnsw.efSearch)
+            # The SWIG objects do not own each other, so keep the whole chain referenced
+            search_filter = (params, selector, batch, dead)
+            with self._lock:
+                if self.tombstones is tombstones:
+                    self._tombstone_filter = search_filter
+        return search_filter[0]
+    
+    def search_batch(self, query_embeddings, top_k=5):
+        """Search the HNSW index, skipping tombstoned ids during the graph traversal."""
+        n_queries = len(query_embeddings)
         try:
-            self.n_clusters = min(self.n_clusters, int(embeddings.shape[0] / 39))
-            self.n_clusters = max(1, self.n_clusters)
-            quantizer = faiss.IndexFlatL2(self.embedding_dim)
-            self.n_subquantizers = min(self.n_subquantizers, self.embedding_dim)
-            while self.embedding_dim % self.n_subquantizers != 0:
-                self.n_subquantizers -= 1
-            self.index = faiss.IndexIVFPQ(quantizer, self.embedding_dim, self.n_clusters, self.n_subquantizers, self.subquantizer_bits)
-            self.index.train(embeddings)
-            self.index.add(embeddings)
-            self.index.nprobe = min(10, self.n_clusters)
+            if self.index is None or self.index.ntotal == 0:
+                return np.zeros((n_queries, top_k)), np.zeros((n_queries, top_k), dtype=int)
+            params = self._search_params()
+            if params is None:
+                return super().search_batch(query_embeddings, top_k)
+            
+            query_embeddings = np.ascontiguousarray(query_embeddings, dtype='float32').reshape(-1, self.embedding_dim)
+            return self.index.search(query_embeddings, min(top_k, self.index.ntotal), params=params)
         except Exception as e:
-            print(f"Error building IVFPQ index: {e}")
+            print(f"Error searching {type(self).__name__}: {e}")
+            return np.zeros((n_queries, top_k)), np.zeros((n_queries, top_k), dtype=int)
     
-    def search(self, query_embedding, top_k=5):
-        """Search the IVFPQ index."""
+    def set_search_params(self, **params):
+        """Update query-time knobs; the tombstone filter is rebuilt to pick up a new efSearch."""
+        super().set_search_params(**params)
+        with self._lock:
+            self._tombstone_filter = None
+    
+    def compact(self):
+        """Rebuild the graph without tombstoned vectors, replaying adds that arrive meanwhile."""
+        with self._lock:
+            if self.index is None or not self.tombstones:
+                return
+            snapshot = self.tombstones
+            ids = faiss.vector_to_array(self.index.id_map)
+            vectors = self.index.index.reconstruct_n(0, self.index.ntotal)
+            self._pending_adds = []
+        
+        keep = ~np.isin(ids, np.fromiter(snapshot, dtype='int64'))
+        new_index = self._create_index(vectors[keep])
+        new_index.add_with_ids(vectors[keep], ids[keep])
+        
+        with self._lock:
+            for pending_vectors, pending_ids in self._pending_adds:
+                new_index.add_with_ids(pending_vectors, pending_ids)
+            self._pending_adds = None
+            self.index = new_index
+            self._mmapped_from = None
+            self._set_tombstones(self.tombstones - snapshot)
+    
+    def compact_in_background(self):
+        """Start compact() on a daemon thread unless one is already running."""
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return self._compaction_thread
+        self._compaction_thread = threading.Thread(target=self.compact, daemon=True)
+        self._compaction_thread.start()
+        return self._compaction_thread
+    
+    def save(self, path):
+        """Compact away tombstones, then save the index."""
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+        self.compact()
+        super().save(path)
+
+class QuantizedFlatIndex(VectorIndex):
+    """Flat index that scans compact codes, then rescores the best candidates on float32 vectors.
+    
+    The float32 vectors live next to the codes in vectors.npy and are memory-mapped on load,
+    so only the rows of candidates actually rescored are paged in.
+    """
+    
+    VECTORS_FILE = 'vectors.npy'
+    
+    def __init__(self, embedding_dim, rescore_factor=4):
+        super().__init__(embedding_dim)
+        self.rescore_factor = rescore_factor
+        self.vectors = np.empty((0, embedding_dim), dtype='float32')
+        self._id_map = None
+    
+    def _encode(self, embeddings):
+        """Convert float32 vectors into whatever the coarse FAISS index stores."""
+        return embeddings
+    
+    def build_index(self, embeddings, ids=None):
+        """Build the code index and the float32 rescoring store."""
+        self.vectors = np.empty((0, self.embedding_dim), dtype='float32')
+        super().build_index(embeddings, ids)
+    
+    def add(self, embeddings, ids=None):
+        """Add vectors to both the code index and the float32 store, keeping rows aligned."""
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32').reshape(-1, self.embedding_dim)
+        if ids is None:
+            ids = np.arange(self.next_id, self.next_id + len(embeddings))
+        ids = np.asarray(ids, dtype='int64')
+        if len(ids) == 0:
+            return ids
+        
+        if self.index is None:
+            self.index = self._create_index(embeddings)
+        self._ensure_writable()
+        self.index.add_with_ids(self._encode(embeddings), ids)
+        # vstack also copies a memory-mapped store into memory before it grows
+        self.vectors = np.vstack([self.vectors, embeddings])
+        self.next_id = max(self.next_id, int(ids.max()) + 1)
+        self._id_map = None
+        return ids
+    
+    def remove(self, ids):
+        """Remove vectors by id; FAISS keeps the remaining codes in order, so the store is filtered to match."""
+        if self.index is None:
+            return 0
+        keep = ~np.isin(faiss.vector_to_array(self.index.id_map), np.asarray(ids, dtype='int64'))
+        removed = super().remove(ids)
+        self.vectors = self.vectors[keep]
+        self._id_map = None
+        return removed
+    
+    def search_batch(self, query_embeddings, top_k=5):
+        """Coarse scan over codes for top_k * rescore_factor candidates, then exact L2 on float32."""
+        n_queries = len(query_embeddings)
         try:
             if self.index is None or self.index.ntotal == 0:
-                return np.zeros(top_k), np.zeros(top_k, dtype=int)
-            query_embedding = query_embedding.reshape(1, -1).astype('float32')
-            distances, indices = self.index.search(query_embedding, min(top_k, self.index.ntotal))
-            return distances[0], indices[0]
+                return np.zeros((n_queries, top_k)), np.zeros((n_queries, top_k), dtype=int)
+            
+            query_embeddings = np.ascontiguousarray(query_embeddings, dtype='float32').reshape(-1, self.embedding_dim)
+            k = min(top_k, self.index.ntotal)
+            n_candidates = min(self.index.ntotal, k * self.rescore_factor)
+            # Search the wrapped index so labels are row positions into self.vectors
+            _, rows = self.index.index.search(self._encode(query_embeddings), n_candidates)
+            if self._id_map is None:
+                self._id_map = faiss.vector_to_array(self.index.id_map)
+            
+            distances = np.empty((n_queries, k), dtype='float32')
+            indices = np.empty((n_queries, k), dtype='int64')
+            for row, candidates in enumerate(rows):
+                # Sorted rows read the mapped store front to back
+                candidates = np.sort(candidates[candidates >= 0])
+                diffs = self.vectors[candidates] - query_embeddings[row]
+                exact = np.einsum('ij,ij->i', diffs, diffs)
+                order = np.argsort(exact)[:k]
+                distances[row] = exact[order]
+                indices[row] = self._id_map[candidates[order]]
+            return distances, indices
+        except Exception as e:
+            print(f"Error searching {type(self).__name__}: {e}")
+            return np.zeros((n_queries, top_k)), np.zeros((n_queries, top_k), dtype=int)
+    
+    def memory_bytes(self):
+        """Codes plus the float32 store when it is held in memory rather than mapped."""
+        store_bytes = 0 if isinstance(self.vectors, np.memmap) else self.vectors.nbytes
+        return super().memory_bytes() + int(store_bytes)
+    
+    def save(self, path):
+        """Save the code index and the float32 rescoring store."""
+        super().save(path)
+        np.save(os.path.join(path, self.VECTORS_FILE), np.ascontiguousarray(self.vectors))
+    
+    def load(self, path, mmap=True):
+        """Load the code index and map (or read) the float32 rescoring store."""
+        super().load(path, mmap)
+        self.vectors = np.load(os.path.join(path, self.VECTORS_FILE), mmap_mode='r' if mmap else None)
+        self._id_map = None
+
+class ScalarQuantizedIndex(QuantizedFlatIndex):
+    """Flat index over 8-bit scalar-quantized codes (4x smaller than float32) with exact rescoring."""
+    
+    def _create_index(self, embeddings):
+        """Create an 8-bit scalar quantizer trained on per-dimension value ranges."""
+        index = faiss.IndexScalarQuantizer(self.embedding_dim, faiss.ScalarQuantizer.QT_8bit)
+        index.train(embeddings)
+        return faiss.IndexIDMap2(index)
+
+class BinaryQuantizedIndex(QuantizedFlatIndex):
+    """Flat index over 1-bit sign codes (32x smaller than float32) scanned by Hamming distance."""
+    
+    _read_faiss_index = staticmethod(faiss.read_index_binary)
+    _write_faiss_index = staticmethod(faiss.write_index_binary)
+    _serialize_faiss_index = staticmethod(faiss.serialize_index_binary)
+    
+    def __init__(self, embedding_dim, rescore_factor=16):
+        super().__init__(embedding_dim, rescore_factor)
+    
+    def _encode(self, embeddings):
+        """One bit per dimension: whether the component is positive."""
+        return np.packbits(embeddings > 0, axis=1)
+    
+    def _create_index(self, embeddings):
+        """Create a binary flat index, padding the bit count to whole bytes."""
+        return faiss.IndexBinaryIDMap2(faiss.IndexBinaryFlat(8 * ((self.embedding_dim + 7) // 8)))
+
+def _rss_bytes():
+    """Resident set size of the current process, or None where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return None
+
+def _run_shard_command(shard, command, args):
+    """Apply one ShardedIndex command to a shard; 'stats' reports size and memory."""
+    if command == 'stats':
+        return {'ntotal': len(shard), 'memory_bytes': shard.memory_bytes(), 'rss_bytes': _rss_bytes()}
+    if command == 'set_search_params':
+        return shard.set_search_params(**args[0])
+    return getattr(shard, command)(*args)
+
+def _shard_worker(conn, shard_type, embedding_dim, shard_params):
+    """Serve one shard in a worker process, replying (ok, result) to each (command, args) message."""
+    shard = INDEX_CLASSES[shard_type](embedding_dim, **shard_params)
+    while True:
+        command, args = conn.recv()
+        if command == 'close':
+            break
+        try:
+            conn.send((True, _run_shard_command(shard, command, args)))
         except Exception as e:
-            print(f"Error searching IVFPQ index: {e}")
-            return np.zeros(top_k), np.zeros(top_k, dtype=int)
+            conn.send((False, f"{type(e).__name__}: {e}"))
+    conn.close()
 
-class HNSWIndex(VectorIndex):
-    """Hierarchical Navigable Small World index."""
+class ShardedIndex(VectorIndex):
+    """Partitions vectors by id across N shards, each an ordinary VectorIndex in its own worker process."""
     
-    def __init__(self, embedding_dim, M=16, efConstruction=200):
+    def __init__(self, embedding_dim, n_shards=4, shard_type='FlatIndex', use_processes=True, **shard_params):
         super().__init__(embedding_dim)
-        self.M = M
-        self.efConstruction = efConstruction
+        self.n_shards = n_shards
+        self.shard_type = shard_type if isinstance(shard_type, str) else shard_type.__name__
+        self.use_processes = use_processes
+        self.shard_params = shard_params
+        self.shard_sizes = [0] * n_shards
+        self._shards = None
+        self._connections = None
+        self._workers = None
     
-    def build_index(self, embeddings):
-        """Build an HNSW index."""
+    def _start(self):
+        """Create the shards, in worker processes unless use_processes is False."""
+        if self._shards is not None or self._connections is not None:
+            return
+        if not self.use_processes:
+            self._shards = [INDEX_CLASSES[self.shard_type](self.embedding_dim, **self.shard_params)
+                            for _ in range(self.n_shards)]
+            return
+        
+        # spawn rather than fork so a worker only holds its own shard, not a copy of the caller's heap
+        ctx = multiprocessing.get_context('spawn')
+        self._connections, self._workers = [], []
+        for _ in range(self.n_shards):
+            parent_conn, child_conn = ctx.Pipe()
+            worker = ctx.Process(target=_shard_worker, daemon=True,
+                                 args=(child_conn, self.shard_type, self.embedding_dim, self.shard_params))
+            worker.start()
+            child_conn.close()
+            self._connections.append(parent_conn)
+            self._workers.append(worker)
+    
+    def __len__(self):
+        """Number of vectors across all shards."""
+        return sum(self.shard_sizes)
+    
+    def _broadcast(self, command, shard_args):
+        """Send a command to every shard listed in shard_args ({shard: args}) and gather the replies."""
+        self._start()
+        if self._shards is not None:
+            return {shard: _run_shard_command(self._shards[shard], command, args)
+                    for shard, args in shard_args.items()}
+        
+        # Send everything before receiving anything so the shards work in parallel
+        for shard, args in shard_args.items():
+            self._connections[shard].send((command, args))
+        results = {}
+        for shard in shard_args:
+            ok, result = self._connections[shard].recv()
+            if not ok:
+                raise RuntimeError(f"shard {shard} failed on {command}: {result}")
+            results[shard] = result
+        return results
+    
+    def _partition(self, ids):
+        """Map each shard to the row positions of the ids it owns."""
+        owners = ids % self.n_shards
+        return {shard: np.flatnonzero(owners == shard) for shard in range(self.n_shards)}
+    
+    def build_index(self, embeddings, ids=None):
+        """Partition embeddings across the shards and build each shard's index."""
         try:
-            self.index = faiss.IndexHNSWFlat(self.embedding_dim, self.M)
-            self.index.hnsw.efConstruction = self.efConstruction
-            self.index.add(embeddings)
-            self.index.hnsw.efSearch = 64
+            embeddings = np.ascontiguousarray(embeddings, dtype='float32').reshape(-1, self.embedding_dim)
+            ids = np.arange(len(embeddings)) if ids is None else np.asarray(ids, dtype='int64')
+            parts = self._partition(ids)
+            self._broadcast('build_index', {shard: (embeddings[rows], ids[rows]) for shard, rows in parts.items()})
+            self.shard_sizes = [len(parts[shard]) for shard in range(self.n_shards)]
+            self.next_id = int(ids.max()) + 1 if len(ids) else 0
         except Exception as e:
-            print(f"Error building HNSW index: {e}")
+            print(f"Error building ShardedIndex: {e}")
     
-    def search(self, query_embedding, top_k=5):
-        """Search the HNSW index."""
+    def add(self, embeddings, ids=None):
+        """Route new vectors to their shards by id."""
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32').reshape(-1, self.embedding_dim)
+        if ids is None:
+            ids = np.arange(self.next_id, self.next_id + len(embeddings))
+        ids = np.asarray(ids, dtype='int64')
+        if len(ids) == 0:
+            return ids
+        
+        parts = {shard: rows for shard, rows in self._partition(ids).items() if len(rows)}
+        self._broadcast('add', {shard: (embeddings[rows], ids[rows]) for shard, rows in parts.items()})
+        for shard, rows in parts.items():
+            self.shard_sizes[shard] += len(rows)
+        self.next_id = max(self.next_id, int(ids.max()) + 1)
+        return ids
+    
+    def remove(self, ids):
+        """Remove ids from whichever shards own them."""
+        ids = np.asarray(ids, dtype='int64')
+        parts = {shard: rows for shard, rows in self._partition(ids).items() if len(rows)}
+        removed = self._broadcast('remove', {shard: (ids[rows],) for shard, rows in parts.items()})
+        for shard, count in removed.items():
+            self.shard_sizes[shard] -= count
+        return sum(removed.values())
+    
+    def search_batch(self, query_embeddings, top_k=5):
+        """Fan the queries out to every non-empty shard and merge the per-shard top-k lists."""
+        n_queries = len(query_embeddings)
         try:
-            if self.index is None or self.index.ntotal == 0:
-                return np.zeros(top_k), np.zeros(top_k, dtype=int)
-            query_embedding = query_embedding.reshape(1, -1).astype('float32')
-            distances, indices = self.index.search(query_embedding, min(top_k, self.index.ntotal))
-            return distances[0], indices[0]
+            ntotal = sum(self.shard_sizes)
+            if ntotal == 0:
+                return np.zeros((n_queries, top_k)), np.zeros((n_queries, top_k), dtype=int)
+            
+            query_embeddings = np.ascontiguousarray(query_embeddings, dtype='float32').reshape(-1, self.embedding_dim)
+            active = [shard for shard, size in enumerate(self.shard_sizes) if size > 0]
+            shard_results = self._broadcast('search_batch', {shard: (query_embeddings, top_k) for shard in active})
+            
+            k = min(top_k, ntotal)
+            distances = np.full((n_queries, k), np.finfo('float32').max, dtype='float32')
+            indices = np.full((n_queries, k), -1, dtype='int64')
+            for q in range(n_queries):
+                # Each shard's row is already sorted by distance, so a k-way heap merge suffices
+                rows = [zip(d[q].tolist(), i[q].tolist()) for d, i in shard_results.values()]
+                merged = [hit for hit in heapq.merge(*rows) if hit[1] >= 0]
+                for rank, (distance, idx) in enumerate(merged[:k]):
+                    distances[q, rank] = distance
+                    indices[q, rank] = idx
+            return distances, indices
         except Exception as e:
-            print(f"Error searching HNSW index: {e}")
-            return np.zeros(top_k), np.zeros(top_k, dtype=int)
+            print(f"Error searching ShardedIndex: {e}")
+            return np.zeros((n_queries, top_k)), np.zeros((n_queries, top_k), dtype=int)
+    
+    def set_search_params(self, **params):
+        """Apply query-time knobs to every shard."""
+        self._broadcast('set_search_params', {shard: (params,) for shard in range(self.n_shards)})
+    
+    def shard_stats(self):
+        """Per-shard vector count, serialized index size and worker RSS."""
+        stats = self._broadcast('stats', {shard: () for shard in range(self.n_shards)})
+        return [stats[shard] for shard in range(self.n_shards)]
+    
+    def memory_bytes(self):
+        """Total serialized size of all shards."""
+        return sum(stats['memory_bytes'] for stats in self.shard_stats())
+    
+    def save(self, path):
+        """Save each shard to path/shard_<i> plus a manifest describing the partitioning."""
+        os.makedirs(path, exist_ok=True)
+        self._broadcast('save', {shard: (os.path.join(path, f'shard_{shard}'),) for shard in range(self.n_shards)})
+        manifest = {
+            'format_version': INDEX_FORMAT_VERSION,
+            'index_type': type(self).__name__,
+            'params': self._params(),
+            'shard_params': self.shard_params,
+            'shard_sizes': self.shard_sizes,
+            'ntotal': sum(self.shard_sizes),
+        }
+        with open(os.path.join(path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+    
+    def load(self, path, mmap=True):
+        """Load a sharded index written by save(); each worker maps its own shard."""
+        manifest = _read_manifest(path)
+        if manifest['index_type'] != type(self).__name__:
+            raise ValueError(f"{path} holds a {manifest['index_type']}, not a ShardedIndex")
+        n_shards = manifest['params'].get('n_shards')
+        missing = [shard for shard in range(n_shards or 0)
+                   if not os.path.isfile(os.path.join(path, f'shard_{shard}', 'manifest.json'))]
+        if not n_shards or len(manifest.get('shard_sizes', [])) != n_shards or missing:
+            raise ValueError(f"{path} does not hold a complete ShardedIndex layout: manifest lists "
+                             f"{n_shards} shards and {len(manifest.get('shard_sizes', []))} shard sizes, "
+                             f"missing shard directories {missing}")
+        self.close()
+        for key, value in manifest['params'].items():
+            setattr(self, key, value)
+        self.shard_params = manifest['shard_params']
+        self.shard_sizes = manifest['shard_sizes']
+        self._broadcast('load', {shard: (os.path.join(path, f'shard_{shard}'), mmap) for shard in range(self.n_shards)})
+    
+    def close(self):
+        """Stop the worker processes."""
+        if self._connections is not None:
+            for conn in self._connections:
+                conn.send(('close', ()))
+                conn.close()
+            for worker in self._workers:
+                worker.join()
+        self._shards = self._connections = self._workers = None
+
+class ChunkStore:
+    """Read-only list of chunk texts backed by a memory-mapped offsets array and UTF-8 blob."""
+    
+    OFFSETS_FILE = 'chunk_offsets.npy'
+    BLOB_FILE = 'chunk_texts.bin'
+    
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+    
+    @classmethod
+    def write(cls, chunk_texts, path):
+        """Write chunk texts as one concatenated UTF-8 blob plus (n + 1) int64 byte offsets."""
+        os.makedirs(path, exist_ok=True)
+        offsets = np.zeros(len(chunk_texts) + 1, dtype=np.int64)
+        with open(os.path.join(path, cls.BLOB_FILE), 'wb') as f:
+            for i, text in enumerate(chunk_texts):
+                data = text.encode('utf-8')
+                f.write(data)
+                offsets[i + 1] = offsets[i] + len(data)
+        np.save(os.path.join(path, cls.OFFSETS_FILE), offsets)
+    
+    @classmethod
+    def open(cls, path):
+        """Open a chunk store without reading the texts into memory."""
+        offsets = np.load(os.path.join(path, cls.OFFSETS_FILE), mmap_mode='r')
+        blob_path = os.path.join(path, cls.BLOB_FILE)
+        # np.memmap refuses zero-length files
+        blob = np.memmap(blob_path, dtype=np.uint8, mode='r') if os.path.getsize(blob_path) else b''
+        return cls(offsets, blob)
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"chunk index {idx} out of range")
+        return bytes(self.blob[self.offsets[idx]:self.offsets[idx + 1]]).decode('utf-8')
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
 
 class RAGSystem:
     """Retrieval-Augmented Generation system using vector indexing."""
     
-    def __init__(self, text_processor, embedding_model, vector_index, chunk_texts=None, embeddings=None):
+    def __init__(self, text_processor, embedding_model, vector_index, chunk_texts=None, embeddings=None, query_cache=None):
         self.text_processor = text_processor
         self.embedding_model = embedding_model
         self.vector_index = vector_index
         self.chunk_texts = chunk_texts or []
         self.embeddings = embeddings
+        self.document_chunks = {}
+        self.query_cache = query_cache if query_cache is not None else shared_query_cache()
     
     def process_documents(self, document_paths):
         """Process multiple documents and build the index."""
         all_chunks = []
+        self.document_chunks = {}
         
         for path in document_paths:
             try:
                 text = self.text_processor.extract_text_from_document(path)
                 chunks = self.text_processor.chunk_text(text)
+                self.document_chunks.setdefault(path, []).extend(range(len(all_chunks), len(all_chunks) + len(chunks)))
                 all_chunks.extend(chunks)
             except Exception as e:
                 print(f"Error processing document {path}: {e}")
@@ -297,29 +1105,117 @@ class RAGSystem:
         except Exception as e:
             print(f"Error building index: {e}")
     
-    def retrieve(self, query, top_k=5):
-        """Retrieve relevant chunks for a query."""
+    def add_documents(self, document_paths):
+        """Embed and index only the given documents; paths already indexed are replaced."""
+        self.remove_documents([path for path in document_paths if path in self.document_chunks])
+        
+        new_chunks = []
+        owners = []
+        for path in document_paths:
+            try:
+                text = self.text_processor.extract_text_from_document(path)
+                chunks = self.text_processor.chunk_text(text)
+                new_chunks.extend(chunks)
+                owners.extend([path] * len(chunks))
+            except Exception as e:
+                print(f"Error processing document {path}: {e}")
+        
+        if not new_chunks:
+            return 0
+        
+        # Chunk ids are positions in chunk_texts, so a loaded ChunkStore has to become a list to grow
+        if not isinstance(self.chunk_texts, list):
+            self.chunk_texts = list(self.chunk_texts)
+        embeddings = self.embedding_model.generate_embeddings(new_chunks)
+        ids = np.arange(len(self.chunk_texts), len(self.chunk_texts) + len(new_chunks))
+        self.vector_index.add(embeddings, ids)
+        self.chunk_texts.extend(new_chunks)
+        for path, chunk_id in zip(owners, ids):
+            self.document_chunks.setdefault(path, []).append(int(chunk_id))
+        # The embedding matrix from the last full build no longer matches the index
+        self.embeddings = None
+        
+        print(f"Added {len(set(owners))} documents as {len(new_chunks)} chunks.")
+        return len(new_chunks)
+    
+    def remove_documents(self, document_paths):
+        """Drop the given documents' chunks from the index; their texts stay in chunk_texts unreferenced."""
+        ids = []
+        for path in document_paths:
+            ids.extend(self.document_chunks.pop(path, []))
+        if not ids:
+            return 0
+        return self.vector_index.remove(ids)
+    
+    def _embed_queries(self, queries, enhance=False):
+        """Query embeddings through the cache, so repeated queries skip the encoder."""
+        if enhance:
+            queries = [self.enhance_query(query) for query in queries]
+        return self.query_cache.get_or_compute(list(queries), self.embedding_model.model_name,
+                                               self.embedding_model.generate_embeddings)
+    
+    def warm_query_cache(self, queries, enhance=False):
+        """Precompute embeddings for known or templated queries in one encoder pass."""
+        self._embed_queries(queries, enhance)
+        return self.query_cache.stats()
+    
+    def retrieve(self, query, top_k=5, enhance=False):
+        """Retrieve relevant chunks for a query, optionally rewritten by enhance_query first."""
         try:
-            query_embedding = self.embedding_model.generate_embeddings([query])[0]
+            query_embedding = self._embed_queries([query], enhance)[0]
             distances, indices = self.vector_index.search(query_embedding, top_k)
-            results = []
-            for i, idx in enumerate(indices):
-                if idx >= 0 and idx < len(self.chunk_texts):
-                    results.append({
-                        'chunk': self.chunk_texts[idx],
-                        'distance': float(distances[i]),
-                        'index': int(idx)
-                    })
-            return results
+            return self._format_results(distances, indices)
         except Exception as e:
             print(f"Error retrieving results: {e}")
             return []
     
+    def retrieve_batch(self, queries, top_k=5, enhance=False):
+        """Retrieve relevant chunks for many queries with one embedding pass and one index search."""
+        try:
+            query_embeddings = self._embed_queries(queries, enhance)
+            distances, indices = self.vector_index.search_batch(query_embeddings, top_k)
+            return [self._format_results(distances[i], indices[i]) for i in range(len(indices))]
+        except Exception as e:
+            print(f"Error retrieving batch results: {e}")
+            return [[] for _ in queries]
+    
+    def _format_results(self, distances, indices):
+        """Map raw index hits back to chunk texts."""
+        results = []
+        for i, idx in enumerate(indices):
+            if idx >= 0 and idx < len(self.chunk_texts):
+                results.append({
+                    'chunk': self.chunk_texts[idx],
+                    'distance': float(distances[i]),
+                    'index': int(idx)
+                })
+        return results
+    
+    def save(self, path):
+        """Persist the index and chunk texts to a directory."""
+        self.vector_index.save(path)
+        ChunkStore.write(self.chunk_texts, path)
+        with open(os.path.join(path, 'documents.json'), 'w') as f:
+            json.dump(self.document_chunks, f)
+    
+    def load(self, path, mmap=True):
+        """Load a directory written by save(); chunk texts stay on disk until accessed."""
+        self.vector_index.load(path, mmap=mmap)
+        self.chunk_texts = ChunkStore.open(path)
+        self.embeddings = None
+        documents_path = os.path.join(path, 'documents.json')
+        if os.path.exists(documents_path):
+            with open(documents_path) as f:
+                self.document_chunks = json.load(f)
+    
     def enhance_query(self, query):
         """Enhance the query with additional context."""
         enhanced_query = f"In the context of information retrieval and vector databases: {query}"
         return enhanced_query
 
+INDEX_CLASSES = {cls.__name__: cls for cls in (FlatIndex, LSHIndex, IVFIndex, IVFPQIndex, HNSWIndex,
+                                                ScalarQuantizedIndex, BinaryQuantizedIndex, ShardedIndex)}
+
 def create_sample_document(document_path):
     """Create a sample document for testing purposes."""
     sample_text = """
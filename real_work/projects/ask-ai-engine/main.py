@@ -1,91 +1,223 @@
 import sys
 import os
+import csv
+import glob
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 # Add the project root to Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import pandas as pd
-from trial.backend.document_processor import DocumentProcessor
-
-def process_pfizer_files():
-    """Process Pfizer files under 20 pages and extract content"""
-    
-    # Initialize document processor
-    processor = DocumentProcessor()
-    
+from document_processor import DocumentProcessor
+from extraction_store import ExtractionWriter
+
+SCRIPT_DIR = Path(__file__).parent.absolute()
+EXTRACTION_COLUMNS = ['file_path', 'num_pages', 'extracted_text', 'extracted_tables', 'extracted_images']
+
+_processor = None
+
+def _init_worker(output_path, page_timeout=None):
+    """Create one DocumentProcessor per worker process."""
+    global _processor
+    _processor = DocumentProcessor(output_path, page_timeout=page_timeout)
+
+def _extract_file(file_path, num_pages, extract_images):
+    """Worker: extract one PDF into a checkpoint record of per-page text and tables (never raises)."""
+    start = time.perf_counter()
+    try:
+        print(f"Processing PDF: {file_path}")
+        pages = _processor.extract_pages(file_path)
+        images = _processor.extract_images(file_path) if extract_images else []
+        return {
+            'file_path': file_path,
+            'num_pages': num_pages,
+            'status': 'ok',
+            'pages': pages,
+            'extracted_images': len(images),
+            'seconds': time.perf_counter() - start,
+        }
+    except Exception as e:
+        return {'file_path': file_path, 'num_pages': num_pages, 'status': 'error', 'error': str(e),
+                'seconds': time.perf_counter() - start}
+
+def load_checkpoint(checkpoint_dir):
+    """Index the checkpoint shards: file_path -> (shard path, byte offset, status).
+
+    A later record for the same file wins, and a torn last line (a crash mid-write) is ignored.
+    """
+    index = {}
+    for shard in sorted(glob.glob(os.path.join(checkpoint_dir, 'part-*.jsonl'))):
+        with open(shard, 'rb') as f:
+            offset = 0
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    index[record['file_path']] = (shard, offset, record['status'])
+                except (ValueError, KeyError):
+                    pass
+                offset += len(line)
+    return index
+
+def _read_record(shard, offset):
+    with open(shard, 'rb') as f:
+        f.seek(offset)
+        return json.loads(f.readline())
+
+def _csv_row(record):
+    """Whole-document CSV row for a checkpoint record."""
+    texts = [page['text'] for page in record['pages'] if page['text']]
+    tables = [table for page in record['pages'] for table in page['tables']]
+    return {
+        'file_path': record['file_path'],
+        'num_pages': record['num_pages'],
+        'extracted_text': '\n'.join(texts) if texts else '',
+        'extracted_tables': str(tables) if tables else '',
+        'extracted_images': str(record['extracted_images']),
+    }
+
+def _checkpointed_records(checkpoint_dir, file_paths):
+    """Successful checkpoint records for file_paths, in that order, read one at a time."""
+    index = load_checkpoint(checkpoint_dir)
+    for file_path in file_paths:
+        entry = index.get(file_path)
+        if entry is not None and entry[2] == 'ok':
+            yield _read_record(entry[0], entry[1])
+
+def write_extractions_csv(checkpoint_dir, file_paths, output_csv):
+    """Write the checkpointed extractions of file_paths to output_csv, one record in memory at a time.
+
+    Returns:
+        Number of rows written
+    """
+    tmp_path = f"{output_csv}.tmp"
+    written = 0
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=EXTRACTION_COLUMNS)
+        writer.writeheader()
+        for record in _checkpointed_records(checkpoint_dir, file_paths):
+            writer.writerow(_csv_row(record))
+            written += 1
+    os.replace(tmp_path, output_csv)
+    return written
+
+def write_extractions_parquet(checkpoint_dir, file_paths, output_path):
+    """Write the checkpointed extractions of file_paths to Parquet, one row per page.
+
+    Returns:
+        Number of documents written
+    """
+    tmp_path = f"{output_path}.tmp"
+    written = 0
+    with ExtractionWriter(tmp_path) as writer:
+        for record in _checkpointed_records(checkpoint_dir, file_paths):
+            writer.write_document(record['file_path'], record['num_pages'], record['pages'],
+                                  record['extracted_images'])
+            written += 1
+    os.replace(tmp_path, output_path)
+    return written
+
+def process_pfizer_files(inventory_path=SCRIPT_DIR / 'pfizer_files_inventory.csv',
+                         output_csv=SCRIPT_DIR / 'pfizer_extractions_under_20_pages.csv',
+                         output_parquet=SCRIPT_DIR / 'pfizer_extractions_under_20_pages.parquet',
+                         checkpoint_dir=SCRIPT_DIR / 'extraction_checkpoint',
+                         max_workers=None, max_pages=20, extract_images=False, retry_failed=False,
+                         page_timeout=None):
+    """Process Pfizer files under 20 pages and extract content
+
+    Files are extracted in a process pool. Each finished file is appended to a JSONL shard
+    in checkpoint_dir as soon as it completes, so an interrupted run resumes where it left
+    off: files already in the checkpoint are skipped (failed ones too, unless retry_failed).
+    The CSV and the per-page Parquet file are rebuilt from the checkpoint at the end, in
+    inventory order; pass output_csv=None to write only Parquet. Page images are only
+    rendered (to PNGs under content/) with extract_images=True. A page whose tables take
+    longer than page_timeout seconds to extract is kept text-only.
+
+    Returns:
+        Dictionary with processed/skipped/failed counts and seconds
+    """
+    start_time = time.perf_counter()
+
     # Read the Pfizer files inventory CSV
     try:
-        os.chdir('/Users/arihantchoudhary/GitHub/Klarity/ask-ai-framework')
-        df = pd.read_csv('pfizer_files_inventory.csv')
+        df = pd.read_csv(inventory_path)
     except FileNotFoundError:
-        print("Error: pfizer_file_inventory.csv not found")
+        print(f"Error: {inventory_path} not found")
         return
-        
+
     # Filter for files with <= 20 pages
-    df_filtered = df[df['num_pages'] <= 20].copy()
-    print(f"Processing {len(df_filtered)} files with <= 20 pages")
-    
-    # Create new dataframe for extracted content
-    extractions_df = pd.DataFrame(columns=[
-        'file_path',
-        'num_pages', 
-        'extracted_text',
-        'extracted_tables',
-        'extracted_images'
-    ])
-    
-    # Process each file
-    for idx, row in df_filtered.iterrows():
-        file_path = row['file_path']
-        print(f"\nProcessing file {idx + 1}/{len(df_filtered)}")
-        print(f"Path: {file_path}")
-        
+    df_filtered = df[df['num_pages'] <= max_pages]
+    print(f"Processing {len(df_filtered)} files with <= {max_pages} pages")
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    done = load_checkpoint(checkpoint_dir)
+    stats = {'processed': 0, 'skipped': 0, 'failed': 0, 'missing': 0}
+
+    pending = []
+    for row in df_filtered.itertuples(index=False):
+        file_path = row.file_path
+        status = done.get(file_path, (None, None, None))[2]
+        if status == 'ok' or (status == 'error' and not retry_failed):
+            stats['skipped'] += 1
+            continue
+
         if not os.path.exists(file_path):
             print(f"Warning: File not found - {file_path}")
+            stats['missing'] += 1
             continue
-            
+
         if not file_path.lower().endswith('.pdf'):
             print(f"Warning: Not a PDF file - {file_path}")
+            stats['missing'] += 1
             continue
-            
-        try:
-            print(f"Processing {file_path}")
-            texts, tables, images = processor.process_pdf(file_path)
-            
-            # Add row to extractions dataframe
-            new_row = pd.DataFrame([{
-                'file_path': file_path,
-                'num_pages': row['num_pages'],
-                'extracted_text': '\n'.join(texts) if texts else '',
-                'extracted_tables': str(tables) if tables else '',
-                'extracted_images': str(len(images)) if images else '0'
-            }])
-            extractions_df = pd.concat([extractions_df, new_row], ignore_index=True)
-            
-            print(f"Successfully processed: {os.path.basename(file_path)}")
-            print(f"- Extracted {len(texts)} text chunks")
-            print(f"- Extracted {len(tables)} tables")
-            print(f"- Extracted {len(images)} images")
-            
-        except Exception as e:
-            print(f"Error processing {file_path}: {str(e)}")
-            continue
-    
-    # Save extractions to new CSV
+
+        pending.append((file_path, float(row.num_pages)))
+
+    print(f"{stats['skipped']} files already in {checkpoint_dir}, {len(pending)} to extract")
+
+    # Each run appends to its own shard, so earlier shards are never rewritten
+    shard_path = os.path.join(checkpoint_dir, f"part-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl")
+    with open(shard_path, 'a', encoding='utf-8') as shard, \
+            ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                initargs=(str(SCRIPT_DIR / 'content'), page_timeout)) as pool:
+        futures = [pool.submit(_extract_file, file_path, num_pages, extract_images)
+                   for file_path, num_pages in pending]
+        for i, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            shard.write(json.dumps(record) + '\n')
+            shard.flush()
+
+            if record['status'] == 'ok':
+                stats['processed'] += 1
+                print(f"[{i}/{len(pending)}] Successfully processed: {os.path.basename(record['file_path'])} "
+                      f"({record['seconds']:.1f}s)")
+            else:
+                stats['failed'] += 1
+                print(f"[{i}/{len(pending)}] Error processing {record['file_path']}: {record['error']}")
+
+    # Save extractions to new CSV and Parquet files
     try:
-        extractions_df.to_csv('pfizer_extractions_under_20_pages.csv', index=False)
-        print("\nSuccessfully saved extractions to pfizer_extractions_under_20_pages.csv")
+        if output_csv:
+            rows = write_extractions_csv(checkpoint_dir, df_filtered['file_path'], output_csv)
+            print(f"\nSuccessfully saved {rows} extractions to {output_csv}")
     except Exception as e:
         print(f"Error saving CSV: {str(e)}")
+    try:
+        if output_parquet:
+            rows = write_extractions_parquet(checkpoint_dir, df_filtered['file_path'], output_parquet)
+            print(f"Successfully saved {rows} extractions to {output_parquet}")
+    except Exception as e:
+        print(f"Error saving Parquet: {str(e)}")
 
-
-
+    stats['seconds'] = time.perf_counter() - start_time
+    return stats
 
 def main():
-    # print("Starting Pfizer files processing...")
-    # process_pfizer_files()
-    # print("Processing complete!")
+    print("Starting Pfizer files processing...")
+    process_pfizer_files()
+    print("Processing complete!")
 
 
 if __name__ == "__main__":
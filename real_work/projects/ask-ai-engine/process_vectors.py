@@ -1,13 +1,17 @@
 import os
+import sys
 from pathlib import Path
 from vector_store import DenseVectorStore
+from answer_cache import SemanticAnswerCache
 
 def main():
     """Process extracted text and create dense vectors."""
     
     # Initialize paths
     script_dir = Path(__file__).parent.absolute()
-    extractions_path = script_dir / 'pfizer_extractions_under_20_pages.csv'
+    extractions_path = script_dir / 'pfizer_extractions_under_20_pages.parquet'
+    if not extractions_path.exists():
+        extractions_path = script_dir / 'pfizer_extractions_under_20_pages.csv'
     vector_store_path = script_dir / 'vector_store'
     
     # Check if extractions file exists
@@ -20,9 +24,18 @@ def main():
     print("\nInitializing vector store...")
     vector_store = DenseVectorStore(str(vector_store_path))
     
-    # Process extractions
-    print("\nProcessing extractions and creating dense vectors...")
-    vector_store.process_extractions(str(extractions_path))
+    # Process extractions; only new or changed files are embedded unless --full is given
+    incremental = '--full' not in sys.argv[1:]
+    print(f"\nProcessing extractions and creating dense vectors ({'incremental' if incremental else 'full'} sync)...")
+    sync_stats = vector_store.process_extractions(str(extractions_path), incremental=incremental)
+    
+    # Drop chatbot answers generated from chunks that no longer exist
+    answer_cache_path = os.environ.get("ANSWER_CACHE_PATH")
+    if answer_cache_path and os.path.exists(answer_cache_path):
+        answer_cache = SemanticAnswerCache(persist_path=answer_cache_path)
+        dropped = answer_cache.invalidate(sync_stats['deleted_ids'])
+        answer_cache.save()
+        print(f"Invalidated {dropped} cached answers")
     
     # Print vector store stats
     stats = vector_store.get_stats()
@@ -39,9 +52,8 @@ def main():
         "How should the medication be stored?"
     ]
     
-    for query in test_queries:
+    for query, results in zip(test_queries, vector_store.search_many(test_queries)):
         print(f"\nQuery: {query}")
-        results = vector_store.search(query)
         
         for i, result in enumerate(results, 1):
             print(f"\nResult {i}:")
@@ -0,0 +1,162 @@
+import os
+import pickle
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+class QueryEmbeddingCache:
+    """LRU + TTL cache of query embeddings keyed by model name and normalized query text."""
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: Optional[float] = 24 * 3600,
+                 persist_path: Optional[str] = None):
+        """Initialize the cache.
+
+        Args:
+            max_size: Maximum number of embeddings kept; least recently used are evicted first
+            ttl_seconds: Age after which an entry is recomputed, or None to never expire
+            persist_path: Optional file the cache is loaded from now and written to by save()
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if persist_path and os.path.exists(persist_path):
+            self.load(persist_path)
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Normalize query text so trivially different spellings share an entry.
+
+        Unicode is NFKC-normalized and whitespace collapsed; case is kept because
+        cased encoders embed "US" and "us" differently.
+        """
+        return ' '.join(unicodedata.normalize('NFKC', query).split())
+
+    def _key(self, query: str, model_name: str):
+        return model_name, self.normalize(query)
+
+    def get(self, query: str, model_name: str) -> Optional[np.ndarray]:
+        """Return the cached embedding for a query, or None when missing or expired."""
+        key = self._key(query, model_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[1]):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, query: str, model_name: str, embedding: np.ndarray) -> None:
+        """Store an embedding, evicting the least recently used entries beyond max_size."""
+        key = self._key(query, model_name)
+        embedding = np.array(embedding, dtype='float32')
+        # Cached arrays are shared between callers, so make them read-only
+        embedding.setflags(write=False)
+        with self._lock:
+            self._entries[key] = (embedding, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, queries: List[str], model_name: str,
+                       encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Embeddings for queries, calling encode once on just the cache misses.
+
+        Args:
+            queries: Query texts
+            model_name: Name of the model encode uses; part of the cache key
+            encode: Function mapping a list of texts to an (n, dim) array
+
+        Returns:
+            Array of shape (len(queries), dim)
+        """
+        embeddings = [self.get(query, model_name) for query in queries]
+        missing = {}
+        for i, embedding in enumerate(embeddings):
+            if embedding is None:
+                missing.setdefault(self.normalize(queries[i]), []).append(i)
+
+        if missing:
+            # Encode the normalized text so the stored embedding matches its key
+            texts = list(missing)
+            computed = np.asarray(encode(texts), dtype='float32').reshape(len(texts), -1)
+            for text, embedding in zip(texts, computed):
+                self.put(text, model_name, embedding)
+                for i in missing[text]:
+                    embeddings[i] = embedding
+
+        return np.vstack(embeddings) if embeddings else np.empty((0, 0), dtype='float32')
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size."""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Write unexpired entries to path (defaults to persist_path)."""
+        path = path or self.persist_path
+        if not path:
+            raise ValueError("No path given and the cache has no persist_path")
+        with self._lock:
+            entries = [(key, value) for key, value in self._entries.items() if not self._expired(value[1])]
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entries, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> None:
+        """Merge entries saved by save(); expired ones are skipped."""
+        try:
+            with open(path, 'rb') as f:
+                entries = pickle.load(f)
+        except Exception as e:
+            print(f"Error loading query cache {path}: {e}")
+            return
+        for key, (embedding, created_at) in entries:
+            if not self._expired(created_at):
+                embedding.setflags(write=False)
+                with self._lock:
+                    self._entries[key] = (embedding, created_at)
+        with self._lock:
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+_shared_cache = None
+
+def shared_query_cache() -> QueryEmbeddingCache:
+    """Process-wide cache used by RAGSystem, DenseVectorStore and RAGChatbot unless one is passed in.
+
+    Set QUERY_CACHE_PATH to persist it across runs.
+    """
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = QueryEmbeddingCache(persist_path=os.environ.get("QUERY_CACHE_PATH"))
+    return _shared_cache
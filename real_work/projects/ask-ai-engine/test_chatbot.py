@@ -0,0 +1,59 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from chromadb.utils import embedding_functions
+
+import chatbot
+from query_cache import QueryEmbeddingCache
+from test_vector_store import HashEmbeddingFunction
+
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setattr(embedding_functions, 'SentenceTransformerEmbeddingFunction', HashEmbeddingFunction)
+    bot = chatbot.RAGChatbot(str(tmp_path / 'store'), query_cache=QueryEmbeddingCache(max_size=0))
+    # One search thread, so a prefetch queued behind a running one has not started yet
+    bot.vector_store._executor = ThreadPoolExecutor(max_workers=1)
+    searched = []
+    release = threading.Event()
+
+    def get_relevant_results(query, n_results=3, where=None):
+        searched.append(query)
+        release.wait(timeout=5)
+        return [{'text': query}]
+
+    monkeypatch.setattr(bot, '_get_relevant_results', get_relevant_results)
+    bot.searched = searched
+    bot.release = release
+    yield bot
+    release.set()
+    bot.vector_store._executor.shutdown()
+
+
+def test_unused_prefetches_do_not_pile_up(bot):
+    bot.prefetch_context("first")
+    first = bot._prefetched[1]
+    bot.prefetch_context("second")
+    second = bot._prefetched[1]
+    bot.prefetch_context("third")
+
+    # Only the latest prefetch is pending; the queued one was cancelled before it ran
+    assert bot._prefetched[0] == "third"
+    assert second.cancelled()
+
+    bot.release.set()
+    first.result(timeout=5)
+    assert bot._retrieve("something else") == [{'text': "something else"}]
+    assert bot._prefetched is None
+    assert "second" not in bot.searched
+
+
+def test_matching_prefetch_is_used(bot):
+    bot.release.set()
+    bot.prefetch_context("next question")
+    bot.prefetch_context("next question")
+    assert bot._retrieve("next question") == [{'text': "next question"}]
+    assert bot.searched == ["next question"]
+    assert bot._prefetched is None
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+from chromadb.api.types import EmbeddingFunction
+from chromadb.utils import embedding_functions
+
+import vector_store
+from query_cache import QueryEmbeddingCache
+
+
+class HashEmbeddingFunction(EmbeddingFunction):
+    """Deterministic 8-dimensional embeddings, so the tests need no model download."""
+
+    def __init__(self, model_name=None, **kwargs):
+        pass
+
+    def __call__(self, input):
+        return [np.random.default_rng(abs(hash(text)) % 2**32).standard_normal(8).astype('float32')
+                for text in input]
+
+    @staticmethod
+    def name():
+        return "test-hash"
+
+    def get_config(self):
+        return {}
+
+    @staticmethod
+    def build_from_config(config):
+        return HashEmbeddingFunction()
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_functions, 'SentenceTransformerEmbeddingFunction', HashEmbeddingFunction)
+    return vector_store.DenseVectorStore(str(tmp_path / 'store'), query_cache=QueryEmbeddingCache(max_size=0))
+
+
+def write_extractions(path, texts):
+    pd.DataFrame({'file_path': list(texts), 'num_pages': 1, 'extracted_text': list(texts.values())}).to_csv(path, index=False)
+
+
+def test_failed_chunk_is_retried_on_next_incremental_sync(store, tmp_path, monkeypatch):
+    csv_path = tmp_path / 'extractions.csv'
+    # Three paragraphs of one file, far enough apart to land in separate chunks
+    text = '\n\n'.join(f"Paragraph {i}. " + f"word{i} " * 150 for i in range(3))
+    write_extractions(csv_path, {'a.pdf': text})
+
+    collection = store.collection
+    real_upsert = collection.upsert
+    failing = {}
+
+    def flaky_upsert(**kwargs):
+        if not failing:
+            failing['id'] = kwargs['ids'][-1]
+        if failing['id'] in kwargs['ids']:
+            raise ValueError("simulated write failure")
+        return real_upsert(**kwargs)
+
+    monkeypatch.setattr(collection, 'upsert', flaky_upsert)
+    first = store.process_extractions(str(csv_path), incremental=True)
+    total = first['embedded_chunks'] + first['failed_chunks']
+    assert first['failed_chunks'] == 1
+    assert collection.count() == total - 1
+
+    monkeypatch.setattr(collection, 'upsert', real_upsert)
+    second = store.process_extractions(str(csv_path), incremental=True)
+    assert second['embedded_chunks'] == 1
+    assert second['reused_chunks'] == total - 1
+    assert collection.count() == total
+    assert collection.get(ids=[failing['id']])['ids'] == [failing['id']]
+
+    third = store.process_extractions(str(csv_path), incremental=True)
+    assert third['unchanged_documents'] == 1
+    assert collection.count() == total
+
+
+def test_failed_delete_is_retried_on_next_sync(store, tmp_path, monkeypatch):
+    csv_path = tmp_path / 'extractions.csv'
+    write_extractions(csv_path, {'a.pdf': "First version of the document.", 'b.pdf': "Another document."})
+    store.process_extractions(str(csv_path), incremental=True)
+    stale_ids = store._load_manifest()['a.pdf']['chunk_ids']
+
+    collection = store.collection
+    real_delete = collection.delete
+
+    def failing_delete(**kwargs):
+        raise ValueError("simulated delete failure")
+
+    write_extractions(csv_path, {'a.pdf': "Second version of the document.", 'b.pdf': "Another document."})
+    monkeypatch.setattr(collection, 'delete', failing_delete)
+    second = store.process_extractions(str(csv_path), incremental=True)
+    assert second['failed_delete_ids'] == stale_ids
+    assert collection.get(ids=stale_ids)['ids'] == stale_ids
+
+    monkeypatch.setattr(collection, 'delete', real_delete)
+    third = store.process_extractions(str(csv_path), incremental=True)
+    assert third['unchanged_documents'] == 2
+    assert third['deleted_ids'] == stale_ids
+    assert collection.get(ids=stale_ids)['ids'] == []
+    assert store.PENDING_DELETES_KEY not in store._load_manifest()
@@ -1,31 +1,46 @@
+import asyncio
+import hashlib
+import json
 import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import pandas as pd
-from typing import List, Dict
+from typing import List, Dict, Optional
+import numpy as np
 import chromadb
 from chromadb.utils import embedding_functions
-from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
+from query_cache import QueryEmbeddingCache, shared_query_cache
+from extraction_store import iter_document_frames
 
 class DenseVectorStore:
     """Handles dense vector storage and retrieval using ChromaDB."""
     
-    def __init__(self, persist_dir: str = "./vector_store"):
+    # Manifest key holding chunk ids a sync failed to delete; never a file path
+    PENDING_DELETES_KEY = '__pending_deletes__'
+    
+    def __init__(self, persist_dir: str = "./vector_store", query_cache: Optional[QueryEmbeddingCache] = None):
         """Initialize the vector store.
         
         Args:
             persist_dir: Directory to persist ChromaDB
+            query_cache: Cache for query embeddings; defaults to the process-wide shared cache
         """
         self.persist_dir = persist_dir
+        self.model_name = 'all-mpnet-base-v2'
+        self.query_cache = query_cache if query_cache is not None else shared_query_cache()
+        self._executor = None
         os.makedirs(persist_dir, exist_ok=True)
         
-        # Initialize sentence transformer for embeddings
-        self.embedding_model = SentenceTransformer('all-mpnet-base-v2')
-        
         # Initialize ChromaDB with sentence transformer embeddings
         self.embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name='all-mpnet-base-v2'
+            model_name=self.model_name
         )
+        # Encode with the model the embedding function already loaded rather than a second copy
+        self.embedding_model = getattr(self.embedding_function, '_model', None)
         
         # Initialize ChromaDB client with persistence
         self.client = chromadb.PersistentClient(path=persist_dir)
@@ -80,113 +95,347 @@ class DenseVectorStore:
         
         return chunks
     
-    def process_extractions(self, csv_path: str, batch_size: int = 100):
+    def process_extractions(self, csv_path: str, batch_size: int = 1000, csv_chunksize: int = 500,
+                            incremental: bool = False) -> Dict:
         """Process extracted text from CSV and add to vector store.
         
+        The CSV is streamed csv_chunksize rows at a time. Chunks are embedded here in
+        batches of batch_size and upserted with their embeddings by a background thread,
+        so Chroma writes overlap with encoding the next batch.
+        
+        Chunk ids hash the file path and chunk text, and a manifest in persist_dir records
+        each file's text hash and chunk ids. Chunks that disappear from a re-processed file
+        are deleted. With incremental=True, files whose text is unchanged are skipped
+        entirely, only chunks with new ids are embedded, and files no longer in the CSV
+        are removed from the store. Deletes that fail are kept in the manifest and retried
+        on the next run.
+        
         Args:
-            csv_path: Path to CSV file with extractions
-            batch_size: Number of chunks to process at once
+            csv_path: Path to CSV file with extractions, or to the per-page Parquet file
+                main.py writes (only file_path, num_pages and text are read from it)
+            batch_size: Number of chunks embedded and written at once
+            csv_chunksize: Number of CSV rows read at once
+            incremental: Sync against the manifest instead of re-embedding every file
+            
+        Returns:
+            Dictionary with document/chunk counts, the deleted chunk ids, seconds and
+            embedded chunks per second
         """
-        # Read the CSV
-        df = pd.read_csv(csv_path)
-        print(f"Processing {len(df)} documents...")
-        
-        # Process each document
-        current_batch = {
-            'documents': [],
-            'metadatas': [],
-            'ids': []
-        }
-        
-        for idx, row in tqdm(df.iterrows(), total=len(df)):
-            # Get text content
-            text = row['extracted_text']
-            if not isinstance(text, str) or not text.strip():
-                continue
-                
-            # Chunk the text
-            chunks = self.chunk_text(text)
+        start_time = time.perf_counter()
+        manifest = self._load_manifest()
+        pending_deletes = manifest.pop(self.PENDING_DELETES_KEY, [])
+        # Stores written before the manifest existed hold chunks under other ids; look them up per file
+        check_collection = not manifest and self.collection.count() > 0
+        writes = queue.Queue(maxsize=2)
+        stats = {'documents': 0, 'unchanged_documents': 0, 'removed_documents': 0, 'embedded_chunks': 0,
+                 'reused_chunks': 0, 'deleted_chunks': 0, 'failed_chunks': 0, 'failed_ids': set(), 'deleted_ids': [],
+                 'failed_delete_ids': [], 'failed_update_ids': []}
+        writer = threading.Thread(target=self._write_batches, args=(writes, stats), daemon=True)
+        writer.start()
+        if pending_deletes:
+            writes.put(('delete', pending_deletes))
+        
+        seen_files = set()
+        chunk_files = {}
+        current_batch = self._new_batch()
+        reused_batch = self._new_batch()
+        
+        try:
+            if str(csv_path).endswith('.parquet'):
+                reader = iter_document_frames(csv_path, documents_per_frame=csv_chunksize)
+            else:
+                reader = pd.read_csv(csv_path, chunksize=csv_chunksize,
+                                     usecols=['file_path', 'num_pages', 'extracted_text'])
+            for rows in tqdm(reader, desc="CSV chunks"):
+                for row in rows.itertuples(index=False):
+                    # Get text content
+                    text = row.extracted_text
+                    if not isinstance(text, str) or not text.strip():
+                        continue
+                    stats['documents'] += 1
+                    seen_files.add(row.file_path)
+                    
+                    text_hash = self._hash(text)
+                    entry = manifest.get(row.file_path)
+                    if incremental and entry and entry['text_hash'] == text_hash:
+                        stats['unchanged_documents'] += 1
+                        continue
+                    
+                    if entry:
+                        old_ids = set(entry['chunk_ids'])
+                    elif check_collection:
+                        old_ids = set(self.collection.get(where={'file_path': row.file_path}, include=[])['ids'])
+                    else:
+                        old_ids = set()
+                    
+                    # Chunk the text
+                    chunks = self.chunk_text(text)
+                    chunk_ids = self._chunk_ids(row.file_path, chunks)
+                    manifest[row.file_path] = {'text_hash': text_hash, 'chunk_ids': chunk_ids}
+                    
+                    stale_ids = list(old_ids - set(chunk_ids))
+                    if stale_ids:
+                        writes.put(('delete', stale_ids))
+                    
+                    for i, (chunk, chunk_id) in enumerate(zip(chunks, chunk_ids)):
+                        metadata = {
+                            'file_path': row.file_path,
+                            'chunk_index': i,
+                            'total_chunks': len(chunks),
+                            'num_pages': row.num_pages
+                        }
+                        chunk_files[chunk_id] = row.file_path
+                        
+                        # Chunks already stored only need their position metadata refreshed
+                        batch = reused_batch if incremental and chunk_id in old_ids else current_batch
+                        batch['documents'].append(chunk)
+                        batch['metadatas'].append(metadata)
+                        batch['ids'].append(chunk_id)
+                        
+                        # If batch is full, embed it and queue it for writing
+                        if len(current_batch['ids']) >= batch_size:
+                            self._embed_and_queue(current_batch, writes)
+                            current_batch = self._new_batch()
+                        if len(reused_batch['ids']) >= batch_size:
+                            writes.put(('update', reused_batch))
+                            reused_batch = self._new_batch()
             
-            # Add chunks to current batch
-            for i, chunk in enumerate(chunks):
-                chunk_id = f"{row['file_path']}_{i}"
-                metadata = {
-                    'file_path': row['file_path'],
-                    'chunk_index': i,
-                    'total_chunks': len(chunks),
-                    'num_pages': row['num_pages']
-                }
-                
-                current_batch['documents'].append(chunk)
-                current_batch['metadatas'].append(metadata)
-                current_batch['ids'].append(chunk_id)
-                
-                # If batch is full, add to collection
-                if len(current_batch['documents']) >= batch_size:
-                    self._add_batch(current_batch)
-                    current_batch = {
-                        'documents': [],
-                        'metadatas': [],
-                        'ids': []
-                    }
+            # Add remaining chunks
+            if current_batch['ids']:
+                self._embed_and_queue(current_batch, writes)
+            if reused_batch['ids']:
+                writes.put(('update', reused_batch))
+            
+            if incremental:
+                for file_path in set(manifest) - seen_files:
+                    writes.put(('delete', manifest.pop(file_path)['chunk_ids']))
+                    stats['removed_documents'] += 1
+        finally:
+            writes.put(None)
+            writer.join()
         
-        # Add remaining chunks
-        if current_batch['documents']:
-            self._add_batch(current_batch)
+        # Failed chunks leave their file without a text hash so the next sync retries it, and
+        # are dropped from its chunk ids so the retry embeds and upserts them rather than
+        # updating the metadata of chunks Chroma never stored
+        for chunk_id in stats.pop('failed_ids'):
+            entry = manifest[chunk_files[chunk_id]]
+            entry['text_hash'] = None
+            entry['chunk_ids'] = [stored_id for stored_id in entry['chunk_ids'] if stored_id != chunk_id]
+        # Chunks whose metadata update failed are still stored, so a retry only has to update them again
+        for chunk_id in stats['failed_update_ids']:
+            manifest[chunk_files[chunk_id]]['text_hash'] = None
+        # Chunks Chroma failed to delete are no longer listed under any file; keep them for the next run
+        if stats['failed_delete_ids']:
+            manifest[self.PENDING_DELETES_KEY] = stats['failed_delete_ids']
+        self._save_manifest(manifest)
+        
+        stats['seconds'] = time.perf_counter() - start_time
+        stats['chunks_per_sec'] = stats['embedded_chunks'] / stats['seconds'] if stats['seconds'] else 0.0
+        print(f"Embedded {stats['embedded_chunks']} chunks from {stats['documents']} documents in {stats['seconds']:.1f}s "
+              f"({stats['chunks_per_sec']:.1f} chunks/sec); {stats['unchanged_documents']} documents unchanged, "
+              f"{stats['reused_chunks']} chunks reused, {stats['deleted_chunks']} deleted, {stats['failed_chunks']} failed, "
+              f"{len(stats['failed_delete_ids'])} deletes and {len(stats['failed_update_ids'])} updates failed")
+        print(f"Vector store now holds {self.collection.count()} chunks")
+        return stats
+    
+    @staticmethod
+    def _new_batch() -> Dict:
+        return {'documents': [], 'metadatas': [], 'ids': []}
+    
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+    
+    def _chunk_ids(self, file_path: str, chunks: List[str]) -> List[str]:
+        """Content-hash ids, so an unchanged chunk keeps its id when others around it change.
+        
+        Args:
+            file_path: File the chunks come from; part of the hash so files never share ids
+            chunks: Chunk texts in order
+            
+        Returns:
+            One id per chunk; repeated chunks within a file get an occurrence suffix
+        """
+        ids = []
+        occurrences = {}
+        for chunk in chunks:
+            chunk_id = self._hash(f"{file_path}\0{chunk}")
+            occurrences[chunk_id] = occurrences.get(chunk_id, 0) + 1
+            ids.append(chunk_id if occurrences[chunk_id] == 1 else f"{chunk_id}-{occurrences[chunk_id]}")
+        return ids
+    
+    def _manifest_path(self) -> str:
+        return os.path.join(self.persist_dir, 'sync_manifest.json')
+    
+    def _load_manifest(self) -> Dict:
+        """Per-file {'text_hash', 'chunk_ids'} written by the last process_extractions run, plus
+        the chunk ids it failed to delete under PENDING_DELETES_KEY."""
+        try:
+            with open(self._manifest_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+    
+    def _save_manifest(self, manifest: Dict):
+        tmp_path = self._manifest_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._manifest_path())
+    
+    def _encode(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """Embed texts with the collection's model.
         
-        print(f"Added {self.collection.count()} chunks to vector store")
+        Args:
+            texts: Texts to embed
+            batch_size: Encoder batch size
+            
+        Returns:
+            float32 array of shape (len(texts), dim)
+        """
+        if self.embedding_model is None:
+            return np.asarray(self.embedding_function(texts), dtype='float32')
+        return np.asarray(self.embedding_model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=getattr(self.embedding_function, 'normalize_embeddings', False)
+        ), dtype='float32')
     
-    def _add_batch(self, batch: Dict):
-        """Add a batch of chunks to the collection.
+    def _embed_and_queue(self, batch: Dict, writes: queue.Queue):
+        """Embed a batch and hand it to the writer thread; blocks while two batches are already waiting."""
+        batch['embeddings'] = self._encode(batch['documents'])
+        writes.put(('upsert', batch))
+    
+    def _write_batches(self, writes: queue.Queue, stats: Dict):
+        """Writer thread: apply queued ('upsert' | 'update' | 'delete', payload) operations until None arrives."""
+        while True:
+            operation = writes.get()
+            if operation is None:
+                break
+            action, payload = operation
+            try:
+                if action == 'delete':
+                    self.collection.delete(ids=payload)
+                    stats['deleted_chunks'] += len(payload)
+                    stats['deleted_ids'].extend(payload)
+                elif action == 'update':
+                    self.collection.update(ids=payload['ids'], metadatas=payload['metadatas'])
+                    stats['reused_chunks'] += len(payload['ids'])
+                else:
+                    failed_ids = self._upsert_batch(payload)
+                    stats['embedded_chunks'] += len(payload['ids']) - len(failed_ids)
+                    stats['failed_chunks'] += len(failed_ids)
+                    stats['failed_ids'].update(failed_ids)
+            except Exception as e:
+                if action == 'delete':
+                    stats['failed_delete_ids'].extend(payload)
+                elif action == 'update':
+                    stats['failed_update_ids'].extend(payload['ids'])
+                print(f"Error applying {action} for {len(payload if action == 'delete' else payload['ids'])} chunks: {str(e)}")
+    
+    def _upsert_batch(self, batch: Dict) -> List[str]:
+        """Upsert a batch with precomputed embeddings, halving it on errors to isolate bad records.
         
         Args:
-            batch: Dictionary containing documents, metadatas, and ids
+            batch: Dictionary containing documents, metadatas, ids and embeddings
+            
+        Returns:
+            Ids of the chunks that could not be written
         """
         try:
-            self.collection.add(
+            self.collection.upsert(
                 documents=batch['documents'],
                 metadatas=batch['metadatas'],
-                ids=batch['ids']
+                ids=batch['ids'],
+                embeddings=[embedding.tolist() for embedding in batch['embeddings']]
             )
+            return []
         except Exception as e:
-            print(f"Error adding batch: {str(e)}")
-            # Try adding one by one
-            for i in range(len(batch['documents'])):
-                try:
-                    self.collection.add(
-                        documents=[batch['documents'][i]],
-                        metadatas=[batch['metadatas'][i]],
-                        ids=[batch['ids'][i]]
-                    )
-                except Exception as e:
-                    print(f"Error adding document {batch['ids'][i]}: {str(e)}")
-    
-    def search(self, query: str, n_results: int = 5) -> List[Dict]:
+            if len(batch['ids']) == 1:
+                print(f"Error adding document {batch['ids'][0]}: {str(e)}")
+                return list(batch['ids'])
+            middle = len(batch['ids']) // 2
+            return [chunk_id for part in (slice(None, middle), slice(middle, None))
+                    for chunk_id in self._upsert_batch({key: values[part] for key, values in batch.items()})]
+    
+    def search(self, query: str, n_results: int = 5, where: Optional[Dict] = None) -> List[Dict]:
         """Search for similar text chunks.
         
         Args:
             query: Search query
             n_results: Number of results to return
+            where: Optional Chroma metadata filter, e.g. {'file_path': path}
             
         Returns:
             List of dictionaries containing chunks and metadata
         """
+        return self.search_many([query], n_results=n_results, where=where)[0]
+    
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Embed queries with the collection's model through the query cache.
+        
+        A repeated query skips the encoder but still matches the stored vectors.
+        
+        Args:
+            queries: Query texts
+            
+        Returns:
+            float32 array of shape (len(queries), dim)
+        """
+        return self.query_cache.get_or_compute(list(queries), self.model_name, self._encode)
+    
+    def search_many(self, queries: List[str], n_results: int = 5, where: Optional[Dict] = None) -> List[List[Dict]]:
+        """Search for several queries with one embedding batch and one Chroma query.
+        
+        Args:
+            queries: Search queries
+            n_results: Number of results to return per query
+            where: Optional Chroma metadata filter applied to every query
+            
+        Returns:
+            One result list per query, in the same format as search()
+        """
+        if not queries:
+            return []
+        
+        query_embeddings = self.embed_queries(queries)
         results = self.collection.query(
-            query_texts=[query],
-            n_results=n_results
+            query_embeddings=query_embeddings.tolist(),
+            n_results=n_results,
+            where=where
         )
         
         # Format results
-        formatted_results = []
-        for i in range(len(results['documents'][0])):
-            result = {
-                'chunk': results['documents'][0][i],
-                'metadata': results['metadatas'][0][i],
-                'distance': results['distances'][0][i] if 'distances' in results else None
-            }
-            formatted_results.append(result)
-        
-        return formatted_results
+        all_results = []
+        for q in range(len(queries)):
+            formatted_results = []
+            for i in range(len(results['documents'][q])):
+                result = {
+                    'id': results['ids'][q][i],
+                    'chunk': results['documents'][q][i],
+                    'metadata': results['metadatas'][q][i],
+                    'distance': results['distances'][q][i] if results.get('distances') else None
+                }
+                formatted_results.append(result)
+            all_results.append(formatted_results)
+        
+        return all_results
+    
+    def _thread_pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="vector-search")
+        return self._executor
+    
+    async def asearch(self, query: str, n_results: int = 5, where: Optional[Dict] = None) -> List[Dict]:
+        """search() on the store's thread pool, so an event loop is not blocked on retrieval."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._thread_pool(), lambda: self.search(query, n_results, where))
+    
+    async def asearch_many(self, queries: List[str], n_results: int = 5,
+                           where: Optional[Dict] = None) -> List[List[Dict]]:
+        """search_many() on the store's thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._thread_pool(), lambda: self.search_many(queries, n_results, where))
     
     def get_stats(self) -> Dict:
         """Get statistics about the vector store.
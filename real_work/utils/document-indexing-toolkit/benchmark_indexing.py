@@ -0,0 +1,555 @@
+#!/usr/bin/env python3
+"""
+Benchmark Script for Vector Indexing Throughput
+
+With --benchmark=throughput (the default), this script measures
+VectorIndexer.process_and_index_files on copies of the test_data sample document,
+using the mock parser and embedding model from mock_dependencies.py with simulated
+inference latency:
+1. The previous serial driver (parse every file, then embed everything)
+2. The pipelined driver with different numbers of parser processes
+
+With --benchmark=index, it measures VectorIndexer.build_index on clustered synthetic
+vectors: build time, query time, recall@10 against exact cosine search and index
+size, for the previous flat L2 index and the index types choose_index_spec offers.
+
+With --benchmark=store, it measures VectorIndexer.save_index and ChunkStore on a
+synthetic index of --chunks chunks against the previous JSON + pickle sidecars: save
+time, load time and disk size.
+
+With --benchmark=split, it times ChunkExtractor.split_text against the previous
+character-sized splitter on a synthetic text of --text-mb MB and reports how many
+chunks exceed what the embedding model reads (MODEL_MAX_TOKENS).
+
+With --benchmark=inventory, it times FileInventoryCreator.scan_directory on a synthetic
+tree of --files files (30% small PDFs) against the previous os.walk scanner, which
+counted pages with pdfplumber under a lock and grew the DataFrame one row at a time.
+The previous scanner also loaded RAGFlowPdfParser's models first; that cost is not
+included, since the models are not available here.
+
+With --benchmark=refresh, it indexes --files copies of the sample document, then
+changes, adds and deletes --changed files each and times bringing the inventory and
+index up to date: a full rescan and re-index against an incremental refresh
+(create_inventory(incremental=True)) and incremental process_and_index_files.
+
+Usage:
+    python benchmark_indexing.py [--files=200] [--workers 1 2 4]
+    python benchmark_indexing.py --benchmark=index [--sizes 10000 100000 1000000]
+    python benchmark_indexing.py --benchmark=store [--chunks=100000]
+    python benchmark_indexing.py --benchmark=split [--text-mb=5]
+    python benchmark_indexing.py --benchmark=inventory --files=10000 [--workers 1 2 4]
+    python benchmark_indexing.py --benchmark=refresh [--files=200] [--changed=2]
+
+Options:
+    --benchmark: throughput, index, store, split, inventory or refresh (default: throughput)
+    --sizes: Corpus sizes for the index benchmark (default: 10000 100000 1000000)
+    --chunks: Chunks in the store benchmark's index (default: 100000)
+    --text-mb: Size of the split benchmark's text in MB (default: 5)
+    --files: Number of copies of the sample document to index, or files in the
+        inventory benchmark's tree (default: 200)
+    --workers: Parser (or page counting) process counts to benchmark (default: 1 2 4)
+    --changed: Files changed, added and deleted each in the refresh benchmark (default: 2)
+    --parse-ms: Simulated parse time per file in ms (default: 50)
+    --batch-ms: Simulated embedding time per batch of 32 in ms (default: 20)
+    --text-ms: Simulated embedding time per chunk in ms (default: 2)
+"""
+
+import os
+import sys
+import shutil
+import argparse
+import json
+import logging
+import mimetypes
+import pickle
+import tempfile
+import threading
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+current_dir = Path(__file__).parent.absolute()
+sys.path.insert(0, str(current_dir))
+
+from mock_dependencies import patch_modules, patch_indexing_modules, MockPdfParser, MockSentenceTransformer
+patch_modules()
+patch_indexing_modules()
+
+import create_vector_index
+from create_vector_index import ChunkExtractor, ChunkStore, VectorIndexer, choose_index_spec, MODEL_MAX_TOKENS
+
+sample_document = current_dir / "test_data" / "sample_document.txt"
+
+def create_uploads(uploads_dir, n_files):
+    """Copy the sample document n_files times as PDFs and return their inventory."""
+    rows = []
+    for i in range(n_files):
+        rel_path = f"sample_{i:05d}.pdf"
+        shutil.copy(sample_document, os.path.join(uploads_dir, rel_path))
+        rows.append({
+            'file_name': rel_path,
+            'file_path': rel_path,
+            'file_type': 'application/pdf',
+            'extracted_tables': False,
+            'extracted_text': False,
+        })
+    return pd.DataFrame(rows)
+
+def legacy_process_and_index_files(indexer, inventory_df, uploads_dir):
+    """The serial driver process_and_index_files ran before the pipeline."""
+    chunk_extractor = ChunkExtractor()
+    pdf_files = inventory_df[inventory_df['file_type'] == 'application/pdf']
+    for _, row in pdf_files.iterrows():
+        chunks = chunk_extractor.process_pdf(os.path.join(uploads_dir, row['file_path']))
+        indexer.add_chunks(chunks)
+        inventory_df.loc[inventory_df['file_path'] == row['file_path'], 'extracted_text'] = True
+        if len([c for c in chunks if c['chunk_type'] == 'table']) > 0:
+            inventory_df.loc[inventory_df['file_path'] == row['file_path'], 'extracted_tables'] = True
+    indexer.generate_embeddings()
+    indexer.build_index()
+    indexer.save_index()
+    return inventory_df
+
+def run(label, work_dir, n_files, workers=None):
+    """Index n_files copies once and return throughput figures."""
+    uploads_dir = os.path.join(work_dir, "uploads")
+    os.makedirs(uploads_dir, exist_ok=True)
+    inventory_df = create_uploads(uploads_dir, n_files)
+    indexer = VectorIndexer(output_dir=os.path.join(work_dir, f"index_{label}"))
+
+    start = time.perf_counter()
+    if workers is None:
+        inventory_df = legacy_process_and_index_files(indexer, inventory_df, uploads_dir)
+    else:
+        inventory_df = indexer.process_and_index_files(inventory_df, uploads_dir, max_workers=workers)
+    seconds = time.perf_counter() - start
+
+    indexed = indexer.index.ntotal if create_vector_index.VECTOR_LIBS_AVAILABLE else len(indexer.chunks)
+    return {
+        'label': label,
+        'seconds': seconds,
+        'files_per_second': n_files / seconds,
+        'chunks': len(indexer.chunks),
+        'indexed_vectors': indexed,
+        'files_marked': int(inventory_df['extracted_text'].sum()),
+    }
+
+def synthetic_embeddings(n, dim, rng, points_per_cluster=100):
+    """Clustered float32 vectors, a rough stand-in for sentence embeddings of related chunks."""
+    centers = rng.standard_normal((max(1, n // points_per_cluster), dim), dtype=np.float32)
+    vectors = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 100000):
+        end = min(n, start + 100000)
+        vectors[start:end] = centers[rng.integers(len(centers), size=end - start)]
+        vectors[start:end] += 0.5 * rng.standard_normal((end - start, dim), dtype=np.float32)
+    return vectors
+
+def exact_neighbors(vectors, queries, k):
+    """Top-k ids by cosine similarity, computed blockwise without copying the corpus."""
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), k), dtype=np.int64)
+    for start in range(0, len(vectors), 100000):
+        block = vectors[start:start + 100000]
+        scores = (queries @ block.T) / np.linalg.norm(block, axis=1)
+        scores = np.hstack([best_scores, scores])
+        ids = np.hstack([best_ids, np.arange(start, start + len(block))[None, :].repeat(len(queries), 0)])
+        top = np.argpartition(-scores, k, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, top, 1)
+        best_ids = np.take_along_axis(ids, top, 1)
+    return best_ids
+
+def measure_index(index, queries, truth, k, work_dir):
+    """Query time, recall@k and on-disk size of a built index."""
+    start = time.perf_counter()
+    _, ids = index.search(queries, k)
+    query_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    recall = np.mean([len(set(found) & set(expected)) / k for found, expected in zip(ids, truth)])
+    path = os.path.join(work_dir, "index.bin")
+    create_vector_index.faiss.write_index(index, path)
+    size_mb = os.path.getsize(path) / 1e6
+    os.remove(path)
+    return query_ms, recall, size_mb
+
+def benchmark_index(sizes, dim=384, n_queries=200, k=10, hnsw_max_vectors=100000):
+    """Compare the previous IndexFlatL2 with the index types of choose_index_spec per corpus size."""
+    faiss = create_vector_index.faiss
+    work_dir = tempfile.mkdtemp(prefix="index_bench_")
+    rng = np.random.default_rng(0)
+    results = []
+    
+    def record(n, label, build_seconds, index, queries):
+        query_ms, recall, size_mb = measure_index(index, queries, truth, k, work_dir)
+        results.append({'vectors': n, 'index': label, 'build_seconds': build_seconds, 'query_ms': query_ms,
+                        'recall': recall, 'size_mb': size_mb})
+        print(f"{n:>8} | {label:>36} | build {build_seconds:7.2f} s | query {query_ms:7.3f} ms | "
+              f"recall@{k} {recall:.3f} | {size_mb:8.1f} MB", flush=True)
+    
+    try:
+        for n in sizes:
+            # Queries are held-out points of the same clusters as the corpus
+            vectors = synthetic_embeddings(n + n_queries, dim, rng)
+            raw_queries = vectors[n:].copy()
+            queries = raw_queries / np.linalg.norm(raw_queries, axis=1, keepdims=True)
+            vectors = vectors[:n]
+            truth = exact_neighbors(vectors, queries, k)
+            
+            # Previous index: exact L2 on the raw, unnormalized vectors and queries
+            start = time.perf_counter()
+            index = faiss.IndexFlatL2(dim)
+            index.add(vectors)
+            build_seconds = time.perf_counter() - start
+            record(n, 'before: FlatL2', build_seconds, index, raw_queries)
+            del index
+            
+            index_types = ['auto', 'flat', 'ivf_flat', 'ivf_pq']
+            if n <= hnsw_max_vectors:
+                index_types.append('hnsw')
+            for index_type in index_types:
+                spec = choose_index_spec(n, dim, index_type)
+                if index_type != 'auto' and spec == choose_index_spec(n, dim):
+                    continue
+                indexer = VectorIndexer(output_dir=work_dir, index_type=index_type)
+                indexer.vector_dim = dim
+                # build_index normalizes in place, which keeps the exact neighbors unchanged
+                indexer.embeddings = vectors
+                start = time.perf_counter()
+                indexer.build_index()
+                build_seconds = time.perf_counter() - start
+                record(n, f"{index_type}: {indexer.index_spec}", build_seconds, indexer.index, queries)
+                del indexer
+            del vectors
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+def legacy_save_index(indexer):
+    """The sidecar files save_index wrote before the compact layout (the FAISS index is unchanged)."""
+    with open(indexer.output_dir / 'chunk_metadata.json', 'w') as f:
+        json.dump(indexer.metadata, f, indent=2)
+    np.save(indexer.output_dir / 'embeddings.npy', indexer.embeddings)
+    with open(indexer.output_dir / 'chunks.pkl', 'wb') as f:
+        pickle.dump(indexer.chunks, f)
+    create_vector_index.faiss.write_index(indexer.index, str(indexer.output_dir / 'faiss_index.bin'))
+
+def legacy_load_index(index_dir):
+    """Everything a reader of the previous layout had to load to look up chunks."""
+    with open(os.path.join(index_dir, 'chunk_metadata.json')) as f:
+        metadata = json.load(f)
+    with open(os.path.join(index_dir, 'chunks.pkl'), 'rb') as f:
+        chunks = pickle.load(f)
+    embeddings = np.load(os.path.join(index_dir, 'embeddings.npy'))
+    return chunks, metadata, embeddings
+
+def directory_mb(path, exclude=('faiss_index.bin',)):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path) if name not in exclude) / 1e6
+
+def benchmark_store(n_chunks, dim=384, chunks_per_document=20, lookups=100):
+    """Save/load time and disk size of the previous sidecars against the compact layout."""
+    faiss = create_vector_index.faiss
+    rng = np.random.default_rng(0)
+    words = sample_document.read_text().split()
+    chunks = []
+    for i in range(n_chunks):
+        chunks.append({
+            'text': ' '.join(rng.choice(words, 80)),
+            'source': f"/data/uploads/document_{i // chunks_per_document:06d}.pdf",
+            'chunk_type': 'text',
+            'section_idx': i % chunks_per_document,
+            'created_at': f"2025-03-28T10:{i // 6000 % 60:02d}:{i // 100 % 60:02d}.{i % 100:06d}",
+        })
+    embeddings = rng.standard_normal((n_chunks, dim), dtype=np.float32)
+    faiss.normalize_L2(embeddings)
+    index = faiss.IndexFlatIP(dim)
+    index.add(embeddings)
+    sample = rng.choice(n_chunks, lookups, replace=False)
+    
+    work_dir = tempfile.mkdtemp(prefix="store_bench_")
+    try:
+        report = {}
+        for layout in ['before: json + pickle', 'after: compact']:
+            indexer = VectorIndexer(output_dir=os.path.join(work_dir, layout.split(':')[0]))
+            indexer.vector_dim = dim
+            indexer.add_chunks(chunks)
+            indexer.embeddings = embeddings
+            indexer.index = index
+            
+            start = time.perf_counter()
+            if layout.startswith('before'):
+                legacy_save_index(indexer)
+            else:
+                indexer.save_index()
+            save_seconds = time.perf_counter() - start
+            
+            start = time.perf_counter()
+            if layout.startswith('before'):
+                loaded_chunks, _, loaded_embeddings = legacy_load_index(indexer.output_dir)
+                open_seconds = time.perf_counter() - start
+                found = [loaded_chunks[i] for i in sample]
+                vectors = loaded_embeddings[sample]
+            else:
+                store = ChunkStore(indexer.output_dir)
+                open_seconds = time.perf_counter() - start
+                found = [store[int(i)] for i in sample]
+                vectors = store.embeddings[sample]
+            lookup_seconds = time.perf_counter() - start
+            
+            assert found == [chunks[i] for i in sample] and np.array_equal(vectors, embeddings[sample])
+            report[layout] = (save_seconds, open_seconds, lookup_seconds, directory_mb(indexer.output_dir))
+            print(f"{layout:>22} | save {save_seconds:6.2f} s | load {open_seconds * 1000:8.1f} ms | "
+                  f"load + {lookups} lookups {lookup_seconds * 1000:8.1f} ms | "
+                  f"{report[layout][3]:7.1f} MB besides faiss_index.bin", flush=True)
+        return report
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def legacy_split_text(extractor, text, source_file, chunk_size=512, chunk_overlap=50, min_chunk_size=100):
+    """The character-sized splitter split_text was before it counted tokens."""
+    clean_text = extractor.pdf_parser.remove_tag(text)
+    sections = [s for s in clean_text.split('\n\n') if s.strip()]
+    chunks = []
+    current_chunk = ""
+    current_section_idx = 0
+    for section in sections:
+        if len(current_chunk) + len(section) > chunk_size and len(current_chunk) >= min_chunk_size:
+            chunks.append({'text': current_chunk, 'source': source_file, 'chunk_type': 'text',
+                           'section_idx': current_section_idx, 'created_at': datetime.now().isoformat()})
+            if chunk_overlap > 0 and len(current_chunk) > chunk_overlap:
+                overlap_text = current_chunk[-chunk_overlap:]
+                best_break = max([overlap_text.rfind('. '), overlap_text.rfind('\n')])
+                if best_break > 0:
+                    current_chunk = current_chunk[-(best_break+1):]
+                else:
+                    current_chunk = current_chunk[-chunk_overlap:]
+            else:
+                current_chunk = ""
+        if current_chunk and not current_chunk.endswith('\n'):
+            current_chunk += '\n'
+        current_chunk += section
+        current_section_idx += 1
+    if current_chunk and len(current_chunk) >= min_chunk_size:
+        chunks.append({'text': current_chunk, 'source': source_file, 'chunk_type': 'text',
+                       'section_idx': current_section_idx, 'created_at': datetime.now().isoformat()})
+    return chunks
+
+def synthetic_text(n_bytes, rng):
+    """Paragraphs separated by blank lines, with one in five blocks a page of single-spaced lines
+    the way PDF text often comes out."""
+    words = sample_document.read_text().split()
+    blocks = []
+    size = 0
+    while size < n_bytes:
+        if rng.random() < 0.2:
+            lines = [' '.join(rng.choice(words, rng.integers(8, 14))) for _ in range(rng.integers(20, 60))]
+            block = '\n'.join(lines)
+        else:
+            sentences = [' '.join(rng.choice(words, rng.integers(6, 20))) + '.' for _ in range(rng.integers(1, 7))]
+            block = ' '.join(sentences)
+        blocks.append(block)
+        size += len(block) + 2
+    return '\n\n'.join(blocks)
+
+def benchmark_split(text_mb=5):
+    """Time both splitters on one large text and count chunks the model would truncate."""
+    extractor = ChunkExtractor()
+    text = synthetic_text(int(text_mb * 1e6), np.random.default_rng(0))
+    limit = MODEL_MAX_TOKENS - 2
+    tokenizer = 'model tokenizer' if extractor.tokenizer is not None else 'estimated tokens'
+    print(f"{len(text) / 1e6:.1f} MB text, chunks over {limit} tokens ({tokenizer}):")
+    for label, split in [('before: 512 characters', lambda: legacy_split_text(extractor, text, 'doc.pdf')),
+                         (f'after: {extractor.chunk_size} tokens', lambda: extractor.split_text(text, 'doc.pdf'))]:
+        start = time.perf_counter()
+        chunks = split()
+        seconds = time.perf_counter() - start
+        tokens = np.array([len(extractor.token_offsets(chunk['text'])[0]) for chunk in chunks])
+        over = np.mean(tokens > limit)
+        truncated = np.maximum(tokens - limit, 0).sum() / tokens.sum()
+        timestamps = len({chunk['created_at'] for chunk in chunks})
+        print(f"{label:>24} | {seconds:6.2f} s | {len(chunks):6d} chunks | tokens p50 {np.median(tokens):5.0f} "
+              f"max {tokens.max():6d} | {over:6.1%} over the limit, {truncated:6.1%} of tokens truncated | "
+              f"{timestamps} timestamps", flush=True)
+
+def create_inventory_tree(root, n_files, files_per_dir=100, pdf_share=0.3):
+    """A tree of n_files files, files_per_dir to a directory two levels deep, with
+    pdf_share of them PDFs of 1 to 5 pages and the rest small text, CSV, markdown and PNG files."""
+    from pypdf import PdfWriter
+    templates = {}
+    for pages in range(1, 6):
+        writer = PdfWriter()
+        for _ in range(pages):
+            writer.add_blank_page(width=612, height=792)
+        path = os.path.join(root, f'.template_{pages}.pdf')
+        writer.write(path)
+        templates[pages] = Path(path).read_bytes()
+    others = [('txt', sample_document.read_bytes()), ('csv', b'a,b,c\n1,2,3\n'),
+              ('md', b'# Notes\n\nSome text.\n'), ('png', b'\x89PNG\r\n\x1a\n' + bytes(200))]
+    rng = np.random.default_rng(0)
+    for i in range(n_files):
+        directory = os.path.join(root, f'group_{i // (files_per_dir * 10):03d}', f'dir_{i // files_per_dir:04d}')
+        if i % files_per_dir == 0:
+            os.makedirs(directory, exist_ok=True)
+        if rng.random() < pdf_share:
+            name, data = f'report_{i}.pdf', templates[int(rng.integers(1, 6))]
+        else:
+            extension, data = others[int(rng.integers(len(others)))]
+            name = f'file_{i}.{extension}'
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(data)
+    for pages in templates:
+        os.remove(os.path.join(root, f'.template_{pages}.pdf'))
+
+def legacy_scan_directory(creator):
+    """The os.walk scanner scan_directory was before it listed directories concurrently."""
+    import pdfplumber
+    lock = threading.Lock()
+    for root, _, files in os.walk(creator.uploads_dir):
+        for filename in files:
+            if filename.startswith('.'):
+                continue
+            file_path = Path(root) / filename
+            rel_path = file_path.relative_to(creator.uploads_dir)
+            file_size = file_path.stat().st_size
+            file_type = mimetypes.guess_type(file_path)[0] or 'unknown'
+            num_pages = 0
+            if file_type == 'application/pdf':
+                with lock, pdfplumber.open(str(file_path)) as pdf:
+                    num_pages = len(pdf.pages)
+            file_category = creator.guess_file_category(file_path, file_type)
+            creator.inventory_df = pd.concat([creator.inventory_df, pd.DataFrame([{
+                'file_name': filename, 'file_path': str(rel_path), 'file_type': file_type,
+                'num_pages': num_pages, 'file_size': file_size, 'file_category': file_category,
+                'extracted_tables': False, 'extracted_text': False, 'extracted_flow_diagrams': False,
+                'extracted_images': False, 'last_updated': datetime.now().isoformat()
+            }])], ignore_index=True)
+
+def benchmark_inventory(n_files, workers):
+    """Time both scanners on one synthetic tree and check they agree."""
+    from create_file_inventory import FileInventoryCreator
+    work_dir = tempfile.mkdtemp(prefix="inventory_bench_")
+    try:
+        uploads_dir = os.path.join(work_dir, 'uploads')
+        os.makedirs(uploads_dir)
+        create_inventory_tree(uploads_dir, n_files)
+        output_csv = os.path.join(work_dir, 'inventory.csv')
+        
+        runs = [('before: os.walk', lambda creator: legacy_scan_directory(creator))]
+        for n in workers:
+            runs.append((f'after: {n} workers', lambda creator, n=n: creator.scan_directory(max_workers=n)))
+        print(f"{n_files} files (CPUs: {os.cpu_count()}):")
+        reference = None
+        for label, scan in runs:
+            creator = FileInventoryCreator(uploads_dir, output_csv)
+            start = time.perf_counter()
+            scan(creator)
+            seconds = time.perf_counter() - start
+            df = creator.inventory_df.sort_values('file_path', ignore_index=True)
+            pages = df[['file_path', 'num_pages', 'file_size', 'file_category']].astype(str)
+            if reference is None:
+                reference = pages
+            matches = pages.equals(reference)
+            print(f"{label:>20} | {seconds:6.2f} s | {len(df) / seconds:8.0f} files/s | {len(df)} files | "
+                  f"{int(df['num_pages'].sum())} pages | {'matches' if matches else 'DIFFERS FROM'} before", flush=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def benchmark_refresh(n_files, n_changed):
+    """Time a full rebuild against an incremental refresh after a few files changed,
+    and check both index the same chunks."""
+    from create_file_inventory import FileInventoryCreator
+    # The copies are text files named .pdf, so page counting fails on each of them
+    logging.getLogger('create_file_inventory').setLevel(logging.CRITICAL)
+    logging.getLogger('pypdf').setLevel(logging.CRITICAL)
+    work_dir = tempfile.mkdtemp(prefix="refresh_bench_")
+    try:
+        uploads_dir = os.path.join(work_dir, 'uploads')
+        os.makedirs(uploads_dir)
+        create_uploads(uploads_dir, n_files)
+        inventory_csv = os.path.join(work_dir, 'inventory.csv')
+        creator = FileInventoryCreator(uploads_dir, inventory_csv)
+        inventory_df = creator.create_inventory()
+        indexed = VectorIndexer(output_dir=os.path.join(work_dir, 'index')).process_and_index_files(
+            inventory_df, uploads_dir)
+        indexed.to_csv(inventory_csv, index=False)
+        
+        time.sleep(0.01)
+        extra = "\n\nAn added paragraph, so the file's chunks change."
+        for i in range(n_changed):
+            with open(os.path.join(uploads_dir, f"sample_{i:05d}.pdf"), 'a') as f:
+                f.write(extra)
+            shutil.copy(sample_document, os.path.join(uploads_dir, f"added_{i:05d}.pdf"))
+            os.remove(os.path.join(uploads_dir, f"sample_{n_files - 1 - i:05d}.pdf"))
+        
+        results = {}
+        for label, incremental in [('full', False), ('incremental', True)]:
+            index_dir = os.path.join(work_dir, f'index_{label}')
+            shutil.copytree(os.path.join(work_dir, 'index'), index_dir)
+            csv_path = os.path.join(work_dir, f'inventory_{label}.csv')
+            shutil.copy(inventory_csv, csv_path)
+            start = time.perf_counter()
+            inventory_df = FileInventoryCreator(uploads_dir, csv_path).create_inventory(incremental=incremental)
+            statuses = inventory_df['status'].value_counts().to_dict()
+            indexer = VectorIndexer(output_dir=index_dir)
+            inventory_df = indexer.process_and_index_files(inventory_df, uploads_dir, incremental=incremental)
+            seconds = time.perf_counter() - start
+            store = ChunkStore(index_dir)
+            results[label] = sorted(zip(store.values('source'), (store.text(i) for i in range(len(store)))))
+            print(f"{label:>12}: {seconds:6.2f} s | {statuses} | {len(store)} chunks | "
+                  f"{len(inventory_df)} files in inventory", flush=True)
+        print(f"Same chunks indexed: {results['full'] == results['incremental']}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Benchmark vector indexing throughput')
+    parser.add_argument('--benchmark', choices=['throughput', 'index', 'store', 'split', 'inventory', 'refresh'], default='throughput')
+    parser.add_argument('--text-mb', type=float, default=5)
+    parser.add_argument('--chunks', type=int, default=100000)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--changed', type=int, default=2)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--parse-ms', type=float, default=50)
+    parser.add_argument('--batch-ms', type=float, default=20)
+    parser.add_argument('--text-ms', type=float, default=2)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    if args.benchmark == 'index':
+        benchmark_index(args.sizes)
+        sys.exit(0)
+    if args.benchmark == 'store':
+        benchmark_store(args.chunks)
+        sys.exit(0)
+    if args.benchmark == 'split':
+        benchmark_split(args.text_mb)
+        sys.exit(0)
+    if args.benchmark == 'inventory':
+        benchmark_inventory(args.files, args.workers)
+        sys.exit(0)
+    MockPdfParser.parse_seconds = args.parse_ms / 1000
+    MockSentenceTransformer.batch_seconds = args.batch_ms / 1000
+    MockSentenceTransformer.text_seconds = args.text_ms / 1000
+    if args.benchmark == 'refresh':
+        benchmark_refresh(args.files, args.changed)
+        sys.exit(0)
+
+    work_dir = tempfile.mkdtemp(prefix="indexing_bench_")
+    try:
+        results = [run("serial", work_dir, args.files)]
+        for workers in args.workers:
+            results.append(run(f"pipelined_{workers}", work_dir, args.files, workers))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print("\n" + "="*50)
+    print(f"INDEXING THROUGHPUT ({args.files} files, CPUs: {os.cpu_count()}):")
+    print("="*50)
+    for result in results:
+        print(f"{result['label']:>12}: {result['seconds']:6.2f} s | {result['files_per_second']:6.1f} files/s | "
+              f"{result['chunks']} chunks | {result['indexed_vectors']} vectors | "
+              f"{result['files_marked']} files marked")
@@ -8,26 +8,30 @@ extracting metadata and preparing for vector indexing.
 It scans the directory, identifies file types, and creates a CSV table with
 detailed information about each file, including extraction status for
 different content types.
+
+With --incremental, the previous inventory is refreshed instead: files are matched
+to it by path, size and modification time (and content hash with --hash), only new
+and changed files are examined, and unchanged files keep their extraction status.
 """
 
 import os
 import csv
-import sys
+import argparse
+import hashlib
 import logging
 from pathlib import Path
 import mimetypes
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 import pandas as pd
 from datetime import datetime
 
-# Import the enhanced RAGFlowPdfParser for PDF processing
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Page counting only needs the PDF's page tree, so use a plain PDF reader rather than
+# RAGFlowPdfParser, whose constructor loads the OCR, layout and XGBoost models
 try:
-    from work_trial_final.pdf_parser import RAGFlowPdfParser
+    from pypdf import PdfReader
 except ImportError:
-    # Direct import as a fallback
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    sys.path.insert(0, current_dir)
-    from pdf_parser import RAGFlowPdfParser
+    PdfReader = None
+    import pdfplumber
 
 # Configure logging
 logging.basicConfig(
@@ -36,6 +40,108 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+INVENTORY_COLUMNS = [
+    'file_name',
+    'file_path',
+    'file_type',
+    'num_pages',
+    'file_size',
+    'file_category',
+    'extracted_tables',
+    'extracted_text',
+    'extracted_flow_diagrams',
+    'extracted_images',
+    'last_updated',
+    'mtime_ns',
+    'content_hash',
+    'status'
+]
+
+# mtime_ns must stay an exact integer: pandas reads an int column holding any NaN (such as
+# a deleted file from an older inventory) as float64, which cannot hold nanosecond times
+INVENTORY_DTYPES = {'mtime_ns': 'Int64', 'content_hash': str, 'status': str}
+
+EXTRACTION_FLAGS = ['extracted_tables', 'extracted_text', 'extracted_flow_diagrams', 'extracted_images']
+
+# Inventory row status: what changed since the files were last indexed. The indexer
+# sets every row to unchanged and drops the deleted ones once it has caught up.
+STATUS_NEW = 'new'
+STATUS_CHANGED = 'changed'
+STATUS_UNCHANGED = 'unchanged'
+STATUS_DELETED = 'deleted'
+
+
+def read_inventory(csv_path):
+    """
+    Read an inventory CSV with the column types a refresh relies on.
+    
+    Args:
+        csv_path (str): Path to the inventory CSV
+        
+    Returns:
+        DataFrame: The inventory
+    """
+    return pd.read_csv(csv_path, dtype=INVENTORY_DTYPES)
+
+
+def count_pdf_pages(file_path):
+    """
+    Count the number of pages in a PDF file.
+    
+    Args:
+        file_path (str): Path to the PDF file
+        
+    Returns:
+        int: Number of pages, or 0 if counting fails
+    """
+    try:
+        if PdfReader is not None:
+            return len(PdfReader(file_path).pages)
+        with pdfplumber.open(file_path) as pdf:
+            return len(pdf.pages)
+    except Exception as e:
+        logger.error(f"Error counting pages in {file_path}: {e}")
+        return 0
+
+
+def pdf_metadata(file_path):
+    """
+    Metadata of a PDF file that needs the file to be parsed.
+    """
+    return {'num_pages': count_pdf_pages(file_path)}
+
+
+# Metadata that costs more than a stat, by MIME type. Only files of these types are
+# opened during a scan, in a process pool.
+METADATA_EXTRACTORS = {
+    'application/pdf': pdf_metadata,
+}
+
+
+def file_hash(file_path, block_size=1 << 20):
+    """
+    SHA-256 hex digest of a file's content.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _extract_metadata(file_type, file_path, hash_files=False):
+    """
+    Process pool task: the extra metadata of one file, and its content hash if requested.
+    """
+    extractor = METADATA_EXTRACTORS.get(file_type)
+    metadata = extractor(file_path) if extractor else {}
+    if hash_files:
+        try:
+            metadata['content_hash'] = file_hash(file_path)
+        except OSError as e:
+            logger.error(f"Error hashing {file_path}: {e}")
+    return metadata
+
 class FileInventoryCreator:
     """
     Creates and manages an inventory of files from the uploads directory.
@@ -45,36 +151,26 @@ class FileInventoryCreator:
     each file's content and extraction status.
     """
     
-    def __init__(self, uploads_dir, output_csv):
+    def __init__(self, uploads_dir, output_csv, hash_files=False):
         """
         Initialize the inventory creator.
         
         Args:
             uploads_dir (str): Path to the uploads directory
             output_csv (str): Path where the output CSV should be saved
+            hash_files (bool): Record a SHA-256 of each file's content, so a refresh
+                can tell a touched file from a changed one
         """
         self.uploads_dir = Path(uploads_dir)
         self.output_csv = Path(output_csv)
-        self.pdf_parser = RAGFlowPdfParser()
+        self.hash_files = hash_files
         
         # Ensure the uploads directory exists
         if not self.uploads_dir.exists():
             raise FileNotFoundError(f"Uploads directory not found: {self.uploads_dir}")
             
         # Initialize the inventory DataFrame
-        self.inventory_df = pd.DataFrame(columns=[
-            'file_name',
-            'file_path',
-            'file_type',
-            'num_pages',
-            'file_size',
-            'file_category',
-            'extracted_tables',
-            'extracted_text',
-            'extracted_flow_diagrams',
-            'extracted_images',
-            'last_updated'
-        ])
+        self.inventory_df = pd.DataFrame(columns=INVENTORY_COLUMNS)
     
     def guess_file_category(self, file_path, file_type):
         """
@@ -117,62 +213,211 @@ class FileInventoryCreator:
         Returns:
             int: Number of pages, or 0 if counting fails
         """
+        return count_pdf_pages(str(file_path))
+    
+    def _scan_one_directory(self, directory, last_updated):
+        """
+        List one directory with os.scandir.
+        
+        Args:
+            directory (str): Directory to list
+            last_updated (str): Timestamp for the rows
+            
+        Returns:
+            tuple: (inventory rows of its files, paths of its subdirectories)
+        """
+        rows = []
+        subdirs = []
         try:
-            return RAGFlowPdfParser.total_page_number(str(file_path))
-        except Exception as e:
-            logger.error(f"Error counting pages in {file_path}: {e}")
-            return 0
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            # Like os.walk, do not follow symlinked directories
+                            if not entry.is_symlink():
+                                subdirs.append(entry.path)
+                            continue
+                        
+                        # Skip hidden files and system files
+                        if entry.name.startswith('.'):
+                            continue
+                        
+                        file_path = Path(entry.path)
+                        file_type = mimetypes.guess_type(entry.name)[0] or 'unknown'
+                        stat = entry.stat()
+                        rows.append({
+                            'file_name': entry.name,
+                            'file_path': str(file_path.relative_to(self.uploads_dir)),
+                            'file_type': file_type,
+                            'num_pages': 0,
+                            'file_size': stat.st_size,
+                            'file_category': self.guess_file_category(file_path, file_type),
+                            'extracted_tables': False,
+                            'extracted_text': False,
+                            'extracted_flow_diagrams': False,
+                            'extracted_images': False,
+                            'last_updated': last_updated,
+                            'mtime_ns': stat.st_mtime_ns,
+                            'content_hash': '',
+                            'status': STATUS_NEW
+                        })
+                        logger.debug(f"Added to inventory: {entry.name}")
+                    except Exception as e:
+                        logger.error(f"Error processing {entry.name}: {e}")
+        except OSError as e:
+            logger.error(f"Error scanning {directory}: {e}")
+        return rows, subdirs
     
-    def scan_directory(self):
+    def extract_metadata(self, rows, max_workers=None):
+        """
+        Fill in the metadata that needs a file to be opened, such as PDF page counts.
+        
+        Only files with an entry in METADATA_EXTRACTORS are opened, unless hash_files
+        is set, in a pool of max_workers processes (in this process when max_workers is 1).
+        
+        Args:
+            rows (list): Inventory rows, updated in place
+            max_workers (int): Worker processes (default: number of CPUs)
+        """
+        jobs = [row for row in rows if self.hash_files or row['file_type'] in METADATA_EXTRACTORS]
+        if not jobs:
+            return
+        
+        logger.info(f"Extracting metadata from {len(jobs)} files")
+        file_types = [row['file_type'] for row in jobs]
+        paths = [str(self.uploads_dir / row['file_path']) for row in jobs]
+        hash_files = [self.hash_files] * len(jobs)
+        if max_workers == 1:
+            results = map(_extract_metadata, file_types, paths, hash_files)
+            for row, metadata in zip(jobs, results):
+                row.update(metadata)
+            return
+        
+        max_workers = max_workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            chunksize = max(1, len(jobs) // (max_workers * 4))
+            results = pool.map(_extract_metadata, file_types, paths, hash_files, chunksize=chunksize)
+            for row, metadata in zip(jobs, results):
+                row.update(metadata)
+    
+    def _matches(self, row, previous):
+        """
+        Whether a scanned file is unchanged from its row in the previous inventory.
+        
+        Size and modification time decide, except that a file whose content hash is
+        known and unchanged matches even if it was touched. An inventory written before
+        modification times were recorded is matched by size alone.
+        """
+        if row['file_size'] != previous['file_size']:
+            return False
+        if pd.isna(previous.get('mtime_ns')) or row['mtime_ns'] == int(previous['mtime_ns']):
+            return True
+        return bool(row['content_hash']) and row['content_hash'] == previous['content_hash']
+    
+    def _refresh_rows(self, rows, previous_df, max_workers, last_updated):
+        """
+        Reconcile scanned rows with the previous inventory.
+        
+        Files that match their previous row (see _matches) keep its metadata,
+        extraction flags and timestamp, and are examined no further. Other files are
+        new or changed: their metadata is extracted and their flags start out False.
+        Rows of files no longer on disk are kept with the deleted status. A status of
+        new, changed or deleted carries over until the indexer has processed the file.
+        
+        Args:
+            rows (list): Scanned inventory rows, updated in place
+            previous_df (DataFrame): The previous inventory
+            max_workers (int): Processes extracting metadata
+            last_updated (str): Timestamp for changed rows
+            
+        Returns:
+            list: The rows of the refreshed inventory
+        """
+        previous = {}
+        for entry in previous_df.to_dict('records'):
+            entry['content_hash'] = entry.get('content_hash') if isinstance(entry.get('content_hash'), str) else ''
+            entry['status'] = entry.get('status') if isinstance(entry.get('status'), str) else STATUS_UNCHANGED
+            previous[entry['file_path']] = entry
+        
+        def keep(row, entry):
+            row['num_pages'] = entry['num_pages']
+            row['content_hash'] = row['content_hash'] or entry['content_hash']
+            row['last_updated'] = entry['last_updated']
+            for flag in EXTRACTION_FLAGS:
+                row[flag] = bool(entry[flag])
+            # A file still waiting to be indexed stays that way
+            row['status'] = entry['status'] if entry['status'] in (STATUS_NEW, STATUS_CHANGED) else STATUS_UNCHANGED
+        
+        to_examine = []
+        for row in rows:
+            entry = previous.get(row['file_path'])
+            if (entry is not None and entry['status'] != STATUS_DELETED and self._matches(row, entry)
+                    and (entry['content_hash'] or not self.hash_files)):
+                keep(row, entry)
+            else:
+                to_examine.append(row)
+        
+        # With hash_files, a file whose size or time changed may still have the same content
+        self.extract_metadata(to_examine, max_workers)
+        for row in to_examine:
+            entry = previous.get(row['file_path'])
+            if entry is None:
+                continue
+            if entry['status'] != STATUS_DELETED and self._matches(row, entry):
+                keep(row, entry)
+            else:
+                row['status'] = STATUS_CHANGED
+        
+        scanned = {row['file_path'] for row in rows}
+        for path, entry in previous.items():
+            if path not in scanned:
+                if entry['status'] != STATUS_DELETED:
+                    entry['status'] = STATUS_DELETED
+                    entry['last_updated'] = last_updated
+                rows.append({column: entry.get(column) for column in INVENTORY_COLUMNS})
+        
+        counts = pd.Series([row['status'] for row in rows]).value_counts()
+        logger.info(f"Refreshed inventory: {counts.get(STATUS_NEW, 0)} new, {counts.get(STATUS_CHANGED, 0)} changed, "
+                    f"{counts.get(STATUS_DELETED, 0)} deleted, {counts.get(STATUS_UNCHANGED, 0)} unchanged")
+        return rows
+    
+    def scan_directory(self, scan_threads=8, max_workers=None, previous_df=None):
         """
         Scan the uploads directory and collect file information.
         
-        This method walks through the uploads directory, identifying files
-        and collecting metadata about each one.
+        Directories are listed concurrently by a thread pool, taking file sizes and
+        modification times from the directory entries. Metadata that needs the file
+        itself is then extracted per file type (see extract_metadata), and the
+        inventory DataFrame is built once from the collected rows, sorted by path.
+        
+        Args:
+            scan_threads (int): Threads listing directories
+            max_workers (int): Processes extracting metadata (default: number of CPUs)
+            previous_df (DataFrame): Previous inventory to refresh instead of starting
+                over; only files that are new or changed since are examined
         """
         logger.info(f"Scanning directory: {self.uploads_dir}")
+        last_updated = datetime.now().isoformat()
+        rows = []
         
-        for root, _, files in os.walk(self.uploads_dir):
-            for filename in files:
-                # Skip hidden files and system files
-                if filename.startswith('.'):
-                    continue
-                    
-                file_path = Path(root) / filename
-                rel_path = file_path.relative_to(self.uploads_dir)
-                
-                try:
-                    # Get basic file information
-                    file_size = file_path.stat().st_size
-                    file_type = mimetypes.guess_type(file_path)[0] or 'unknown'
-                    
-                    # Get number of pages for PDFs
-                    num_pages = 0
-                    if file_type == 'application/pdf':
-                        num_pages = self.count_pdf_pages(file_path)
-                    
-                    # Determine file category
-                    file_category = self.guess_file_category(file_path, file_type)
-                    
-                    # Add to inventory DataFrame
-                    self.inventory_df = pd.concat([self.inventory_df, pd.DataFrame([{
-                        'file_name': filename,
-                        'file_path': str(rel_path),
-                        'file_type': file_type,
-                        'num_pages': num_pages,
-                        'file_size': file_size,
-                        'file_category': file_category,
-                        'extracted_tables': False,
-                        'extracted_text': False,
-                        'extracted_flow_diagrams': False,
-                        'extracted_images': False,
-                        'last_updated': datetime.now().isoformat()
-                    }])], ignore_index=True)
-                    
-                    logger.info(f"Added to inventory: {filename}")
-                    
-                except Exception as e:
-                    logger.error(f"Error processing {filename}: {e}")
+        with ThreadPoolExecutor(max_workers=scan_threads) as pool:
+            pending = {pool.submit(self._scan_one_directory, str(self.uploads_dir), last_updated)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    found, subdirs = future.result()
+                    rows.extend(found)
+                    pending.update(pool.submit(self._scan_one_directory, subdir, last_updated)
+                                   for subdir in subdirs)
+        
+        logger.info(f"Found {len(rows)} files")
+        if previous_df is None:
+            self.extract_metadata(rows, max_workers)
+        else:
+            rows = self._refresh_rows(rows, previous_df, max_workers, last_updated)
+        
+        rows.sort(key=lambda row: row['file_path'])
+        self.inventory_df = pd.DataFrame(rows, columns=INVENTORY_COLUMNS).astype({'mtime_ns': 'Int64'})
     
     def save_inventory(self):
         """
@@ -182,31 +427,59 @@ class FileInventoryCreator:
         self.inventory_df.to_csv(self.output_csv, index=False)
         logger.info(f"Saved {len(self.inventory_df)} files to inventory")
     
-    def create_inventory(self):
+    def load_inventory(self):
+        """
+        Load the previously saved inventory.
+        
+        Returns:
+            DataFrame: The inventory, or None if there is none yet
+        """
+        if not self.output_csv.exists():
+            return None
+        logger.info(f"Loading previous inventory from {self.output_csv}")
+        return read_inventory(self.output_csv)
+    
+    def create_inventory(self, incremental=False):
         """
         Create the complete file inventory.
+        
+        Args:
+            incremental (bool): Refresh the saved inventory, keeping the extraction
+                status of unchanged files, instead of starting over
         """
         logger.info("Starting inventory creation process")
-        self.scan_directory()
+        previous_df = self.load_inventory() if incremental else None
+        self.scan_directory(previous_df=previous_df)
         self.save_inventory()
         logger.info("Inventory creation complete")
         return self.inventory_df
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Create the file inventory of the uploads directory')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Refresh the existing inventory, keeping the extraction status of unchanged files')
+    parser.add_argument('--hash', action='store_true',
+                        help='Compare files by content hash as well as size and modification time')
+    args = parser.parse_args()
+    
     # Set the uploads directory and output CSV path
     UPLOADS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads")
     OUTPUT_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "file_inventory.csv")
     
     # Create the inventory
-    inventory_creator = FileInventoryCreator(UPLOADS_DIR, OUTPUT_CSV)
-    inventory_df = inventory_creator.create_inventory()
+    inventory_creator = FileInventoryCreator(UPLOADS_DIR, OUTPUT_CSV, hash_files=args.hash)
+    inventory_df = inventory_creator.create_inventory(incremental=args.incremental)
     
     # Print summary
     print(f"\nInventory Creation Complete")
     print(f"=========================")
     print(f"Files processed: {len(inventory_df)}")
     print(f"Inventory saved to: {OUTPUT_CSV}")
+    if args.incremental:
+        print("File Status:")
+        for status, count in inventory_df['status'].value_counts().items():
+            print(f"  {status}: {count}")
     
     # Print category distribution
     if not inventory_df.empty:
@@ -11,7 +11,14 @@ import os
 import sys
 import json
 import logging
+import mmap
 import pickle
+import itertools
+import queue
+import re
+import threading
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import numpy as np
 import pandas as pd
 from pathlib import Path
@@ -27,6 +34,9 @@ except ImportError:
     sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     from work_trial_final.pdf_parser import RAGFlowPdfParser
 
+# Inventory reading and row statuses shared with the inventory creator
+from create_file_inventory import read_inventory, STATUS_NEW, STATUS_CHANGED, STATUS_UNCHANGED, STATUS_DELETED
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -43,6 +53,43 @@ except ImportError:
     logger.warning("Vector libraries not found. Will simulate embedding generation.")
     VECTOR_LIBS_AVAILABLE = False
 
+# Fast (Rust) tokenizers, installed with sentence-transformers
+try:
+    from tokenizers import Tokenizer
+except ImportError:
+    Tokenizer = None
+
+# all-MiniLM-L6-v2 truncates its input at 256 word pieces, two of which are [CLS] and [SEP]
+MODEL_MAX_TOKENS = 256
+
+# Token estimate without the model's tokenizer: words count one token per 6 characters
+# and punctuation marks one each, slightly more than WordPiece gives for English prose
+_TOKEN_ESTIMATE = re.compile(r"\w{1,6}|[^\w\s]")
+
+
+@lru_cache(maxsize=None)
+def load_tokenizer(name):
+    """
+    Load a model's fast tokenizer once per process.
+    
+    Args:
+        name (str): Hugging Face model name, e.g. 'sentence-transformers/all-MiniLM-L6-v2'
+        
+    Returns:
+        Tokenizer: The tokenizer, or None when it cannot be loaded and tokens are estimated
+    """
+    if Tokenizer is None:
+        logger.warning("tokenizers not installed, estimating token counts")
+        return None
+    try:
+        tokenizer = Tokenizer.from_pretrained(name)
+    except Exception as e:
+        logger.warning(f"Could not load tokenizer {name}, estimating token counts: {e}")
+        return None
+    tokenizer.no_truncation()
+    tokenizer.no_padding()
+    return tokenizer
+
 
 class ChunkExtractor:
     """
@@ -53,16 +100,20 @@ class ChunkExtractor:
     and indexing.
     """
     
-    def __init__(self, chunk_size=512, chunk_overlap=50):
+    def __init__(self, chunk_size=MODEL_MAX_TOKENS - 2, chunk_overlap=50,
+                 tokenizer_name='sentence-transformers/all-MiniLM-L6-v2'):
         """
         Initialize the chunk extractor.
         
         Args:
-            chunk_size (int): Target size of text chunks
-            chunk_overlap (int): Overlap between chunks to maintain context
+            chunk_size (int): Maximum tokens per text chunk; keep it within what the
+                embedding model reads (MODEL_MAX_TOKENS minus its special tokens)
+            chunk_overlap (int): Overlap between chunks in tokens to maintain context
+            tokenizer_name (str): Model whose tokenizer sizes the chunks
         """
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.tokenizer = load_tokenizer(tokenizer_name)
         self.pdf_parser = RAGFlowPdfParser()
         
     def process_pdf(self, pdf_path):
@@ -73,113 +124,166 @@ class ChunkExtractor:
             pdf_path (str): Path to the PDF file
             
         Returns:
-            list: List of chunk dictionaries with text and metadata
+            list: List of chunk dictionaries with text and metadata, empty if the
+                file could not be processed
         """
-        logger.info(f"Processing PDF: {pdf_path}")
         try:
-            # Extract text and tables from the PDF
-            text, tables = self.pdf_parser(pdf_path, need_image=True)
-            
-            # Create chunks from the extracted text
-            chunks = []
-            
-            # Process the main text content
-            if text:
-                text_chunks = self.split_text(text, pdf_path)
-                chunks.extend(text_chunks)
-            
-            # Process tables if available
-            if tables:
-                table_chunks = self.process_tables(tables, pdf_path)
-                chunks.extend(table_chunks)
-                
-            logger.info(f"Created {len(chunks)} chunks from {pdf_path}")
-            return chunks
-            
+            return self.extract_chunks(pdf_path)
         except Exception as e:
             logger.error(f"Error processing {pdf_path}: {e}")
             return []
     
-    def split_text(self, text, source_file, min_chunk_size=100):
+    def extract_chunks(self, pdf_path):
+        """
+        Extract the content chunks of a PDF file, raising if it cannot be parsed.
+        
+        Args:
+            pdf_path (str): Path to the PDF file
+            
+        Returns:
+            list: List of chunk dictionaries with text and metadata
+        """
+        logger.info(f"Processing PDF: {pdf_path}")
+        # Extract text and tables from the PDF
+        text, tables = self.pdf_parser(pdf_path, need_image=True)
+        
+        # Create chunks from the extracted text
+        chunks = []
+        created_at = datetime.now().isoformat()
+        
+        # Process the main text content
+        if text:
+            text_chunks = self.split_text(text, pdf_path, created_at=created_at)
+            chunks.extend(text_chunks)
+        
+        # Process tables if available
+        if tables:
+            table_chunks = self.process_tables(tables, pdf_path, created_at=created_at)
+            chunks.extend(table_chunks)
+            
+        logger.info(f"Created {len(chunks)} chunks from {pdf_path}")
+        return chunks
+    
+    def token_offsets(self, text):
+        """
+        Character offsets of the tokens of text, from one tokenizer pass.
+        
+        Args:
+            text (str): Text to tokenize
+            
+        Returns:
+            tuple: (starts, ends) int64 arrays, one entry per token in text order
+        """
+        if self.tokenizer is not None:
+            spans = self.tokenizer.encode(text, add_special_tokens=False).offsets
+        else:
+            spans = (match.span() for match in _TOKEN_ESTIMATE.finditer(text))
+        offsets = np.fromiter(itertools.chain.from_iterable(spans), dtype=np.int64).reshape(-1, 2)
+        return offsets[:, 0], offsets[:, 1]
+    
+    def _overlap_start(self, text, starts, ends, first, last):
         """
-        Split text into overlapping chunks of appropriate size.
+        First token of the chunk that follows tokens [first, last): up to chunk_overlap
+        tokens back, moved forward to just after a sentence or line break when the
+        overlap contains one.
+        """
+        if self.chunk_overlap <= 0:
+            return last
+        overlap = max(first + 1, last - self.chunk_overlap)
+        region = text[starts[overlap]:ends[last - 1]]
+        best_break = max(region.rfind('. '), region.rfind('\n'))
+        if best_break > 0:
+            after_break = int(np.searchsorted(starts, starts[overlap] + best_break + 1))
+            if after_break < last:
+                return after_break
+        return overlap
+    
+    def split_text(self, text, source_file, min_chunk_size=20, created_at=None):
+        """
+        Split text into overlapping chunks of at most chunk_size tokens.
+        
+        Sections (separated by blank lines) are packed into a chunk while they fit, and
+        a section longer than chunk_size is cut between words, or at chunk_size tokens
+        when the back half of the window has no word boundary (CJK text, long unbroken
+        strings). Chunks are slices of the cleaned text located by character offsets,
+        sized with one tokenizer pass over it.
         
         Args:
             text (str): Text to split into chunks
             source_file (str): Source file path for metadata
-            min_chunk_size (int): Minimum size for a meaningful chunk
+            min_chunk_size (int): Minimum tokens for a meaningful chunk, also the
+                fewest tokens a section is cut into
+            created_at (str): Timestamp for the chunks (default: now)
             
         Returns:
             list: List of chunk dictionaries
         """
         # Clean text by removing redundant spacing and normalizing line breaks
         clean_text = self.pdf_parser.remove_tag(text)
+        created_at = created_at or datetime.now().isoformat()
+        starts, ends = self.token_offsets(clean_text)
         
-        # Split the document into logical sections based on double newlines
-        sections = [s for s in clean_text.split('\n\n') if s.strip()]
+        # Token ranges of the logical sections, split on double newlines
+        breaks = [0] + [m.end() for m in re.finditer(r'\n\n', clean_text)] + [len(clean_text)]
+        bounds = np.searchsorted(starts, breaks)
+        sections = [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
         
         chunks = []
-        current_chunk = ""
-        current_section_idx = 0
         
-        # Process each section
-        for section in sections:
+        def add_chunk(first, last, section_idx):
+            chunks.append({
+                'text': clean_text[starts[first]:ends[last - 1]],
+                'source': source_file,
+                'chunk_type': 'text',
+                'section_idx': section_idx,
+                'created_at': created_at
+            })
+        
+        first = None
+        last = None
+        for section_idx, (section_start, section_end) in enumerate(sections):
             # If adding this section would exceed chunk size and we already have content,
             # save the current chunk and start a new one with overlap
-            if len(current_chunk) + len(section) > self.chunk_size and len(current_chunk) >= min_chunk_size:
-                chunks.append({
-                    'text': current_chunk,
-                    'source': source_file,
-                    'chunk_type': 'text',
-                    'section_idx': current_section_idx,
-                    'created_at': datetime.now().isoformat()
-                })
-                
-                # Start a new chunk with overlap by including the last bit of the previous chunk
-                if self.chunk_overlap > 0 and len(current_chunk) > self.chunk_overlap:
-                    # Find a clean break point for the overlap
-                    overlap_text = current_chunk[-self.chunk_overlap:]
-                    # Try to find a sentence or paragraph break in the overlap region
-                    break_points = [overlap_text.rfind('. '), overlap_text.rfind('\n')]
-                    best_break = max(break_points)
-                    
-                    if best_break > 0:
-                        current_chunk = current_chunk[-(best_break+1):]
-                    else:
-                        current_chunk = current_chunk[-self.chunk_overlap:]
-                else:
-                    current_chunk = ""
+            if first is not None and section_end - first > self.chunk_size and last - first >= min_chunk_size:
+                add_chunk(first, last, section_idx)
+                first = self._overlap_start(clean_text, starts, ends, first, last)
+            if first is None:
+                first = section_start
             
-            # Add the current section to the chunk
-            if current_chunk and not current_chunk.endswith('\n'):
-                current_chunk += '\n'
-            current_chunk += section
-            current_section_idx += 1
+            # Cut a section that does not fit on its own, between words when the back
+            # half of the window has a boundary and hard at chunk_size tokens otherwise
+            while section_end - first > self.chunk_size:
+                limit = first + self.chunk_size
+                floor = first + min(self.chunk_size, max(min_chunk_size, self.chunk_size // 2))
+                cut = limit
+                while cut > floor and starts[cut] == ends[cut - 1]:
+                    cut -= 1
+                if starts[cut] == ends[cut - 1]:
+                    cut = limit
+                add_chunk(first, cut, section_idx)
+                first = self._overlap_start(clean_text, starts, ends, first, cut)
+            last = section_end
         
         # Add the final chunk if it's not empty
-        if current_chunk and len(current_chunk) >= min_chunk_size:
-            chunks.append({
-                'text': current_chunk,
-                'source': source_file,
-                'chunk_type': 'text',
-                'section_idx': current_section_idx,
-                'created_at': datetime.now().isoformat()
-            })
+        if first is not None and last - first >= min_chunk_size:
+            add_chunk(first, last, len(sections))
             
         return chunks
     
-    def process_tables(self, tables, source_file):
+    def process_tables(self, tables, source_file, created_at=None):
         """
         Process extracted tables into chunks.
         
         Args:
             tables (list): List of tables from the PDF parser
             source_file (str): Source file path for metadata
+            created_at (str): Timestamp for the chunks (default: now)
             
         Returns:
             list: List of chunk dictionaries for tables
         """
         table_chunks = []
+        created_at = created_at or datetime.now().isoformat()
         
         for i, table_data in enumerate(tables):
             # Each table is a tuple of (image, content)
@@ -201,12 +305,100 @@ class ChunkExtractor:
                 'source': source_file,
                 'chunk_type': 'table',
                 'table_idx': i,
-                'created_at': datetime.now().isoformat()
+                'created_at': created_at
             })
             
         return table_chunks
 
 
+# Corpus sizes at which index_type='auto' moves to an approximate index
+IVF_MIN_VECTORS = 50000
+IVF_PQ_MIN_VECTORS = 1000000
+
+# Training points per IVF list; faiss warns below 39
+TRAIN_POINTS_PER_LIST = 40
+
+# On-disk layout written by VectorIndexer.save_index and read by ChunkStore.
+# Version 1 (no format_version in index_info.json) was chunks.pkl + chunk_metadata.json.
+INDEX_FORMAT_VERSION = 2
+
+# Files save_index writes
+INDEX_FILES = ['embeddings.npy', 'chunk_texts.bin', 'chunk_offsets.npy', 'chunk_metadata.npz',
+               'faiss_index.bin', 'index_info.json']
+
+# Files of earlier layouts that save_index removes so they are not read by mistake
+LEGACY_INDEX_FILES = ['chunks.pkl', 'chunk_metadata.json']
+
+
+def choose_index_spec(n_vectors, vector_dim, index_type='auto', hnsw_m=32):
+    """
+    Pick the faiss.index_factory spec for a corpus.
+    
+    With index_type='auto', small corpora get an exact flat index, larger ones an
+    inverted file (IVF) index with about 4*sqrt(n) lists, and corpora of
+    IVF_PQ_MIN_VECTORS or more also compress the vectors: product quantization (one
+    byte per 8 dimensions) finds candidates, which are re-ranked with 8-bit scalar
+    quantized copies, about a quarter of the memory of full vectors.
+    
+    Args:
+        n_vectors (int): Number of vectors to index
+        vector_dim (int): Embedding dimension
+        index_type (str): 'auto', 'flat', 'ivf_flat', 'ivf_pq' or 'hnsw'
+        hnsw_m (int): Neighbors per node for 'hnsw'
+        
+    Returns:
+        str: Spec such as 'Flat', 'IVF1264,Flat', 'IVF4000,PQ48np,Refine(SQ8)' or 'HNSW32,Flat'
+    """
+    if index_type == 'auto':
+        if n_vectors < IVF_MIN_VECTORS:
+            index_type = 'flat'
+        elif n_vectors < IVF_PQ_MIN_VECTORS:
+            index_type = 'ivf_flat'
+        else:
+            index_type = 'ivf_pq'
+    
+    nlist = max(1, min(int(4 * np.sqrt(n_vectors)), n_vectors // TRAIN_POINTS_PER_LIST))
+    if index_type == 'flat':
+        return 'Flat'
+    if index_type == 'ivf_flat':
+        return f'IVF{nlist},Flat'
+    if index_type == 'ivf_pq':
+        # PQ needs a sub-vector count that divides the dimension. Polysemous training
+        # (on by default) is skipped ('np'): it is slow and only speeds up Hamming filtering
+        m = next(m for m in range(max(1, vector_dim // 8), 0, -1) if vector_dim % m == 0)
+        return f'IVF{nlist},PQ{m}np,Refine(SQ8)'
+    if index_type == 'hnsw':
+        return f'HNSW{hnsw_m},Flat'
+    raise ValueError(f"Unknown index type: {index_type}")
+
+
+# ChunkExtractor of a parser process, created once so the parser models load once per process
+_worker_extractor = None
+
+
+def _init_parser_worker(chunk_size, chunk_overlap):
+    """
+    Create the ChunkExtractor of a parser process.
+    """
+    global _worker_extractor
+    _worker_extractor = ChunkExtractor(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def _parse_file(rel_path, file_path):
+    """
+    Parser process task: extract the chunks of one PDF.
+    
+    Returns:
+        tuple: (rel_path, chunks, ok); a file that fails to parse is logged and
+            returned with no chunks and ok False
+    """
+    try:
+        return rel_path, _worker_extractor.extract_chunks(file_path), True
+    except Exception as e:
+        logger.error(f"Error processing {file_path}: {e}")
+        return rel_path, [], False
+
+
 class VectorIndexer:
     """
     Creates and manages dense vector indexes for document chunks.
@@ -215,21 +407,37 @@ class VectorIndexer:
     and storage of the index for efficient semantic search.
     """
     
-    def __init__(self, model_name='all-MiniLM-L6-v2', output_dir='vector_index'):
+    def __init__(self, model_name='all-MiniLM-L6-v2', output_dir='vector_index', index_type='auto',
+                 nprobe=16, ef_search=64, refine_k_factor=16, max_train_size=200000):
         """
         Initialize the vector indexer.
         
         Args:
             model_name (str): Name of the sentence transformer model to use
             output_dir (str): Directory to store the vector index
+            index_type (str): 'auto' to choose by corpus size, or 'flat', 'ivf_flat',
+                'ivf_pq' or 'hnsw' (see choose_index_spec)
+            nprobe (int): IVF lists searched per query
+            ef_search (int): HNSW candidate list size per query
+            refine_k_factor (int): PQ candidates re-ranked per requested neighbor
+            max_train_size (int): Most vectors sampled to train an IVF index
         """
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True, parents=True)
         
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.refine_k_factor = refine_k_factor
+        self.max_train_size = max_train_size
+        
         self.chunks = []
         self.metadata = []
         self.embeddings = None
         self.index = None
+        self.index_spec = None
+        self.search_params = {}
+        self._embedding_batches = []
         
         # Initialize the embedding model if libraries are available
         if VECTOR_LIBS_AVAILABLE:
@@ -267,24 +475,88 @@ class VectorIndexer:
         # Extract text content from chunks
         texts = [chunk['text'] for chunk in self.chunks]
         
+        self.embeddings = self.encode(texts, show_progress_bar=True)
+    
+    def encode(self, texts, show_progress_bar=False):
+        """
+        Embed a list of texts.
+        
+        Args:
+            texts (list): Texts to embed
+            show_progress_bar (bool): Show the model's progress bar
+            
+        Returns:
+            ndarray: float32 array of shape (len(texts), vector_dim)
+        """
         if VECTOR_LIBS_AVAILABLE and self.model:
             # Use actual embedding model
-            self.embeddings = self.model.encode(
+            return self.model.encode(
                 texts, 
-                show_progress_bar=True,
+                show_progress_bar=show_progress_bar,
                 batch_size=32,
                 convert_to_numpy=True
-            )
+            ).astype(np.float32)
+        
+        # Generate random embeddings for simulation
+        embeddings = np.random.randn(len(texts), self.vector_dim).astype(np.float32)
+        # Normalize the random vectors (as real embeddings are usually normalized)
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    
+    @staticmethod
+    def _normalized(embeddings):
+        """
+        Embeddings as contiguous float32 unit vectors, so inner product is cosine similarity.
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        faiss.normalize_L2(embeddings)
+        return embeddings
+    
+    def _new_index(self, spec):
+        """
+        Create an empty inner-product FAISS index from a factory spec, with the search
+        parameters applied, or the simulated placeholder without FAISS.
+        """
+        if not VECTOR_LIBS_AVAILABLE:
+            return "SIMULATED_INDEX"
+        
+        index = faiss.index_factory(self.vector_dim, spec, faiss.METRIC_INNER_PRODUCT)
+        if spec.startswith('IVF'):
+            self.search_params = {'nprobe': self.nprobe}
+            if 'Refine' in spec:
+                self.search_params['k_factor_rf'] = self.refine_k_factor
+        elif spec.startswith('HNSW'):
+            self.search_params = {'efSearch': self.ef_search}
         else:
-            # Generate random embeddings for simulation
-            logger.info("Using simulated embeddings (random vectors)")
-            self.embeddings = np.random.randn(len(texts), self.vector_dim).astype(np.float32)
-            # Normalize the random vectors (as real embeddings are usually normalized)
-            self.embeddings = self.embeddings / np.linalg.norm(self.embeddings, axis=1, keepdims=True)
+            self.search_params = {}
+        for name, value in self.search_params.items():
+            faiss.ParameterSpace().set_index_parameter(index, name, value)
+        self.index_spec = spec
+        return index
+    
+    def add_embedded_chunks(self, chunks, embeddings):
+        """
+        Add chunks with their embeddings, growing an exact index as they arrive.
+        
+        Args:
+            chunks (list): List of chunk dictionaries with text and metadata
+            embeddings (ndarray): One embedding per chunk
+        """
+        if VECTOR_LIBS_AVAILABLE:
+            embeddings = self._normalized(embeddings)
+        self.add_chunks(chunks)
+        self._embedding_batches.append(embeddings)
+        if self.index is None:
+            self.index = self._new_index('Flat')
+        if VECTOR_LIBS_AVAILABLE:
+            self.index.add(embeddings)
     
     def build_index(self):
         """
         Build a FAISS index from the generated embeddings.
+        
+        The index type comes from choose_index_spec for the corpus size. Vectors are
+        normalized so the inner-product index ranks by cosine similarity, and IVF
+        indexes are trained on a random sample of at most max_train_size vectors.
         """
         if self.embeddings is None:
             logger.warning("No embeddings available. Call generate_embeddings() first.")
@@ -293,16 +565,18 @@ class VectorIndexer:
         logger.info("Building vector index")
         
         if VECTOR_LIBS_AVAILABLE:
-            # Create a FAISS index for fast similarity search
-            # Use L2 distance (squared Euclidean) for similarity
-            self.index = faiss.IndexFlatL2(self.vector_dim)
+            self.embeddings = self._normalized(self.embeddings)
+            spec = choose_index_spec(len(self.embeddings), self.vector_dim, self.index_type)
+            logger.info(f"Using index spec {spec} for {len(self.embeddings)} vectors")
+            self.index = self._new_index(spec)
             
-            # Add the embeddings to the index
-            self.index.add(self.embeddings.astype(np.float32))
+            if not self.index.is_trained:
+                n_train = min(len(self.embeddings), self.max_train_size)
+                sample = np.random.default_rng(0).choice(len(self.embeddings), n_train, replace=False)
+                self.index.train(self.embeddings[np.sort(sample)])
             
-            # For larger datasets, consider using an approximate neighbor index:
-            # index = faiss.IndexIVFFlat(quantizer, d, n_cells, faiss.METRIC_L2)
-            # Where n_cells is typically sqrt(n) for n vectors
+            # Add the embeddings to the index
+            self.index.add(self.embeddings)
         else:
             logger.warning("FAISS not available, skipping actual index creation")
             self.index = "SIMULATED_INDEX"
@@ -317,16 +591,24 @@ class VectorIndexer:
             
         logger.info(f"Saving index to {self.output_dir}")
         
-        # Save metadata
-        with open(self.output_dir / 'chunk_metadata.json', 'w') as f:
-            json.dump(self.metadata, f, indent=2)
+        # Save embeddings as a float32 array that loaders memory-map
+        np.save(self.output_dir / 'embeddings.npy', np.ascontiguousarray(self.embeddings, dtype=np.float32))
+        
+        # Save chunk texts once: one UTF-8 blob and the byte offset where each chunk starts
+        encoded = [chunk['text'].encode('utf-8') for chunk in self.chunks]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in encoded], out=offsets[1:])
+        with open(self.output_dir / 'chunk_texts.bin', 'wb') as f:
+            f.writelines(encoded)
+        np.save(self.output_dir / 'chunk_offsets.npy', offsets)
         
-        # Save embeddings as numpy array
-        np.save(self.output_dir / 'embeddings.npy', self.embeddings)
+        # Save metadata as dictionary-encoded columns
+        np.savez(self.output_dir / 'chunk_metadata.npz', **encode_metadata_columns(self.metadata))
         
-        # Save chunks for reference
-        with open(self.output_dir / 'chunks.pkl', 'wb') as f:
-            pickle.dump(self.chunks, f)
+        for name in LEGACY_INDEX_FILES:
+            if (self.output_dir / name).exists():
+                logger.info(f"Removing {name} of the previous index layout")
+                (self.output_dir / name).unlink()
         
         # Save the index if FAISS is available
         if VECTOR_LIBS_AVAILABLE and isinstance(self.index, faiss.Index):
@@ -337,55 +619,364 @@ class VectorIndexer:
         # Save indexing metadata
         with open(self.output_dir / 'index_info.json', 'w') as f:
             json.dump({
+                'format_version': INDEX_FORMAT_VERSION,
                 'num_vectors': len(self.chunks),
                 'vector_dim': self.vector_dim,
+                'index_spec': self.index_spec,
+                'metric': 'cosine' if self.index_spec else None,
+                'search_params': self.search_params,
                 'created_at': datetime.now().isoformat(),
                 'vector_libs_available': VECTOR_LIBS_AVAILABLE
             }, f, indent=2)
         
         logger.info(f"Index saved successfully with {len(self.chunks)} vectors")
     
-    def process_and_index_files(self, inventory_df, uploads_dir):
+    def clear_saved_index(self):
+        """
+        Remove the index saved in output_dir, for when no chunks are left to index.
+        """
+        for name in INDEX_FILES + LEGACY_INDEX_FILES:
+            if (self.output_dir / name).exists():
+                (self.output_dir / name).unlink()
+        logger.info(f"Removed the saved index in {self.output_dir}")
+    
+    def load_previous_chunks(self, exclude_sources=()):
+        """
+        Add the chunks of the saved index in output_dir, with their embeddings, except
+        those from exclude_sources.
+        
+        Args:
+            exclude_sources (set): Source paths whose chunks are left out
+            
+        Returns:
+            bool: False if there is no saved index this indexer can extend, in which
+                case nothing is added
+        """
+        if not (self.output_dir / 'index_info.json').exists():
+            return False
+        store = ChunkStore(self.output_dir)
+        if store.info.get('vector_dim') != self.vector_dim or not (self.output_dir / 'embeddings.npy').exists():
+            logger.warning(f"Saved index in {self.output_dir} does not match the embedding model; rebuilding it")
+            return False
+        
+        keep = np.flatnonzero([source not in exclude_sources for source in store.values('source')])
+        logger.info(f"Keeping {len(keep)} of {len(store)} chunks of the saved index")
+        if len(keep):
+            self.add_embedded_chunks([store[int(i)] for i in keep], np.asarray(store.embeddings[keep], dtype=np.float32))
+        return True
+    
+    def _embedding_worker(self, chunk_queue, batch_size, errors):
+        """
+        Embed chunks from the queue in batches of batch_size and add them to the index.
+        
+        Runs until it takes None from the queue. After an error the queue is still
+        drained so the parsers are never blocked on it.
+        """
+        pending = []
+        try:
+            while True:
+                chunks = chunk_queue.get()
+                if chunks is not None:
+                    pending.extend(chunks)
+                while len(pending) >= batch_size or (chunks is None and pending):
+                    batch, pending = pending[:batch_size], pending[batch_size:]
+                    self.add_embedded_chunks(batch, self.encode([chunk['text'] for chunk in batch]))
+                if chunks is None:
+                    return
+        except Exception as e:
+            logger.error(f"Error generating embeddings: {e}")
+            errors.append(e)
+            while chunk_queue.get() is not None:
+                pass
+    
+    def process_and_index_files(self, inventory_df, uploads_dir, max_workers=None, embed_batch_size=256,
+                                queue_size=8, chunk_size=MODEL_MAX_TOKENS - 2, chunk_overlap=50,
+                                incremental=False):
         """
         Process and index all PDF files in the inventory.
         
+        PDFs are parsed in a pool of max_workers processes. Their chunks go through a
+        bounded queue to a single embedding thread that embeds them in batches and adds
+        them to the index as they arrive, so parsing and embedding overlap. The
+        inventory's extraction flags are updated once at the end, the rows of deleted
+        files are dropped and every other file's status becomes unchanged, except for
+        PDFs that failed to parse: they keep their status with extraction flags False,
+        so the next run retries them.
+        
+        With incremental=True and a saved index in output_dir, only the delta is
+        processed: PDFs that are new, changed or not yet extracted are parsed, and the
+        saved chunks of all other PDFs are kept, without those of changed and deleted files.
+        When no chunks are left, the saved index is removed.
+        
         Args:
             inventory_df (DataFrame): DataFrame containing file inventory
             uploads_dir (str): Path to the uploads directory
+            max_workers (int): Parser processes (default: number of CPUs)
+            embed_batch_size (int): Chunks embedded per model call
+            queue_size (int): Parsed files that may wait for the embedder before parsing pauses
+            chunk_size (int): Maximum tokens per text chunk
+            chunk_overlap (int): Overlap between chunks in tokens
+            incremental (bool): Extend the saved index with the files that changed
         """
-        chunk_extractor = ChunkExtractor()
+        if 'status' in inventory_df:
+            status = inventory_df['status'].fillna(STATUS_UNCHANGED)
+        else:
+            status = pd.Series(STATUS_NEW, index=inventory_df.index)
+        deleted = status == STATUS_DELETED
         
         # Filter for PDF files
-        pdf_files = inventory_df[inventory_df['file_type'] == 'application/pdf']
+        is_pdf = inventory_df['file_type'] == 'application/pdf'
+        pdf_files = inventory_df[is_pdf & ~deleted]
         
         if len(pdf_files) == 0:
             logger.warning("No PDF files found in inventory")
-            return
-            
+            self.clear_saved_index()
+            return self._mark_indexed(inventory_df, deleted)
+        
+        if incremental:
+            pending = status[pdf_files.index].isin([STATUS_NEW, STATUS_CHANGED]) | ~pdf_files['extracted_text'].astype(bool)
+            stale = inventory_df[is_pdf & (status.isin([STATUS_CHANGED, STATUS_DELETED]))]['file_path']
+            stale_sources = {os.path.join(uploads_dir, rel_path) for rel_path in pd.concat([stale, pdf_files['file_path'][pending]])}
+            if self.load_previous_chunks(stale_sources):
+                pdf_files = pdf_files[pending]
+                logger.info(f"Incremental update: {len(pdf_files)} files to process, "
+                            f"{len(stale)} changed or deleted")
+                if len(pdf_files) == 0 and len(stale) == 0:
+                    logger.info("Index is up to date")
+                    return self._mark_indexed(inventory_df, deleted)
+        
         logger.info(f"Processing {len(pdf_files)} PDF files")
         
-        for _, row in tqdm(pdf_files.iterrows(), total=len(pdf_files)):
-            file_path = os.path.join(uploads_dir, row['file_path'])
-            
-            # Extract chunks from the PDF
-            chunks = chunk_extractor.process_pdf(file_path)
-            
-            # Add chunks to the indexer
-            self.add_chunks(chunks)
-            
-            # Update inventory with extraction status
-            inventory_df.loc[inventory_df['file_path'] == row['file_path'], 'extracted_text'] = True
-            if len([c for c in chunks if c['chunk_type'] == 'table']) > 0:
-                inventory_df.loc[inventory_df['file_path'] == row['file_path'], 'extracted_tables'] = True
+        max_workers = max_workers or os.cpu_count() or 1
+        jobs = iter([(rel_path, os.path.join(uploads_dir, rel_path)) for rel_path in pdf_files['file_path']])
+        chunk_queue = queue.Queue(maxsize=queue_size)
+        errors = []
+        embedder = threading.Thread(target=self._embedding_worker,
+                                    args=(chunk_queue, embed_batch_size, errors), daemon=True)
+        text_files = []
+        table_files = []
+        failed_files = []
+        
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_parser_worker,
+                                     initargs=(chunk_size, chunk_overlap)) as pool, \
+                    tqdm(total=len(pdf_files)) as progress:
+                in_flight = set()
+                while True:
+                    # Keep two files per parser in flight, so parsed chunks never pile up
+                    # beyond what the queue holds
+                    for _, job in zip(range(2 * max_workers - len(in_flight)), jobs):
+                        in_flight.add(pool.submit(_parse_file, *job))
+                    # The first submit forks the parsers; start the thread only afterwards
+                    if embedder.ident is None:
+                        embedder.start()
+                    if not in_flight:
+                        break
+                    
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        rel_path, chunks, ok = future.result()
+                        progress.update(1)
+                        if not ok:
+                            failed_files.append(rel_path)
+                            continue
+                        # Blocks while the embedder is behind
+                        chunk_queue.put(chunks)
+                        text_files.append(rel_path)
+                        if any(chunk['chunk_type'] == 'table' for chunk in chunks):
+                            table_files.append(rel_path)
+        finally:
+            if embedder.ident is not None:
+                chunk_queue.put(None)
+                embedder.join()
+        
+        if errors:
+            raise errors[0]
         
-        # Generate embeddings and build the index
-        self.generate_embeddings()
-        self.build_index()
-        self.save_index()
+        # Update inventory with extraction status
+        inventory_df.loc[inventory_df['file_path'].isin(text_files), 'extracted_text'] = True
+        inventory_df.loc[inventory_df['file_path'].isin(table_files), 'extracted_tables'] = True
+        if failed_files:
+            logger.warning(f"{len(failed_files)} PDF files failed to parse and will be retried on the next run")
+            inventory_df.loc[inventory_df['file_path'].isin(failed_files), ['extracted_text', 'extracted_tables']] = False
         
+        if self._embedding_batches:
+            self.embeddings = np.vstack(self._embedding_batches)
+            # Chunks went into an exact index as they arrived; rebuild if the corpus
+            # size calls for another index type
+            spec = choose_index_spec(len(self.embeddings), self.vector_dim, self.index_type)
+            if VECTOR_LIBS_AVAILABLE and spec != self.index_spec:
+                self.build_index()
+            self.save_index()
+        else:
+            logger.warning("No chunks to index")
+            self.clear_saved_index()
+        
+        return self._mark_indexed(inventory_df, deleted, failed_files)
+    
+    @staticmethod
+    def _mark_indexed(inventory_df, deleted, failed_files=()):
+        """
+        The inventory with the rows of deleted files dropped and the status of every
+        other file unchanged, except for files that failed and stay pending.
+        """
+        inventory_df = inventory_df[~deleted].copy()
+        failed = inventory_df['file_path'].isin(failed_files)
+        if 'status' not in inventory_df:
+            inventory_df['status'] = STATUS_NEW
+        inventory_df['status'] = inventory_df['status'].where(failed, STATUS_UNCHANGED)
         return inventory_df
 
 
+
+def encode_metadata_columns(metadata):
+    """
+    Encode chunk metadata dictionaries as columns for np.savez.
+    
+    Each key becomes a '<key>.codes' int32 array with an index into a '<key>.values'
+    array, or -1 where a chunk lacks the key. Repeated values such as the source file
+    are stored once. Values that are not all ints are stored as UTF-8 strings.
+    
+    Args:
+        metadata (list): One metadata dictionary per chunk
+        
+    Returns:
+        dict: Array name -> numpy array
+    """
+    keys = list(dict.fromkeys(key for entry in metadata for key in entry))
+    columns = {}
+    for key in keys:
+        dictionary = {}
+        codes = np.full(len(metadata), -1, dtype=np.int32)
+        for i, entry in enumerate(metadata):
+            value = entry.get(key)
+            if value is not None:
+                codes[i] = dictionary.setdefault(value, len(dictionary))
+        values = list(dictionary)
+        if all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+            values = np.array(values, dtype=np.int64)
+        else:
+            values = np.array([str(value).encode('utf-8') for value in values], dtype=bytes)
+        columns[f'{key}.codes'] = codes
+        columns[f'{key}.values'] = values
+    return columns
+
+
+class ChunkStore:
+    """
+    Read-only access to an index saved by VectorIndexer.save_index.
+    
+    Opening reads index_info.json and the chunk offsets only. Embeddings and chunk
+    texts are memory-mapped and metadata columns are decoded on first use, so even a
+    large index opens in milliseconds and a lookup touches only the chunks it reads.
+    """
+    
+    def __init__(self, index_dir):
+        """
+        Open a saved index.
+        
+        Args:
+            index_dir (str): Directory written by VectorIndexer.save_index
+        """
+        self.index_dir = Path(index_dir)
+        with open(self.index_dir / 'index_info.json') as f:
+            self.info = json.load(f)
+        self.format_version = self.info.get('format_version', 1)
+        
+        self._legacy_chunks = None
+        self._embeddings = None
+        self._columns = {}
+        
+        if self.format_version == 1:
+            # Earlier layout: everything is in one pickle
+            with open(self.index_dir / 'chunks.pkl', 'rb') as f:
+                self._legacy_chunks = pickle.load(f)
+            return
+        if self.format_version != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format version {self.format_version} in {self.index_dir}")
+        
+        self._offsets = np.load(self.index_dir / 'chunk_offsets.npy', mmap_mode='r')
+        with open(self.index_dir / 'chunk_texts.bin', 'rb') as f:
+            # mmap cannot map an empty file
+            self._texts = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self._offsets[-1] else b''
+        self._metadata = np.load(self.index_dir / 'chunk_metadata.npz')
+        self._keys = [name[:-len('.codes')] for name in self._metadata.files if name.endswith('.codes')]
+    
+    def __len__(self):
+        if self._legacy_chunks is not None:
+            return len(self._legacy_chunks)
+        return len(self._offsets) - 1
+    
+    @property
+    def embeddings(self):
+        """
+        The (num_vectors, vector_dim) embeddings, memory-mapped.
+        """
+        if self._embeddings is None:
+            self._embeddings = np.load(self.index_dir / 'embeddings.npy', mmap_mode='r')
+        return self._embeddings
+    
+    def text(self, i):
+        """
+        Text of chunk i.
+        """
+        if self._legacy_chunks is not None:
+            return self._legacy_chunks[i]['text']
+        return self._texts[self._offsets[i]:self._offsets[i + 1]].decode('utf-8')
+    
+    def _column(self, key):
+        if key not in self._columns:
+            self._columns[key] = (self._metadata[f'{key}.codes'], self._metadata[f'{key}.values'])
+        return self._columns[key]
+    
+    def values(self, key):
+        """
+        The value of one metadata field for every chunk, None where a chunk lacks it.
+        """
+        if self._legacy_chunks is not None:
+            return [chunk.get(key) for chunk in self._legacy_chunks]
+        if key not in self._keys:
+            return [None] * len(self)
+        codes, values = self._column(key)
+        decoded = [value.decode('utf-8') if isinstance(value, bytes) else value for value in values.tolist()]
+        return [decoded[code] if code >= 0 else None for code in codes.tolist()]
+    
+    def metadata(self, i):
+        """
+        Metadata dictionary of chunk i (every chunk field except the text).
+        """
+        if self._legacy_chunks is not None:
+            return {k: v for k, v in self._legacy_chunks[i].items() if k != 'text'}
+        entry = {}
+        for key in self._keys:
+            codes, values = self._column(key)
+            if codes[i] >= 0:
+                value = values[codes[i]].item()
+                entry[key] = value.decode('utf-8') if isinstance(value, bytes) else value
+        return entry
+    
+    def __getitem__(self, i):
+        """
+        Chunk i as the dictionary VectorIndexer.add_chunks received.
+        """
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"Chunk {i} out of range")
+        return {'text': self.text(i), **self.metadata(i)}
+    
+    def read_faiss_index(self, use_mmap=False):
+        """
+        Load the saved FAISS index.
+        
+        Args:
+            use_mmap (bool): Memory-map the index file instead of reading it, for the
+                index types FAISS supports it for
+        """
+        flags = faiss.IO_FLAG_MMAP if use_mmap else 0
+        return faiss.read_index(str(self.index_dir / 'faiss_index.bin'), flags)
+
+
 if __name__ == "__main__":
     # Set the inventory file path
     INVENTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "file_inventory.csv")
@@ -400,13 +991,14 @@ if __name__ == "__main__":
     
     # Load inventory
     logger.info(f"Loading inventory from {INVENTORY_FILE}")
-    inventory_df = pd.read_csv(INVENTORY_FILE)
+    inventory_df = read_inventory(INVENTORY_FILE)
     
     # Create the vector indexer
     indexer = VectorIndexer(output_dir=OUTPUT_DIR)
     
-    # Process and index files
-    updated_inventory = indexer.process_and_index_files(inventory_df, UPLOADS_DIR)
+    # Process the files that changed since the saved index was built ('--full' rebuilds it)
+    updated_inventory = indexer.process_and_index_files(inventory_df, UPLOADS_DIR,
+                                                        incremental='--full' not in sys.argv[1:])
     
     # Save updated inventory
     updated_inventory.to_csv(INVENTORY_FILE, index=False)
@@ -418,7 +1010,7 @@ if __name__ == "__main__":
     
     print(f"\nVector Indexing Complete")
     print(f"=========================")
-    print(f"Files processed: {len(inventory_df[inventory_df['extracted_text']])}")
+    print(f"Files processed: {len(updated_inventory[updated_inventory['extracted_text']])}")
     print(f"Total chunks created: {total_chunks}")
     print(f"  - Text chunks: {text_chunks}")
     print(f"  - Table chunks: {table_chunks}")
@@ -15,6 +15,9 @@ Usage:
 import sys
 import logging
 import os
+import time
+import types
+import zlib
 import numpy as np
 from io import BytesIO
 from pathlib import Path
@@ -176,6 +179,85 @@ class MockHuggingfaceHub:
         os.makedirs(local_dir, exist_ok=True)
         return local_dir
 
+class MockPdfParser:
+    """Mock implementation of pdf_parser.RAGFlowPdfParser for indexing tests
+    
+    Files are read as UTF-8 text, so text files can stand in for PDFs. Each parse
+    waits parse_seconds to stand in for OCR and layout inference.
+    """
+    
+    parse_seconds = 0.0
+    
+    def __call__(self, fnm, need_image=True, zoomin=3, return_html=False):
+        """Mock call method that returns the file's text and one table"""
+        time.sleep(self.parse_seconds)
+        with open(fnm, encoding='utf-8', errors='ignore') as f:
+            text = f.read()
+        return text, [(None, ["Mock Table Row 1", "Mock Table Row 2"])]
+    
+    @staticmethod
+    def remove_tag(txt):
+        """Mock method that returns the text unchanged"""
+        return txt
+    
+    @staticmethod
+    def total_page_number(fnm, binary=None):
+        """Mock method that reports one page"""
+        return 1
+
+class MockSentenceTransformer:
+    """Mock implementation of sentence_transformers.SentenceTransformer
+    
+    Embeddings are deterministic unit vectors seeded from each text. encode waits
+    batch_seconds per batch plus text_seconds per text to stand in for inference.
+    """
+    
+    batch_seconds = 0.0
+    text_seconds = 0.0
+    dimension = 384
+    
+    def __init__(self, model_name_or_path=None, **kwargs):
+        logger.info(f"Initialized Mock SentenceTransformer: {model_name_or_path}")
+    
+    def get_sentence_embedding_dimension(self):
+        """Mock method that returns the embedding dimension"""
+        return self.dimension
+    
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, convert_to_numpy=True, **kwargs):
+        """Mock encode method that returns one unit vector per sentence"""
+        n_batches = -(-len(sentences) // batch_size)
+        time.sleep(n_batches * self.batch_seconds + len(sentences) * self.text_seconds)
+        embeddings = np.stack([
+            np.random.default_rng(zlib.crc32(s.encode('utf-8'))).standard_normal(self.dimension)
+            for s in sentences
+        ]).astype(np.float32) if sentences else np.zeros((0, self.dimension), dtype=np.float32)
+        return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+def patch_indexing_modules():
+    """
+    Patch the PDF parser and embedding model used by create_vector_index.py
+    with mock implementations when they cannot be imported.
+    Call patch_modules() first so the real parser gets a chance to import.
+    """
+    global _patched_modules
+    
+    if 'pdf_parser' not in sys.modules:
+        try:
+            import pdf_parser
+        except Exception as e:
+            logger.info(f"Using Mock PDF parser: {e}")
+            sys.modules['pdf_parser'] = types.SimpleNamespace(RAGFlowPdfParser=MockPdfParser)
+            _patched_modules['pdf_parser'] = True
+    
+    if 'sentence_transformers' not in sys.modules:
+        try:
+            import sentence_transformers
+        except ImportError:
+            logger.info("Using Mock SentenceTransformer")
+            sys.modules['sentence_transformers'] = types.SimpleNamespace(
+                SentenceTransformer=MockSentenceTransformer)
+            _patched_modules['sentence_transformers'] = True
+
 def patch_modules():
     """
     Patch necessary modules with mock implementations
@@ -6,10 +6,12 @@ This script tests the file inventory and vector indexing functionality by:
 1. Creating a sample directory structure with test files
 2. Running the file inventory creation
 3. Testing the vector indexing process
-4. Displaying results for verification
+4. Checking text splitting on prose, CJK and long unspaced text
+5. Refreshing the inventory and index incrementally in a temporary directory
+6. Displaying results for verification
 
 Usage:
-    python test_indexing.py [--component=all|inventory|vector]
+    python test_indexing.py [--component=all|inventory|vector|split|refresh]
 
 Options:
     --component: Specifies which component to test (default: all)
@@ -20,6 +22,7 @@ import sys
 import shutil
 import argparse
 import logging
+import tempfile
 from pathlib import Path
 import pandas as pd
 from datetime import datetime
@@ -233,10 +236,127 @@ def test_vector_indexing(inventory_df=None):
         traceback.print_exc()
         return False
 
+def test_text_splitting():
+    """Test that split_text keeps chunks within the token budget on text with and without spaces."""
+    logger.info("Testing text splitting")
+    
+    try:
+        sys.path.insert(0, str(current_dir))
+        # The splitter only needs the parser's remove_tag, so the mock parser will do
+        from mock_dependencies import patch_modules, patch_indexing_modules
+        patch_modules()
+        patch_indexing_modules()
+        from create_vector_index import ChunkExtractor
+        
+        extractor = ChunkExtractor()
+        min_chunk_size = 20
+        cases = {
+            'prose': ("The quick brown fox jumps over the lazy dog. " * 40 + "\n\n") * 10,
+            'cjk': "药物" * 1000,
+            'unspaced': "a1b2c3d4e5f6" * 400,
+            'cjk_with_spaces': ("药物临床试验" * 200 + " ") * 5,
+        }
+        
+        print("\n" + "="*50)
+        print("TEXT SPLITTING TEST RESULTS:")
+        print("="*50)
+        passed = True
+        for name, text in cases.items():
+            chunks = extractor.split_text(text, 'doc.pdf', min_chunk_size=min_chunk_size)
+            tokens = [len(extractor.token_offsets(chunk['text'])[0]) for chunk in chunks]
+            total_tokens = len(extractor.token_offsets(text)[0])
+            # Every chunk fits the model, no cut leaves a sliver, and chunks advance
+            # through the text by at least chunk_size - chunk_overlap tokens
+            ok = (bool(chunks)
+                  and max(tokens) <= extractor.chunk_size
+                  and min(tokens) >= min_chunk_size
+                  and len(chunks) <= total_tokens // (extractor.chunk_size - extractor.chunk_overlap) + 1)
+            passed = passed and ok
+            print(f"  {name:>16}: {len(chunks):4d} chunks, {min(tokens) if tokens else 0}-{max(tokens) if tokens else 0} "
+                  f"tokens of {total_tokens} | {'ok' if ok else 'FAILED'}")
+        return passed
+        
+    except Exception as e:
+        logger.error(f"Error testing text splitting: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+def test_incremental_refresh():
+    """Test that an incremental refresh retries failed files and clears the index once every file is gone."""
+    logger.info("Testing incremental refresh")
+    
+    work_dir = Path(tempfile.mkdtemp(prefix="refresh_test_"))
+    try:
+        sys.path.insert(0, str(current_dir))
+        from mock_dependencies import patch_modules, patch_indexing_modules
+        patch_modules()
+        patch_indexing_modules()
+        from create_file_inventory import FileInventoryCreator, read_inventory
+        from create_vector_index import VectorIndexer, ChunkStore
+        
+        uploads_dir = work_dir / "uploads"
+        index_dir = work_dir / "vector_index"
+        inventory_csv = work_dir / "inventory.csv"
+        uploads_dir.mkdir()
+        # Text files named .pdf stand in for PDFs with the mock parser
+        for i in range(3):
+            shutil.copy(current_dir / "test_data" / "sample_document.txt", uploads_dir / f"doc{i}.pdf")
+        
+        def refresh(before_indexing=None):
+            inventory_df = FileInventoryCreator(uploads_dir, inventory_csv).create_inventory(incremental=True)
+            if before_indexing:
+                before_indexing()
+            indexer = VectorIndexer(output_dir=index_dir)
+            inventory_df = indexer.process_and_index_files(inventory_df, uploads_dir, max_workers=1, incremental=True)
+            inventory_df.to_csv(inventory_csv, index=False)
+            chunks = len(ChunkStore(index_dir)) if (index_dir / "index_info.json").exists() else 0
+            return read_inventory(inventory_csv).set_index('file_path'), chunks
+        
+        checks = {}
+        inventory_df, full_chunks = refresh()
+        checks['first run indexes every file'] = bool(inventory_df['extracted_text'].all()) and full_chunks > 0
+        
+        inventory_df, chunks = refresh()
+        checks['unchanged files stay unchanged'] = (inventory_df['status'] == 'unchanged').all() and chunks == full_chunks
+        
+        # doc1 changes, then cannot be read when the indexer gets to it
+        with open(uploads_dir / "doc1.pdf", "a") as f:
+            f.write("\n\nAn added paragraph.")
+        moved = work_dir / "doc1.pdf"
+        inventory_df, _ = refresh(lambda: shutil.move(uploads_dir / "doc1.pdf", moved))
+        shutil.move(moved, uploads_dir / "doc1.pdf")
+        checks['failed file stays pending'] = (not inventory_df.loc['doc1.pdf', 'extracted_text']
+                                               and inventory_df.loc['doc1.pdf', 'status'] == 'changed')
+        
+        inventory_df, chunks = refresh()
+        checks['failed file is retried'] = bool(inventory_df.loc['doc1.pdf', 'extracted_text']) and chunks >= full_chunks
+        
+        for i in range(3):
+            (uploads_dir / f"doc{i}.pdf").unlink()
+        inventory_df, chunks = refresh()
+        checks['deleting every file clears the index'] = (len(inventory_df) == 0 and chunks == 0
+                                                          and not (index_dir / "embeddings.npy").exists())
+        
+        print("\n" + "="*50)
+        print("INCREMENTAL REFRESH TEST RESULTS:")
+        print("="*50)
+        for name, ok in checks.items():
+            print(f"  {name}: {'ok' if ok else 'FAILED'}")
+        return all(checks.values())
+        
+    except Exception as e:
+        logger.error(f"Error testing incremental refresh: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
 def parse_args():
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(description='Test file inventory and vector indexing')
-    parser.add_argument('--component', choices=['all', 'inventory', 'vector'], default='all',
+    parser.add_argument('--component', choices=['all', 'inventory', 'vector', 'split', 'refresh'], default='all',
                         help='Component to test (default: all)')
     return parser.parse_args()
 
@@ -269,6 +389,20 @@ if __name__ == "__main__":
         else:
             print("\nVector Indexing Test: FAILED")
     
+    if args.component in ['all', 'split']:
+        print("\nTesting Text Splitting...")
+        if test_text_splitting():
+            print("\nText Splitting Test: SUCCESS")
+        else:
+            print("\nText Splitting Test: FAILED")
+    
+    if args.component in ['all', 'refresh']:
+        print("\nTesting Incremental Refresh...")
+        if test_incremental_refresh():
+            print("\nIncremental Refresh Test: SUCCESS")
+        else:
+            print("\nIncremental Refresh Test: FAILED")
+    
     print("\nTesting completed.")
     print("\nTroubleshooting tips:")
     print("1. Ensure all required packages are installed:")